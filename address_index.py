@@ -0,0 +1,122 @@
+from typing import Dict, Iterable, NamedTuple, Optional, Tuple
+
+from grid import BLOCK_SIZE, Grid
+
+STREET = "street"  # east-west roads, their blocks are under horizontals/
+AVENUE = "avenue"  # north-south roads, their blocks are under verticals/
+
+
+class Address(NamedTuple):
+    number: int
+    road: str
+    name: str = ""  # what follows " - ", e.g. "the library"
+
+
+class Block(NamedTuple):
+    axis: str   # STREET or AVENUE
+    road: int   # index of the street or avenue
+    index: int  # index of the block along it
+    low: int
+    high: int
+
+
+def parse_address(address: str) -> Optional[Address]:
+    """
+    "2222 Oak St - the observatory" -> Address(2222, "Oak St", "the observatory"),
+    or None if it doesn't start with a number.
+    """
+    main_part, _, name = address.partition(" - ")
+    number, _, road = main_part.strip().partition(" ")
+    try:
+        return Address(int(number), road.strip(), name.strip())
+    except ValueError:
+        return None
+
+
+class AddressIndex:
+    """
+    Every address lookup of a city grid, each worked out once: address strings are
+    parsed once, road names map to their axis and index through a dict, and blocks
+    come straight from the grid's arithmetic (every block spans the same
+    BLOCK_SIZE numbers, so there is no range list to search). Shared by the map, the
+    location builder and routing.
+    """
+
+    def __init__(self, grid: Grid):
+        self.grid = grid
+        self.addresses: Dict[str, Optional[Address]] = {}
+        self.roads: Dict[str, Optional[Tuple[str, int]]] = {}
+
+    def parse(self, address: str) -> Optional[Address]:
+        if address not in self.addresses:
+            self.addresses[address] = parse_address(address)
+        return self.addresses[address]
+
+    def road(self, name: str) -> Optional[Tuple[str, int]]:
+        """(STREET or AVENUE, index) of a road name, or None if the grid has no such road."""
+        if name not in self.roads:
+            street = self.grid.street_index(name)
+            avenue = self.grid.avenue_index(name) if street is None else None
+            self.roads[name] = (STREET, street) if street is not None else (AVENUE, avenue) if avenue is not None else None
+        return self.roads[name]
+
+    def block(self, address: str) -> Optional[Block]:
+        """The block an address is on, or None if it is off the grid."""
+        parsed = self.parse(address)
+        road = self.road(parsed.road) if parsed else None
+        if road is None:
+            return None
+        axis, road_index = road
+        index, low, high = (self.grid.street_block if axis == STREET else self.grid.avenue_block)(parsed.number)
+        return None if index is None else Block(axis, road_index, index, low, high)
+
+    def block_location(self, address: str) -> Optional[str]:
+        """The block directory of an address, relative to the map contents, e.g. "horizontals/Oak St blocks/2200-2299 Oak St"."""
+        block = self.block(address)
+        if block is None:
+            return None
+        road = self.parse(address).road
+        folder = "horizontals" if block.axis == STREET else "verticals"
+        return f"{folder}/{road} blocks/{block.low}-{block.high} {road}"
+
+    def location_block(self, location: dict) -> Optional[str]:
+        """A location's block_location, worked out from its address when it doesn't say."""
+        return location.get("block_location") or self.block_location(location["address"])
+
+    def point(self, address: str) -> Optional[Tuple[float, float, str]]:
+        """(x, y, axis) of one address on the map, worked out like coordinates() but without NumPy, or None off the grid."""
+        block = self.block(address)
+        if block is None:
+            return None
+        along = max(block.index - 1, 0) + (self.parse(address).number - block.low) / (BLOCK_SIZE - 1)
+        return (along, block.road, STREET) if block.axis == STREET else (block.road, along, AVENUE)
+
+    def coordinates(self, addresses: Iterable[str]):
+        """
+        Map coordinates of many addresses in one NumPy pass: x counts avenues and y
+        counts streets, with every address placed along its block. Returns the (n, 2)
+        coordinates and the axis of each address (STREET, AVENUE, or "" for addresses
+        off the grid, whose coordinates are NaN).
+        """
+        import numpy as np  # only the map needs arrays
+
+        parsed = [self.parse(address) for address in addresses]
+        roads = [self.road(address.road) if address else None for address in parsed]
+        axes = np.array([road[0] if road else "" for road in roads], dtype=object)
+        road_index = np.array([road[1] if road else -1 for road in roads], dtype=float)
+        numbers = np.array([address.number if road else 0 for address, road in zip(parsed, roads)], dtype=float)
+
+        grid = self.grid
+        streets, avenues = axes == STREET, axes == AVENUE
+        first = np.where(streets, grid.first_street_number, grid.first_avenue_number)
+        blocks = np.where(streets, grid.width, grid.height)
+        block = (numbers - first) // BLOCK_SIZE
+        valid = (streets | avenues) & (numbers >= first) & (block < blocks)
+        # A block like "2000-2099" (index 4) is drawn between roads 3 and 4, the first block up to road 0
+        along = np.where(block > 0, block - 1, block) + (numbers - (first + block * BLOCK_SIZE)) / (BLOCK_SIZE - 1)
+        xy = np.full((len(parsed), 2), np.nan)
+        xy[:, 0] = np.where(streets, along, road_index)
+        xy[:, 1] = np.where(streets, road_index, along)
+        xy[~valid] = np.nan
+        axes[~valid] = ""
+        return xy, axes
@@ -0,0 +1,202 @@
+import io
+import json
+import posixpath
+import stat
+import sys
+import time
+from typing import TYPE_CHECKING, BinaryIO, Iterable, Iterator, Optional
+
+from build_plan import Operation, MKDIR, FILE, SYMLINK, relative_target
+
+if TYPE_CHECKING:
+    import tarfile  # both imported where an archive is read or written, every other command only needs FORMATS
+    import zipfile
+
+IMPORTED = "imported"  # phase given to operations read back from an archive
+FORMATS = {"tar": "w|", "tar.gz": "w|gz", "tgz": "w|gz", "zip": None}
+SEED_HEADER = "folder_city.seed"  # pax global header of a tar, key of the JSON comment of a zip
+
+
+def archive_format(path: str, fmt: str = None) -> str:
+    """Pick the archive format from an explicit choice or the file extension (tar for stdout)."""
+    if fmt:
+        return fmt
+    for extension in ("tar.gz", "tgz", "zip", "tar"):
+        if path.endswith("." + extension):
+            return extension
+    return "tar"
+
+
+def open_output(path: str) -> BinaryIO:
+    return sys.stdout.buffer if path == "-" else open(path, "wb")
+
+
+def open_input(path: str) -> BinaryIO:
+    return sys.stdin.buffer if path == "-" else open(path, "rb")
+
+
+def export_archive(operations: Iterable[Operation], path: str, fmt: str = None, seed: int = None) -> int:
+    """
+    Write planned operations as a tar or zip archive to a file, or to stdout for "-".
+    Tar output is fully streamed, so memory stays constant however big the city is;
+    zip has to keep a small central-directory record per entry until the end.
+    The seed the city was planned with goes along, so an import rebuilds the same
+    city. Returns the number of entries written.
+    """
+    fmt = archive_format(path, fmt)
+    output = open_output(path)
+    try:
+        if fmt == "zip":
+            return _export_zip(operations, output, seed)
+        return _export_tar(operations, output, FORMATS[fmt], seed)
+    finally:
+        if output is not sys.stdout.buffer:
+            output.close()
+        else:
+            output.flush()
+
+
+def _export_tar(operations: Iterable[Operation], output: BinaryIO, mode: str, seed: int = None) -> int:
+    import tarfile
+    count = 0
+    now = time.time()
+    headers = {SEED_HEADER: str(seed)} if seed is not None else {}
+    with tarfile.open(fileobj=output, mode=mode, format=tarfile.PAX_FORMAT, pax_headers=headers) as tar:
+        for op in operations:
+            info = tarfile.TarInfo(op.path)
+            info.mtime = now
+            data = None
+            if op.kind == MKDIR:
+                info.type = tarfile.DIRTYPE
+                info.mode = 0o755
+            elif op.kind == SYMLINK:
+                info.type = tarfile.SYMTYPE
+                info.mode = 0o777
+                info.linkname = relative_target(op)
+            else:
+                data = op.contents.encode("utf-8")
+                info.size = len(data)
+                info.mode = 0o644
+            tar.addfile(info, io.BytesIO(data) if data else None)
+            tar.members.clear()  # TarFile remembers every member it wrote, which we never need
+            count += 1
+    return count
+
+
+def _export_zip(operations: Iterable[Operation], output: BinaryIO, seed: int = None) -> int:
+    import zipfile
+    count = 0
+    date_time = time.localtime()[:6]
+    with zipfile.ZipFile(output, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        if seed is not None:
+            archive.comment = json.dumps({SEED_HEADER: seed}).encode("utf-8")
+        for op in operations:
+            if op.kind == MKDIR:
+                info = zipfile.ZipInfo(op.path + "/", date_time)
+                info.external_attr = (stat.S_IFDIR | 0o755) << 16 | 0x10
+                data = b""
+            elif op.kind == SYMLINK:
+                info = zipfile.ZipInfo(op.path, date_time)
+                info.external_attr = (stat.S_IFLNK | 0o777) << 16
+                data = relative_target(op).encode("utf-8")
+            else:
+                info = zipfile.ZipInfo(op.path, date_time)
+                info.external_attr = (stat.S_IFREG | 0o644) << 16
+                info.compress_type = zipfile.ZIP_DEFLATED
+                data = op.contents.encode("utf-8")
+            info.create_system = 3  # unix, so the mode bits above are honoured
+            archive.writestr(info, data)
+            count += 1
+    return count
+
+
+class ArchiveReader:
+    """
+    An archive made by export_archive, opened for reading: the seed it was planned
+    with (None for archives from before it was kept) is known as soon as it's
+    open, then operations() reads it back, streaming.
+    """
+
+    def __init__(self, path: str, fmt: str = None):
+        self.format = archive_format(path, fmt)
+        self.source = open_input(path)
+        self.seed: Optional[int] = None
+        try:
+            if self.format == "zip":
+                import zipfile
+                if not self.source.seekable():
+                    self.source = io.BytesIO(self.source.read())  # zip keeps its index at the end, so stdin has to be read first
+                self.archive = zipfile.ZipFile(self.source)
+                try:
+                    self.seed = json.loads(self.archive.comment.decode("utf-8")).get(SEED_HEADER)
+                except (ValueError, AttributeError):
+                    pass
+            else:
+                # Opening a stream reads the first member, so the global pax header is in by now
+                import tarfile
+                self.archive = tarfile.open(fileobj=self.source, mode="r|*")
+                seed = self.archive.pax_headers.get(SEED_HEADER)
+                self.seed = int(seed) if seed is not None else None
+        except BaseException:
+            self.close()
+            raise
+
+    def operations(self) -> Iterator[Operation]:
+        """
+        The archive as operations, so they can be applied in batches by the
+        materializer. Symlink targets are resolved back to paths relative to the
+        base path; unsafe member names are refused.
+        """
+        if self.format == "zip":
+            return _zip_operations(self.archive)
+        return _tar_operations(self.archive)
+
+    def close(self):
+        if getattr(self, "archive", None) is not None:
+            self.archive.close()
+        if self.source is not sys.stdin.buffer:
+            self.source.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def _checked(name: str) -> str:
+    name = name.rstrip("/")
+    normalized = posixpath.normpath(name)
+    if posixpath.isabs(normalized) or normalized == ".." or normalized.startswith("../"):
+        raise ValueError(f"refusing to unpack {name!r} outside the city")
+    return normalized
+
+
+def _link_operation(path: str, linkname: str) -> Operation:
+    target = posixpath.normpath(posixpath.join(posixpath.dirname(path), linkname))
+    return Operation(IMPORTED, SYMLINK, path, _checked(target))
+
+
+def _tar_operations(tar: "tarfile.TarFile") -> Iterator[Operation]:
+    for member in tar:
+        path = _checked(member.name)
+        if member.isdir():
+            yield Operation(IMPORTED, MKDIR, path)
+        elif member.issym():
+            yield _link_operation(path, member.linkname)
+        elif member.isfile():
+            contents = tar.extractfile(member).read().decode("utf-8")
+            yield Operation(IMPORTED, FILE, path, contents=contents)
+        tar.members.clear()
+
+
+def _zip_operations(archive: "zipfile.ZipFile") -> Iterator[Operation]:
+    for info in archive.infolist():
+        path = _checked(info.filename)
+        mode = info.external_attr >> 16
+        if info.is_dir():
+            yield Operation(IMPORTED, MKDIR, path)
+        elif stat.S_ISLNK(mode):
+            yield _link_operation(path, archive.read(info).decode("utf-8"))
+        else:
+            yield Operation(IMPORTED, FILE, path, contents=archive.read(info).decode("utf-8"))
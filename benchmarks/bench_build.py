@@ -0,0 +1,192 @@
+"""
+Builds whole cities into temporary directories on tmpfs and times every build
+phase, with its filesystem ops, syscalls and peak memory, for a few grid sizes and
+location densities. The results are compared against a stored baseline, and the
+run fails when a phase got more than --threshold percent slower (or made that many
+more syscalls).
+
+    python benchmarks/bench_build.py                         # every size, against benchmarks/baseline.json
+    python benchmarks/bench_build.py --sizes 7x7,50x50 --output results.json
+    python benchmarks/bench_build.py --save-baseline         # after a change that is meant to cost more
+
+Syscalls are the filesystem calls of the build process counted by
+instrumentation.count_syscalls, not everything the kernel sees.
+"""
+import argparse
+import glob
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+REPO = os.path.dirname(BENCHMARKS)
+sys.path.insert(0, REPO)
+
+from folder_city import make_grid
+from grid import BLOCK_SIZE, Grid
+
+SIZES = ["7x7", "50x50", "300x300"]
+DENSITIES = {"stock": 0.0, "dense": 0.05}  # made-up locations per street block, on top of LOCATIONS
+BASELINE = os.path.join(BENCHMARKS, "baseline.json")
+THRESHOLD = 25.0   # percent slower than the baseline that fails the run
+NOISE_FLOOR = 0.1  # seconds; phases quicker than this in the baseline are too noisy to compare on time
+SEED = 1
+TMPFS = "/dev/shm"
+
+# Runs in the build's own process, on its copy of the code: count its syscalls and add the
+# made-up locations, then build as usual
+BOOTSTRAP = """
+import json, runpy, sys
+sys.path.insert(0, ".")
+import instrumentation
+instrumentation.count_syscalls()
+from locations import LOCATIONS
+with open("bench_locations.json", encoding="utf-8") as f:
+    LOCATIONS.extend(json.load(f))
+sys.argv = ["folder_city.py"] + {args!r}
+runpy.run_path("folder_city.py", run_name="__main__")
+"""
+
+
+def synthetic_locations(grid: Grid, count: int):
+    """count made-up locations, spread evenly over the street blocks of the grid."""
+    blocks = grid.width * grid.height
+    step = max(1, blocks // count) if count else 1
+    for k in range(count):
+        block = k * step % blocks
+        street, index = grid.street_name(block // grid.width), block % grid.width
+        number = grid.first_street_number + index * BLOCK_SIZE + k % BLOCK_SIZE
+        name = f"lot {k}"
+        yield {
+            "name": name,
+            "address": f"{number} {street} - {name}",
+            "exit_name": "front door",
+            "marker": f"[ {name} ]",
+            "objects": [{"path": "mailbox/letter", "max": 3, "chance": 0.5}],
+        }
+
+
+def scratch_root() -> str:
+    """tmpfs when there is one, so the disk doesn't decide the numbers."""
+    return TMPFS if os.path.isdir(TMPFS) and os.access(TMPFS, os.W_OK) else tempfile.gettempdir()
+
+
+def build(size: str, density: float, scratch: str) -> dict:
+    """Build one city from scratch in a copy of the code under scratch and return its phases."""
+    width, height = map(int, size.split("x"))
+    count = round(density * width * height)
+    city = tempfile.mkdtemp(prefix="folder-city-bench-", dir=scratch)
+    try:
+        for path in glob.glob(os.path.join(REPO, "*.py")):
+            shutil.copy(path, city)
+        with open(os.path.join(city, "bench_locations.json"), "w", encoding="utf-8") as f:
+            json.dump(list(synthetic_locations(make_grid(width, height), count)), f)
+        stats = os.path.join(city, "stats.json")
+        args = ["--width", str(width), "--height", str(height), "--seed", str(SEED), "--stats", stats]
+        code = BOOTSTRAP.format(args=args)
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", code], cwd=city, check=True,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        seconds = time.perf_counter() - start
+        with open(stats, encoding="utf-8") as f:
+            measured = json.load(f)
+    finally:
+        shutil.rmtree(city, ignore_errors=True)
+    return {
+        "locations": count,
+        "seconds": round(seconds, 3),
+        "peak_rss": measured["peak_rss"],
+        "phases": {
+            phase["name"]: {
+                "seconds": phase["seconds"],
+                "ops": sum(phase["ops"].values()),
+                "syscalls": phase["syscalls"],
+                "peak_rss": phase["peak_rss"],
+            }
+            for phase in measured["phases"]
+        },
+    }
+
+
+def best(runs: list) -> dict:
+    """The quickest time of every phase over repeated runs (the rest is the same every run)."""
+    result = runs[0]
+    for run in runs[1:]:
+        result["seconds"] = min(result["seconds"], run["seconds"])
+        for name, phase in run["phases"].items():
+            result["phases"][name]["seconds"] = min(result["phases"][name]["seconds"], phase["seconds"])
+    return result
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list:
+    """Print every phase against the baseline and return the ones that regressed."""
+    regressions = []
+    print(f"{'case':<18} {'phase':<26} {'baseline':>9} {'now':>9} {'change':>8} {'syscalls':>19}")
+    for case, result in results.items():
+        base = baseline.get(case)
+        if base is None:
+            print(f"{case:<18} (not in the baseline)")
+            continue
+        for name, phase in result["phases"].items():
+            before = base["phases"].get(name)
+            if before is None:
+                continue
+            change = (phase["seconds"] / before["seconds"] - 1) * 100 if before["seconds"] else 0.0
+            slower = before["seconds"] >= NOISE_FLOOR and change > threshold
+            calls_before, calls = before.get("syscalls"), phase.get("syscalls")
+            more_calls = bool(calls_before and calls and (calls / calls_before - 1) * 100 > threshold)
+            flag = "  SLOWER" if slower else "  MORE SYSCALLS" if more_calls else ""
+            print(f"{case:<18} {name:<26} {before['seconds']:>8.2f}s {phase['seconds']:>8.2f}s {change:>+7.0f}% "
+                  f"{calls_before or 0:>9,} {calls or 0:>9,}{flag}")
+            if slower or more_calls:
+                regressions.append((case, name))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark every build phase against a baseline.")
+    parser.add_argument("--sizes", default=",".join(SIZES), help=f"grid sizes to build (default: {','.join(SIZES)})")
+    parser.add_argument("--densities", default=",".join(DENSITIES), help=f"location densities (default: {','.join(DENSITIES)})")
+    parser.add_argument("--repeat", type=int, default=1, help="builds per case, the quickest counts (default: 1)")
+    parser.add_argument("--scratch", default=scratch_root(), help="where to build, e.g. when tmpfs has too few inodes for the big cities (default: %(default)s)")
+    parser.add_argument("--output", metavar="FILE", help="write the results as JSON")
+    parser.add_argument("--baseline", default=BASELINE, help="results to compare against (default: benchmarks/baseline.json)")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD, help=f"percent slower that fails the run (default: {THRESHOLD:.0f})")
+    parser.add_argument("--save-baseline", action="store_true", help="store the results as the new baseline instead of comparing")
+    args = parser.parse_args()
+
+    results = {}
+    for size in args.sizes.split(","):
+        for density in args.densities.split(","):
+            case = f"{size}/{density}"
+            print(f"building {case}...", file=sys.stderr)
+            results[case] = best([build(size, DENSITIES[density], args.scratch) for _ in range(args.repeat)])
+
+    report = {"python": platform.python_version(), "platform": platform.platform(), "results": results}
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"saved {len(results)} cases as the baseline in {args.baseline}")
+        return
+
+    try:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+    except OSError:
+        sys.exit(f"no baseline at {args.baseline}, make one with --save-baseline")
+    regressions = compare(results, baseline, args.threshold)
+    if regressions:
+        sys.exit(f"{len(regressions)} phases regressed by more than {args.threshold:.0f}%")
+    print("no regressions")
+
+
+if __name__ == "__main__":
+    main()
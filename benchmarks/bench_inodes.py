@@ -0,0 +1,106 @@
+"""
+What --share-inodes saves: builds the same cities with and without it into
+temporary folders and compares the build time and the inodes the filesystem had
+to give them (what `df -i` counts, from statvfs before and after the build). Every
+city has the stock locations and a catalog of made-up supply stores, one every
+--every street blocks, each with 250 paperclips.
+
+    python benchmarks/bench_inodes.py [--sizes 50x50,100x100] [--every 10] [--repeat 3] [--scratch DIR]
+
+The inode counts are of the whole filesystem, so run it where nothing else is
+making files at the same time. Build on a disk filesystem (the default, the temp
+folder): tmpfs charges every hard link against its inode limit, so df -i doesn't
+go down there.
+"""
+import argparse
+import glob
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+REPO = os.path.dirname(BENCHMARKS)
+sys.path.insert(0, REPO)
+
+from folder_city import make_grid
+from grid import BLOCK_SIZE
+
+SIZES = ["50x50", "100x100"]
+SEED = 1
+EVERY = 10  # street blocks per supply store
+PAPERCLIPS = 250
+REPEAT = 3  # builds of each city in each mode, taking turns; the quickest counts
+MODES = {"own inodes": [], "shared inodes": ["--share-inodes"]}
+
+
+def inodes_used(path: str) -> int:
+    """Inodes in use on the filesystem of path, the IUsed column of df -i."""
+    stat = os.statvfs(path)
+    return stat.f_files - stat.f_ffree
+
+
+def supply_stores(width: int, height: int, every: int):
+    """A made-up supply store on every every-th street block, in the catalog format."""
+    grid = make_grid(width, height)
+    for k, block in enumerate(range(0, width * height, every)):
+        street, index = grid.street_name(block // width), block % width
+        name = f"supply store {k}"
+        yield {
+            "name": name,
+            "address": f"{grid.first_street_number + index * BLOCK_SIZE + 1} {street} - {name}",
+            "exit_name": "front door",
+            "marker": f"[ {name} ]",
+            "objects": [{"path": "shelf/paperclip", "max": PAPERCLIPS}, {"path": "counter/receipt", "max": 20, "chance": 0.5}],
+        }
+
+
+def build(size: str, flags: list, scratch: str, every: int) -> dict:
+    """Build one city from scratch in a copy of the code under scratch and return its time and inodes."""
+    width, height = map(int, size.split("x"))
+    city = tempfile.mkdtemp(prefix="folder-city-inodes-", dir=scratch)
+    try:
+        for path in glob.glob(os.path.join(REPO, "*.py")):
+            shutil.copy(path, city)
+        with open(os.path.join(city, "stores.jsonl"), "w", encoding="utf-8") as f:
+            for store in supply_stores(width, height, every):
+                f.write(json.dumps(store) + "\n")
+        args = ["--width", str(width), "--height", str(height), "--seed", str(SEED), "--map", "text", "--catalog", "stores.jsonl"] + flags
+        os.sync()  # so the writeback of the last city's removal isn't timed with this one
+        before = inodes_used(city)
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "folder_city.py"] + args, cwd=city, check=True,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        seconds = time.perf_counter() - start
+        return {"seconds": seconds, "inodes": inodes_used(city) - before}
+    finally:
+        shutil.rmtree(city, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default=",".join(SIZES), help=f"grids to build (default: {','.join(SIZES)})")
+    parser.add_argument("--every", type=int, default=EVERY, help=f"street blocks per supply store (default: {EVERY})")
+    parser.add_argument("--repeat", type=int, default=REPEAT, help=f"builds of each city in each mode, the quickest counts (default: {REPEAT})")
+    parser.add_argument("--scratch", help="where to build the cities (default: the temp folder)")
+    args = parser.parse_args()
+    print(f"{'grid':<10} {'mode':<14} {'time':>8} {'inodes':>10}")
+    for size in args.sizes.split(","):
+        results = {}
+        for _ in range(args.repeat):
+            for mode, flags in MODES.items():
+                result = build(size, flags, args.scratch, args.every)
+                if mode not in results or result["seconds"] < results[mode]["seconds"]:
+                    results[mode] = result
+        for mode, result in results.items():
+            print(f"{size:<10} {mode:<14} {result['seconds']:>7.2f}s {result['inodes']:>10,}")
+        own, shared = results["own inodes"], results["shared inodes"]
+        print(f"{size:<10} {'saved':<14} {own['seconds'] - shared['seconds']:>7.2f}s {own['inodes'] - shared['inodes']:>10,}"
+              f"  ({(1 - shared['inodes'] / own['inodes']) * 100 if own['inodes'] else 0:.0f}% fewer inodes)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+How many changes a tick of the living city can make: 1000 buildings, each with 100
+stock candidates that are sold or restocked every tick and 100 dishes that move
+between a cabinet and the sink half the time, so about 150,000 updates a tick.
+
+    python benchmarks/bench_simulation.py [--scratch DIR] [--ticks N]
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from materializer import DEFAULT_THREADS
+from simulation import Simulation
+
+BUILDINGS = 1000
+STOCK = 100   # per building, every one changes every tick
+DISHES = 100  # per building, each moves half the time
+
+
+def living_buildings(base_path: str, threads: int) -> Simulation:
+    os.makedirs(os.path.join(base_path, "map contents"))
+    simulation = Simulation(base_path, os.path.join(base_path, "map contents"), seed=1, threads=threads)
+    for b in range(BUILDINGS):
+        simulation.add_objects(f"building {b}", [{"path": "shelf/jar", "min": 1, "max": STOCK, "appear": 1.0, "disappear": 1.0}])
+        for n in range(1, DISHES + 1):
+            simulation.add(f"dish_{n:03}", f"building {b}/cabinet", f"building {b}/sink", appear=0.5, disappear=0.5)
+    for folder in simulation.folders:
+        os.makedirs(os.path.join(base_path, folder), exist_ok=True)
+    for b in range(BUILDINGS):
+        for n in range(1, DISHES + 1):
+            open(os.path.join(base_path, f"building {b}/cabinet/dish_{n:03}"), "w").close()
+    return simulation
+
+
+async def run(simulation: Simulation, ticks: int, threads: int):
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        for _ in range(ticks):
+            tick = await simulation.advance(pool)
+            updates = tick.moved + tick.made + tick.removed
+            print(f"tick {tick.number}: {updates:,} updates ({tick.moved:,} moved, {tick.made:,} made, {tick.removed:,} removed) "
+                  f"in {tick.seconds:.2f}s, {updates / tick.seconds:,.0f}/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scratch", help="where to make the buildings (default: tmpfs when there is one)")
+    parser.add_argument("--ticks", type=int, default=4)
+    parser.add_argument("--threads", type=int, default=DEFAULT_THREADS)
+    args = parser.parse_args()
+    scratch = args.scratch or ("/dev/shm" if os.path.isdir("/dev/shm") else None)
+    base_path = tempfile.mkdtemp(prefix="bench-simulation-", dir=scratch)
+    try:
+        simulation = living_buildings(base_path, args.threads)
+        start = time.perf_counter()
+        simulation.load()
+        print(f"{len(simulation):,} entities in {len(simulation.folders):,} folders, found in {time.perf_counter() - start:.2f}s")
+        asyncio.run(run(simulation, args.ticks, args.threads))
+    finally:
+        shutil.rmtree(base_path, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,391 @@
+import hashlib
+import posixpath
+import threading
+from collections import OrderedDict
+from itertools import repeat
+from typing import TYPE_CHECKING, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple, Union
+
+from city_model import CityModel
+from grid import Grid
+
+if TYPE_CHECKING:
+    import numpy as np  # imported where objects are drawn, so planning the roads doesn't load it
+
+# Operation kinds
+MKDIR = "mkdir"
+FILE = "file"
+SYMLINK = "symlink"
+
+# Build phases, in the order they are applied
+STREETS_AND_AVENUES = "streets and avenues"
+NAVIGATION = "navigation"
+WELCOME_CENTER = "welcome center"
+LOCATIONS_PHASE = "locations"
+PHASES = [STREETS_AND_AVENUES, NAVIGATION, WELCOME_CENTER, LOCATIONS_PHASE]
+# Phases whose generators yield every path once and plan directories before their contents
+GRID_PHASES = {STREETS_AND_AVENUES, NAVIGATION}
+
+WELCOME_CENTER_DIR = "the welcome center"
+
+# The welcome center's kitchen utensils and dishes: (name, first, last, clean location).
+# Dirty ones wait in the dishwasher instead.
+UTENSIL_TRAY = "kitchen/cabinet/drawer/utensil tray"
+KITCHEN_DISHES = [
+    ("fork", 12, 20, f"{UTENSIL_TRAY}/forks"),
+    ("spoon", 15, 25, f"{UTENSIL_TRAY}/spoons"),
+    ("knife", 7, 13, f"{UTENSIL_TRAY}/knives"),
+    ("cup", 15, 31, "kitchen/cabinet/top shelf"),
+    *((plate, i, i, "kitchen/cabinet/middle shelf") for i in range(1, 13) for plate in ("large_plate", "small_plate")),
+    ("bowl", 1, 8, "kitchen/cabinet/bottom shelf"),
+]
+DISHWASHER = "kitchen/dishwasher"
+
+
+class Operation(NamedTuple):
+    """A single filesystem operation. Paths are posix strings relative to the base path."""
+    phase: str
+    kind: str
+    path: str
+    target: str = ""    # what a symlink points to, also relative to the base path
+    contents: str = ""  # file contents
+
+
+def relative_target(op) -> str:
+    """
+    A symlink's target relative to the link's own directory (op is anything with a
+    path and a target, like an Operation), so links keep working wherever the city
+    is moved, copied or unpacked. Plan paths are already normalized, so this is
+    posixpath.relpath without its abspath calls, which matter for millions of links.
+    """
+    parent = op.path.split("/")[:-1]
+    target = op.target.split("/")
+    common = 0
+    for a, b in zip(parent, target):
+        if a != b:
+            break
+        common += 1
+    return "/".join([".."] * (len(parent) - common) + target[common:]) or "."
+
+
+def plan_streets_and_avenues(map_contents, grid: Grid, streets: range = None, avenues: range = None) -> Iterator[Operation]:
+    """
+    Yield the directories and marker files for every street block, avenue block and
+    intersection, once each. Given ranges of street and avenue indexes, only the
+    district they span: its intersections, the blocks of its streets west of its
+    avenues and the blocks of its avenues north of its streets.
+    """
+    phase = STREETS_AND_AVENUES
+    model = CityModel(map_contents, grid)
+    streets = range(grid.height) if streets is None else streets
+    avenues = range(grid.width) if avenues is None else avenues
+    for street in (model.streets[i] for i in streets):
+        street_path = f"{map_contents}/horizontals/{street} blocks"
+        if avenues.start == 0:
+            yield Operation(phase, MKDIR, street_path)
+        for st_number in (model.street_numbers[i] for i in avenues):
+            block_path = f"{street_path}/{st_number} {street}"
+            yield Operation(phase, MKDIR, block_path)
+            yield Operation(phase, FILE, f"{block_path}/[ {st_number} {street} ]")
+
+    for avenue in (model.avenues[i] for i in avenues):
+        avenue_path = f"{map_contents}/verticals/{avenue} blocks"
+        if streets.start == 0:
+            yield Operation(phase, MKDIR, avenue_path)
+        for av_number in (model.avenue_numbers[i] for i in streets):
+            av_block_path = f"{avenue_path}/{av_number} {avenue}"
+            yield Operation(phase, MKDIR, av_block_path)
+            yield Operation(phase, FILE, f"{av_block_path}/[ {av_number} {avenue} ]")
+
+    for street in (model.streets[i] for i in streets):
+        for avenue in (model.avenues[i] for i in avenues):
+            intersection_path = f"{map_contents}/intersections/{street} & {avenue}"
+            yield Operation(phase, MKDIR, intersection_path)
+            yield Operation(phase, FILE, f"{intersection_path}/[ {street} & {avenue} ]")
+
+
+def plan_navigation(map_contents, grid: Grid, streets: range = None, avenues: range = None) -> Iterator[Operation]:
+    """
+    Yield the symbolic links between blocks and intersections. Given ranges of street
+    and avenue indexes, only the links inside that district; the ones crossing into
+    the next district come from plan_district_borders.
+    """
+    model = CityModel(map_contents, grid)
+    streets = range(grid.height) if streets is None else streets
+    avenues = range(grid.width) if avenues is None else avenues
+    for street in (model.streets[i] for i in streets):
+        for index in avenues:
+            st_number = model.street_numbers[index]
+            yield from _east_links(map_contents, street, st_number, model.avenues[index])
+            if index > avenues.start:
+                yield from _west_links(map_contents, street, st_number, model.avenues[index - 1])
+
+    for avenue in (model.avenues[i] for i in avenues):
+        for index in streets:
+            av_number = model.avenue_numbers[index]
+            yield from _south_links(map_contents, avenue, av_number, model.streets[index])
+            if index > streets.start:
+                yield from _north_links(map_contents, avenue, av_number, model.streets[index - 1])
+
+
+def plan_district_borders(map_contents, grid: Grid, street_cuts: Iterable[int], avenue_cuts: Iterable[int]) -> Iterator[Operation]:
+    """
+    Yield the links plan_navigation leaves out when the grid is split into districts
+    at the given street and avenue indexes (the first index of every district but
+    the first): the ones from each block on a cut to the intersection before it.
+    """
+    for index in avenue_cuts:
+        for street in grid.street_names():
+            yield from _west_links(map_contents, street, grid.street_number(index), grid.avenue_name(index - 1))
+    for index in street_cuts:
+        for avenue in grid.avenue_names():
+            yield from _north_links(map_contents, avenue, grid.avenue_number(index), grid.street_name(index - 1))
+
+
+# The two links between a block and the intersection at one of its ends, one each way
+
+def _east_links(map_contents, street: str, st_number: str, east_avenue: str) -> Tuple[Operation, Operation]:
+    block = f"{map_contents}/horizontals/{street} blocks/{st_number} {street}"
+    east_intersection = f"{map_contents}/intersections/{street} & {east_avenue}"
+    return (Operation(NAVIGATION, SYMLINK, f"{east_intersection}/⏴ west to {st_number} {street}", block),
+            Operation(NAVIGATION, SYMLINK, f"{block}/⏵ east to {street} & {east_avenue}", east_intersection))
+
+
+def _west_links(map_contents, street: str, st_number: str, west_avenue: str) -> Tuple[Operation, Operation]:
+    block = f"{map_contents}/horizontals/{street} blocks/{st_number} {street}"
+    west_intersection = f"{map_contents}/intersections/{street} & {west_avenue}"
+    return (Operation(NAVIGATION, SYMLINK, f"{west_intersection}/⏵ east to {st_number} {street}", block),
+            Operation(NAVIGATION, SYMLINK, f"{block}/⏴ west to {street} & {west_avenue}", west_intersection))
+
+
+def _south_links(map_contents, avenue: str, av_number: str, south_street: str) -> Tuple[Operation, Operation]:
+    block = f"{map_contents}/verticals/{avenue} blocks/{av_number} {avenue}"
+    south_intersection = f"{map_contents}/intersections/{south_street} & {avenue}"
+    return (Operation(NAVIGATION, SYMLINK, f"{south_intersection}/⏶ north to {av_number} {avenue}", block),
+            Operation(NAVIGATION, SYMLINK, f"{block}/⏷ south to {south_street} & {avenue}", south_intersection))
+
+
+def _north_links(map_contents, avenue: str, av_number: str, north_street: str) -> Tuple[Operation, Operation]:
+    block = f"{map_contents}/verticals/{avenue} blocks/{av_number} {avenue}"
+    north_intersection = f"{map_contents}/intersections/{north_street} & {avenue}"
+    return (Operation(NAVIGATION, SYMLINK, f"{north_intersection}/⏷ south to {av_number} {avenue}", block),
+            Operation(NAVIGATION, SYMLINK, f"{block}/⏶ north to {north_street} & {avenue}", north_intersection))
+
+
+def object_rng(seed: Optional[int], stream: str) -> "np.random.Generator":
+    """
+    The random stream of one place in the city, from the city's seed and the place's
+    name. Every place gets its own stream, so adding or changing one location never
+    changes what the others contain. Without a seed the stream is fresh every time.
+    """
+    import numpy as np
+    if seed is None:
+        return np.random.default_rng()
+    key = int.from_bytes(hashlib.blake2b(stream.encode("utf-8"), digest_size=8).digest(), "little")
+    return np.random.default_rng([seed, key])
+
+
+def plan_objects(phase: str, base_path: str, objects: List[Dict[str, Union[str, int, float]]], seed: int = None) -> Iterator[Operation]:
+    """
+    Yield the files for a list of object specs (see folder_city.create_objects for the spec format).
+    Whether each candidate object exists is drawn for the whole list at once from base_path's stream.
+    """
+    import numpy as np
+    ranges = [(obj.get("min", 1), obj.get("max", obj.get("count", 1))) for obj in objects]
+    counts = [max(0, last - first + 1) for first, last in ranges]
+    chances = np.repeat([obj.get("chance", 1.0) for obj in objects], counts)
+    exists = np.flatnonzero(object_rng(seed, base_path).random(len(chances)) < chances).tolist()
+    ends = np.searchsorted(exists, np.cumsum(counts)).tolist()
+    start = offset = 0
+    for obj, (first, last), count, end in zip(objects, ranges, counts, ends):
+        path = f"{base_path}/{obj['path']}"
+        if last > 1:
+            # format as three-digit number if more than 1 item
+            shift = first - offset
+            paths = [f"{path}_{i + shift:03}" for i in exists[start:end]]
+        else:
+            paths = [path] * (end - start)
+        # The paths are made in one go and wrapped without a constructor call each, a
+        # dense spec spends most of its time here rather than on the draws
+        yield from map(Operation._make, zip(repeat(phase), repeat(FILE), paths, repeat(""), repeat(obj.get("contents", ""))))
+        start, offset = end, offset + count
+
+
+def plan_welcome_center(map_contents, seed: int = None) -> Iterator[Operation]:
+    """Yield the welcome center, its house contents and its links into the city."""
+    phase = WELCOME_CENTER
+    rng = object_rng(seed, WELCOME_CENTER_DIR)
+    welcome_center = WELCOME_CENTER_DIR
+    block_location = f"{map_contents}/horizontals/Juniper St blocks/1900-1999 Juniper St"
+    basement = f"{welcome_center}/basement"
+    home_folder = f"{basement}/unmarked box/flash drive/users/home"
+
+    yield Operation(phase, SYMLINK, f"{block_location}/1995 Juniper St - the welcome center", welcome_center)
+    yield Operation(phase, SYMLINK, f"{welcome_center}/front door", block_location)
+    yield Operation(phase, FILE, f"{welcome_center}/[ the welcome center ]")
+
+    # Home structure
+    for directory in ["movies", "music", "pictures", "public", "downloads", "applications/folder city"]:
+        yield Operation(phase, MKDIR, f"{home_folder}/{directory}")
+    yield Operation(phase, SYMLINK, f"{home_folder}/applications/folder city/the welcome center", welcome_center)
+
+    # Filing cabinet
+    for drawer in ["top drawer", "middle drawer", "bottom drawer"]:
+        yield Operation(phase, MKDIR, f"{basement}/filing cabinet/{drawer}")
+
+    # Paperclip box
+    paperclip_box = f"{basement}/unmarked box/box of paperclips"
+    yield Operation(phase, MKDIR, paperclip_box)
+    for i in range(1, 251):
+        yield Operation(phase, FILE, f"{paperclip_box}/paperclip {i}")
+
+    # Upstairs
+    for path in [
+        "upstairs/balcony",
+        "upstairs/bedroom/dresser/top drawer",
+        "upstairs/bedroom/dresser/middle drawer",
+        "upstairs/bedroom/dresser/bottom drawer",
+    ]:
+        yield Operation(phase, MKDIR, f"{welcome_center}/{path}")
+
+    # Individual items
+    for item in [
+        "upstairs/bedroom/bed",
+        "upstairs/washroom/toilet",
+        "upstairs/washroom/sink",
+        "upstairs/washroom/bathtub",
+        "kitchen/sink",
+        "kitchen/table",
+        "kitchen/stove/large pot/ladle",
+        "kitchen/stove/large pot/potato stew?",
+    ]:
+        yield Operation(phase, FILE, f"{welcome_center}/{item}")
+
+    # Kitchen utensils and dishes
+    clean_chance = 1
+    for shelf in ["top shelf", "middle shelf", "bottom shelf"]:
+        yield Operation(phase, MKDIR, f"{welcome_center}/kitchen/cabinet/{shelf}")
+    for name, first, last, shelf in KITCHEN_DISHES:
+        yield from plan_dishes(phase, name, first, last, shelf, clean_chance, rng)
+
+
+def plan_dishes(phase: str, name: str, first: int, last: int, clean_location: str, clean_chance: float,
+                rng: "np.random.Generator") -> Iterator[Operation]:
+    """Yield numbered dishes that are either put away clean or waiting in the dishwasher."""
+    clean = rng.random(max(0, last - first + 1)) < clean_chance
+    for i, is_clean in zip(range(first, last + 1), clean):
+        location = clean_location if is_clean else DISHWASHER
+        yield Operation(phase, FILE, f"{WELCOME_CENTER_DIR}/{location}/{dish_name(name, i)}")
+
+
+def dish_name(name: str, number: int) -> str:
+    """The file name of a numbered dish, e.g. fork_0012."""
+    prefix = "0" if number < 10 else ""
+    return f"{name}_00{prefix}{number}"
+
+
+def plan_locations(map_contents, LOCATIONS, addresses=None, seed: int = None) -> Iterator[Operation]:
+    """
+    Yield the buildings from the locations list, with their markers, exits and objects.
+    With an AddressIndex, locations may leave out block_location and have it worked out from their address.
+    Each building draws its objects from its own stream of the seed.
+    """
+    phase = LOCATIONS_PHASE
+    for location in LOCATIONS:
+        block_location = addresses.location_block(location) if addresses else location["block_location"]
+        if block_location is None:
+            continue  # an address this grid doesn't have
+        sidewalk = f"{map_contents}/{block_location}"
+        building = f"{sidewalk}/{location['address']}"
+        yield Operation(phase, FILE, f"{building}/{location['marker']}")
+        yield Operation(phase, SYMLINK, f"{building}/{location['exit_name']}", sidewalk)
+        yield from plan_objects(phase, building, location["objects"], seed)
+
+
+class RecentSet:
+    """A thread-safe set that forgets its least recently used entries beyond max_size (None for no limit)."""
+
+    def __init__(self, max_size: int = None):
+        self.max_size = max_size
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __contains__(self, item) -> bool:
+        if self.max_size is None:
+            return item in self._items
+        with self._lock:
+            if item not in self._items:
+                return False
+            self._items.move_to_end(item)  # recently used entries, like parent directories, stay
+            return True
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def add(self, item):
+        with self._lock:
+            self._items[item] = None
+            if self.max_size is not None and len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def discard(self, item):
+        with self._lock:
+            self._items.pop(item, None)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+
+class PlanCompiler:
+    """
+    Deduplicates and orders operations as they stream past.
+    The first operation for a path wins, and every missing parent directory gets
+    a mkdir right before the first operation that needs it. Grid phases are already
+    unique and ordered, so only their directories are checked for missing parents.
+    With max_seen set, only the most recently used paths are remembered, so memory
+    stays bounded on huge grids; an occasional repeat that slips through is skipped
+    by the materializer.
+    """
+
+    def __init__(self, max_seen: int = None):
+        self.seen = RecentSet(max_seen)
+
+    def compile(self, operations: Iterable[Operation]) -> Iterator[Operation]:
+        seen = self.seen
+        for op in operations:
+            if op.phase in GRID_PHASES:
+                if op.kind != MKDIR:
+                    seen.add(op.path)
+                    yield op
+                    continue
+            elif op.path in seen:
+                continue
+            missing = []
+            parent = posixpath.dirname(op.path)
+            while parent and parent not in seen:
+                missing.append(parent)
+                parent = posixpath.dirname(parent)
+            for directory in reversed(missing):
+                seen.add(directory)
+                yield Operation(op.phase, MKDIR, directory)
+            seen.add(op.path)
+            yield op
+
+
+def compile_plan(*phases: Iterable[Operation]) -> List[Operation]:
+    """Merge phase operations into one deduplicated, topologically ordered list."""
+    compiler = PlanCompiler()
+    return [op for operations in phases for op in compiler.compile(operations)]
+
+
+def phase_operations(plan: Iterable[Operation], phase: str) -> Iterator[Operation]:
+    """Yield the slice of a compiled plan that belongs to one phase."""
+    return (op for op in plan if op.phase == phase)
+
+
+def summarize_plan(plan: Iterable[Operation]) -> Dict[str, Dict[str, int]]:
+    """Count operations by phase and kind."""
+    summary = {phase: {MKDIR: 0, FILE: 0, SYMLINK: 0} for phase in PHASES}
+    for op in plan:
+        summary.setdefault(op.phase, {MKDIR: 0, FILE: 0, SYMLINK: 0})[op.kind] += 1
+    return summary
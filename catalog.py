@@ -0,0 +1,273 @@
+import hashlib
+import json
+import marshal
+import os
+import struct
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+CATALOG_CACHE_DIR = ".folder city catalog"  # in the base path, next to the city
+CATALOG_CACHE_VERSION = 2
+CHUNK_SIZE = 1000  # records per chunk of a cache, the most a read holds at once
+CATALOG_SUFFIXES = (".jsonl", ".json")
+ENTRY_SIZE = struct.Struct("<I")  # every entry of a cache is its length, then marshal data
+CACHE_END = b"end of the catalog cache"  # after the last entry, a cache without it was cut short
+
+# The location schema: key -> (type, required)
+LOCATION_KEYS = {
+    "name": (str, True),
+    "block_location": (str, False),  # worked out from the address when left out
+    "address": (str, True),
+    "exit_name": (str, True),
+    "marker": (str, True),
+    "objects": (list, True),
+}
+# Object specs, see folder_city.create_objects: key -> (type, lowest, highest)
+OBJECT_KEYS = {
+    "path": (str, None, None),
+    "min": (int, 0, None),
+    "max": (int, 0, None),
+    "count": (int, 0, None),
+    "chance": (float, 0, 1),
+    "contents": (str, None, None),
+    "appear": (float, 0, 1),
+    "disappear": (float, 0, 1),
+    "cleared_every": (int, 0, None),
+}
+
+
+class InvalidJSON(NamedTuple):
+    """What _records gives in place of a record that didn't parse, with why."""
+    problem: str
+
+
+def validate_location(record) -> List[str]:
+    """Everything wrong with a location record, empty if it can be built."""
+    if not isinstance(record, dict):
+        return ["a location has to be a JSON object"]
+    problems = [f"unknown key {key!r}" for key in record if key not in LOCATION_KEYS]
+    for key, (kind, required) in LOCATION_KEYS.items():
+        if key not in record:
+            if required:
+                problems.append(f"{key!r} is missing")
+        elif not isinstance(record[key], kind):
+            problems.append(f"{key!r} has to be a {kind.__name__}")
+    if problems:
+        return problems
+    # The names become folders and files, so they can't lead out of the city
+    for key in ("address", "exit_name", "marker"):
+        if not _is_name(record[key]):
+            problems.append(f"{key!r} has to be a file name, not {record[key]!r}")
+    if "block_location" in record and not _is_relative_path(record["block_location"]):
+        problems.append(f"'block_location' has to be a path inside the map, not {record['block_location']!r}")
+    for i, obj in enumerate(record["objects"]):
+        problems.extend(f"object {i + 1}: {problem}" for problem in _validate_object(obj))
+    return problems
+
+
+def _validate_object(obj) -> List[str]:
+    if not isinstance(obj, dict):
+        return ["has to be a JSON object"]
+    problems = [f"unknown key {key!r}" for key in obj if key not in OBJECT_KEYS]
+    if "path" not in obj:
+        problems.append("'path' is missing")
+    for key, (kind, lowest, highest) in OBJECT_KEYS.items():
+        if key not in obj:
+            continue
+        value = obj[key]
+        # JSON has one kind of number, so 1 is a fine chance, but true isn't a count
+        number = kind is float and isinstance(value, (int, float))
+        if isinstance(value, bool) or not (isinstance(value, kind) or number):
+            problems.append(f"{key!r} has to be {'a number' if kind is float else 'a whole number' if kind is int else 'a string'}")
+        elif lowest is not None and value < lowest or highest is not None and value > highest:
+            problems.append(f"{key!r} has to be {f'between {lowest} and {highest}' if highest is not None else f'at least {lowest}'}")
+    if not problems and not _is_relative_path(obj["path"]):
+        problems.append(f"'path' has to be a path inside the building, not {obj['path']!r}")
+    if not problems and obj.get("min", 1) > obj.get("max", obj.get("count", 1)) > 1:
+        problems.append("'min' is more than 'max'")
+    return problems
+
+
+def _is_name(name: str) -> bool:
+    return bool(name) and "/" not in name and "\0" not in name and name not in (".", "..")
+
+
+def _is_relative_path(path: str) -> bool:
+    return bool(path) and not path.startswith("/") and all(_is_name(part) for part in path.split("/"))
+
+
+class Catalog:
+    """
+    The city's locations: the built-in ones, then every record of the catalog
+    sources, each a JSON Lines file (one location a line) or a folder of .json
+    (one location, or a list of them) and .jsonl files.
+
+    Iterating reads the sources again every time, one record at a time, so even a
+    catalog of millions of locations never has to be in memory. Records that don't
+    fit the location schema are skipped and listed in problems. What each file
+    holds is kept in a compiled cache (marshal, in chunks of CHUNK_SIZE records)
+    keyed by the file's modification time and size: a source where nothing
+    changed is streamed straight from its cache, and only the files that changed
+    are parsed and validated again.
+    """
+
+    def __init__(self, builtin: List[Dict] = (), sources: Iterable = (), cache_dir=None):
+        self.builtin = builtin  # kept as is, so whoever extends the list is seen
+        self.sources = [os.fspath(source) for source in sources]
+        self.cache_dir = os.fspath(cache_dir) if cache_dir is not None else None
+        self.problems: Dict[str, None] = {}  # every skipped record and why, in the order they were read
+
+    def __iter__(self) -> Iterator[Dict]:
+        yield from self.builtin
+        for source in self.sources:
+            yield from self.read(source)
+
+    def add(self, source):
+        self.sources.append(os.fspath(source))
+
+    def read(self, source: str) -> Iterator[Dict]:
+        """The valid records of one source, from its cache where the files didn't change."""
+        files = _source_files(source)
+        cache_path = self._cache_path(source)
+        cached = _read_cache(cache_path) if cache_path else None
+        header = next(cached, None) if cached else None
+        if header is not None and header["files"] == files:
+            # Nothing changed, stream the cache as it is
+            for _, _, _, records, problems in cached:
+                self.problems.update(dict.fromkeys(problems))
+                yield from records
+            return
+        temporary_path = cache_path + ".tmp" if cache_path else None
+        out = None
+        if temporary_path:
+            try:
+                os.makedirs(self.cache_dir, exist_ok=True)
+                out = open(temporary_path, "wb")
+            except OSError:
+                pass  # nowhere to keep a cache, parse it every time
+            else:
+                _dump({"version": CATALOG_CACHE_VERSION, "files": files}, out)
+        try:
+            pending = next(cached, None) if header is not None else None
+            for name, mtime, size in files:
+                # The old cache is in the same file order, so reusable entries come up in turn
+                while pending is not None and pending[0] < name:
+                    pending = next(cached, None)
+                reused = False
+                while pending is not None and pending[:3] == (name, mtime, size):
+                    reused = True
+                    self.problems.update(dict.fromkeys(pending[4]))
+                    if out:
+                        _dump(pending, out)
+                    yield from pending[3]
+                    pending = next(cached, None)
+                if reused:
+                    continue
+                for records, problems in _parse_file(os.path.join(source, name) if os.path.isdir(source) else source):
+                    self.problems.update(dict.fromkeys(problems))
+                    if out:
+                        _dump((name, mtime, size, records, problems), out)
+                    yield from records
+            if out:
+                out.write(CACHE_END)
+                out.close()
+                os.replace(temporary_path, cache_path)
+                out = None
+        finally:
+            if cached:
+                cached.close()
+            if out:
+                out.close()
+                os.remove(temporary_path)  # stopped before the end, the old cache stays
+
+    def _cache_path(self, source: str) -> Optional[str]:
+        if self.cache_dir is None:
+            return None
+        key = hashlib.blake2b(os.path.abspath(source).encode("utf-8"), digest_size=8).hexdigest()
+        return os.path.join(self.cache_dir, f"{key}.cache")
+
+
+def _source_files(source: str) -> List[Tuple[str, int, int]]:
+    """(name, modification time, size) of every file of a source, in name order; a file source is its only file."""
+    if not os.path.isdir(source):
+        stat = os.stat(source)
+        return [(os.path.basename(source), stat.st_mtime_ns, stat.st_size)]
+    with os.scandir(source) as scan:
+        entries = [(entry.name, entry.stat()) for entry in scan
+                   if entry.name.endswith(CATALOG_SUFFIXES) and not entry.name.startswith(".") and entry.is_file()]
+    return sorted((name, stat.st_mtime_ns, stat.st_size) for name, stat in entries)
+
+
+def _read_cache(cache_path: str) -> Iterator:
+    """The header of a cache, then its entries one at a time; nothing if it's missing or from another version."""
+    try:
+        f = open(cache_path, "rb")
+    except OSError:
+        return
+    with f:
+        end = f.seek(0, os.SEEK_END) - len(CACHE_END)
+        if end < 0 or f.seek(end) != end or f.read() != CACHE_END:
+            return
+        f.seek(0)
+        header = _load(f, end)
+        if not isinstance(header, dict) or header.get("version") != CATALOG_CACHE_VERSION:
+            return
+        header["files"] = [tuple(entry) for entry in header["files"]]
+        yield header
+        entry = _load(f, end)
+        while entry is not None:
+            yield entry
+            entry = _load(f, end)
+
+
+def _dump(entry, f):
+    data = marshal.dumps(entry)
+    f.write(ENTRY_SIZE.pack(len(data)) + data)
+
+
+def _load(f, end: int):
+    """The next entry of a cache, or None at its end."""
+    if f.tell() + ENTRY_SIZE.size > end:
+        return None
+    size = f.read(ENTRY_SIZE.size)
+    data = f.read(ENTRY_SIZE.unpack(size)[0])
+    try:
+        return marshal.loads(data)
+    except (EOFError, ValueError, TypeError):
+        return None
+
+
+def _parse_file(path: str) -> Iterator[Tuple[List[Dict], List[str]]]:
+    """The valid records of a file and the problems of the rest, in chunks of CHUNK_SIZE records."""
+    records, problems = [], []
+    for where, record in _records(path):
+        found = [record.problem] if isinstance(record, InvalidJSON) else validate_location(record)
+        if found:
+            problems.append(f"{where}: {'; '.join(found)}")
+            continue
+        records.append(record)
+        if len(records) >= CHUNK_SIZE:
+            yield records, problems
+            records, problems = [], []
+    if records or problems:
+        yield records, problems
+
+
+def _records(path: str) -> Iterator[Tuple[str, object]]:
+    """(where, record) for every record in a file, with an InvalidJSON for whatever didn't parse."""
+    with open(path, encoding="utf-8") as f:
+        if path.endswith(".jsonl"):
+            for number, line in enumerate(f, 1):
+                if line.strip():
+                    yield f"{path}:{number}", _loads(line.rstrip("\r\n"))
+            return
+        record = _loads(f.read())
+    for i, item in enumerate(record if isinstance(record, list) else [record]):
+        yield f"{path}:{i + 1}" if isinstance(record, list) else path, item
+
+
+def _loads(text: str):
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError as error:
+        where = f"line {error.lineno} column {error.colno}" if error.lineno > 1 else f"column {error.colno}"
+        return InvalidJSON(f"invalid JSON: {error.msg} at {where}")
@@ -0,0 +1,169 @@
+import sys
+from typing import List, Optional, Tuple
+
+from grid import Grid
+
+# The kinds of places on the grid, in the order their node numbers come in
+INTERSECTION = 0
+STREET_BLOCK = 1
+AVENUE_BLOCK = 2
+
+
+class CityModel:
+    """
+    The places of a grid city as integers instead of paths.
+
+    Every intersection, street block and avenue block is one node number: for a
+    grid of width x height, intersection (x, y) is y * width + x, street block i of
+    street y comes next at width * height + y * width + i, and avenue block j of
+    avenue x after that at 2 * width * height + x * height + j. The names and
+    address ranges of the roads are interned once, so a node costs nothing until
+    something needs its path, which is only put together then (for a listing, a
+    route or a file operation). Tables indexed by node number (array.array) are all
+    it takes to keep something per place, a few bytes each even at millions of them.
+    """
+
+    def __init__(self, map_contents: str, grid: Grid):
+        self.map_contents = map_contents
+        self.grid = grid
+        self.width = grid.width
+        self.height = grid.height
+        self.area = grid.intersections
+        self.size = 3 * self.area  # node numbers, all kinds together
+        self.streets: List[str] = [sys.intern(name) for name in grid.street_names()]
+        self.avenues: List[str] = [sys.intern(name) for name in grid.avenue_names()]
+        self.street_numbers: List[str] = [sys.intern(number) for number in grid.street_numbers()]
+        self.avenue_numbers: List[str] = [sys.intern(number) for number in grid.avenue_numbers()]
+        self._streets = {name: i for i, name in enumerate(self.streets)}
+        self._avenues = {name: i for i, name in enumerate(self.avenues)}
+        self._street_blocks = {number: i for i, number in enumerate(self.street_numbers)}
+        self._avenue_blocks = {number: j for j, number in enumerate(self.avenue_numbers)}
+
+    def __repr__(self):
+        return f"CityModel({self.width}x{self.height})"
+
+    # --- Roads ---
+    def street_index(self, name: str) -> Optional[int]:
+        return self._streets.get(name)
+
+    def avenue_index(self, name: str) -> Optional[int]:
+        return self._avenues.get(name)
+
+    # --- Node numbers ---
+    def intersection(self, x: int, y: int) -> int:
+        return y * self.width + x
+
+    def street_block(self, i: int, y: int) -> int:
+        return self.area + y * self.width + i
+
+    def avenue_block(self, x: int, j: int) -> int:
+        return 2 * self.area + x * self.height + j
+
+    def place(self, node: int) -> Tuple[int, int, int]:
+        """(kind, road or avenue index, block or street index) of a node: (INTERSECTION, x, y), (STREET_BLOCK, y, i) or (AVENUE_BLOCK, x, j)."""
+        kind, offset = divmod(node, self.area)
+        if kind == INTERSECTION:
+            y, x = divmod(offset, self.width)
+            return kind, x, y
+        if kind == STREET_BLOCK:
+            return kind, *divmod(offset, self.width)
+        return kind, *divmod(offset, self.height)
+
+    def coordinates(self, node: int) -> Tuple[float, float]:
+        """(x, y) of a node in avenues and streets; a block is halfway between the intersections at its ends."""
+        kind, road, index = self.place(node)
+        if kind == INTERSECTION:
+            return road, index
+        if kind == STREET_BLOCK:
+            return index - 0.5, road
+        return road, index - 0.5
+
+    # --- Paths, only made when asked for ---
+    def name(self, node: int) -> str:
+        """The folder name of a node, e.g. "Oak St & Ocean Ave" or "1600-1699 Oak St"."""
+        kind, road, index = self.place(node)
+        if kind == INTERSECTION:
+            return f"{self.streets[index]} & {self.avenues[road]}"
+        if kind == STREET_BLOCK:
+            return f"{self.street_numbers[index]} {self.streets[road]}"
+        return f"{self.avenue_numbers[index]} {self.avenues[road]}"
+
+    def path(self, node: int) -> str:
+        """The path of a node, relative to the base path."""
+        kind, road, _ = self.place(node)
+        if kind == INTERSECTION:
+            return f"{self.map_contents}/intersections/{self.name(node)}"
+        if kind == STREET_BLOCK:
+            return f"{self.map_contents}/horizontals/{self.streets[road]} blocks/{self.name(node)}"
+        return f"{self.map_contents}/verticals/{self.avenues[road]} blocks/{self.name(node)}"
+
+    def node(self, path: str, inside: bool = False) -> Optional[int]:
+        """
+        The node at a path, or None if it isn't an intersection or block of this
+        grid. With inside, also the node a path is somewhere inside of, like a
+        building on a block.
+        """
+        prefix = self.map_contents + "/"
+        if not path.startswith(prefix):
+            return None
+        parts = path[len(prefix):].split("/")
+        if parts[0] == "intersections" and len(parts) >= 2 and (inside or len(parts) == 2):
+            street, _, avenue = parts[1].partition(" & ")
+            x, y = self._avenues.get(avenue), self._streets.get(street)
+            return None if x is None or y is None else self.intersection(x, y)
+        if parts[0] in ("horizontals", "verticals") and len(parts) >= 3 and (inside or len(parts) == 3):
+            road = parts[1][:-len(" blocks")] if parts[1].endswith(" blocks") else None
+            number, _, block_road = parts[2].partition(" ")
+            if block_road != road:
+                return None
+            if parts[0] == "horizontals":
+                y, i = self._streets.get(road), self._street_blocks.get(number)
+                return None if y is None or i is None else self.street_block(i, y)
+            x, j = self._avenues.get(road), self._avenue_blocks.get(number)
+            return None if x is None or j is None else self.avenue_block(x, j)
+        return None
+
+    # --- Navigation ---
+    def links(self, node: int) -> List[Tuple[str, int]]:
+        """The navigation links out of a node, as (link name, node it leads to), the same ones plan_navigation makes."""
+        kind, road, index = self.place(node)
+        if kind == INTERSECTION:
+            x, y = road, index
+            street, avenue = self.streets[y], self.avenues[x]
+            # Street block x ends at this avenue, street block x + 1 starts here
+            links = [(f"⏴ west to {self.street_numbers[x]} {street}", self.street_block(x, y))]
+            if x + 1 < self.width:
+                links.append((f"⏵ east to {self.street_numbers[x + 1]} {street}", self.street_block(x + 1, y)))
+            # Avenue block y ends at this street, avenue block y + 1 starts here
+            links.append((f"⏶ north to {self.avenue_numbers[y]} {avenue}", self.avenue_block(x, y)))
+            if y + 1 < self.height:
+                links.append((f"⏷ south to {self.avenue_numbers[y + 1]} {avenue}", self.avenue_block(x, y + 1)))
+            return links
+        if kind == STREET_BLOCK:
+            y, i = road, index
+            street = self.streets[y]
+            links = [(f"⏵ east to {street} & {self.avenues[i]}", self.intersection(i, y))]
+            if i > 0:
+                links.append((f"⏴ west to {street} & {self.avenues[i - 1]}", self.intersection(i - 1, y)))
+            return links
+        x, j = road, index
+        avenue = self.avenues[x]
+        links = [(f"⏷ south to {self.streets[j]} & {avenue}", self.intersection(x, j))]
+        if j > 0:
+            links.append((f"⏶ north to {self.streets[j - 1]} & {avenue}", self.intersection(x, j - 1)))
+        return links
+
+    def neighbors(self, node: int) -> List[int]:
+        """The nodes the links out of a node lead to, without naming the links."""
+        kind, road, index = self.place(node)
+        if kind == INTERSECTION:
+            x, y = road, index
+            neighbors = [self.street_block(x, y), self.avenue_block(x, y)]
+            if x + 1 < self.width:
+                neighbors.append(self.street_block(x + 1, y))
+            if y + 1 < self.height:
+                neighbors.append(self.avenue_block(x, y + 1))
+            return neighbors
+        if kind == STREET_BLOCK:
+            return [self.intersection(index, road)] + ([self.intersection(index - 1, road)] if index > 0 else [])
+        return [self.intersection(road, index)] + ([self.intersection(road, index - 1)] if index > 0 else [])
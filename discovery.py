@@ -0,0 +1,219 @@
+import json
+import os
+import stat
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from address_index import parse_address
+from grid import BLOCK_SIZE
+
+DISCOVERY_CACHE_NAME = ".discovery cache.json"
+DISCOVERY_CACHE_VERSION = 2
+ROAD_FOLDERS = ("horizontals", "verticals")
+
+# stat() relative to an open directory skips resolving the long map contents path every time
+STAT_DIR_FD = os.stat in os.supports_dir_fd and os.open in os.supports_dir_fd
+O_DIRECTORY = getattr(os, "O_DIRECTORY", 0)
+
+
+def location_record(block_location: str, folder: str, entries: Dict[str, str]) -> dict:
+    """
+    A location record like the ones in LOCATIONS, for a building folder someone made
+    by hand. entries maps the paths in the folder, relative to it ("attic/mug"),
+    to "dir", "file" or "link". The marker and the exit are the ones right inside
+    the folder; every other file is an object and every folder inside is in
+    "folders". Folders named like an address ("2050 Oak St - my house") keep it;
+    anything else is put in the middle of its block.
+    """
+    block = block_location.rsplit("/", 1)[-1]
+    number_range, _, road = block.partition(" ")
+    address = parse_address(folder)
+    if address is None or address.road != road:
+        low = int(number_range.split("-")[0])
+        address = parse_address(f"{low + BLOCK_SIZE // 2} {road} - {folder}")
+    markers = sorted(name for name, kind in entries.items() if kind == "file" and name.startswith("[ ") and "/" not in name)
+    exits = sorted(name for name, kind in entries.items() if kind == "link" and "/" not in name)
+    return {
+        "name": address.name or folder,
+        "block_location": block_location,
+        "address": f"{address.number} {address.road} - {address.name or folder}",
+        "folder": folder,
+        "exit_name": exits[0] if exits else None,
+        "marker": markers[0] if markers else None,
+        "objects": [{"path": name} for name, kind in sorted(entries.items()) if kind == "file" and name not in markers],
+        "folders": sorted(name for name, kind in entries.items() if kind == "dir"),
+        "discovered": True,
+    }
+
+
+class DiscoveryScanner:
+    """
+    Finds building folders under the block directories of a built city.
+
+    Remembers the inode and mtime of every road, block and building directory, and
+    of every folder inside a building, with what was found in it. A directory's
+    mtime changes whenever something is added, removed or renamed directly inside
+    it, so a rescan only lists the directories whose inode or mtime changed and
+    just stats the rest.
+    """
+
+    def __init__(self, map_contents):
+        self.map_contents = os.fspath(map_contents)
+        self.cache_path = os.path.join(self.map_contents, DISCOVERY_CACHE_NAME)
+        # "horizontals/Oak St blocks" -> [inode, mtime, {block: [inode, mtime, {building folder: location record}]}]
+        self.roads: Dict[str, list] = {}
+        self.counts = {"statted": 0, "listed": 0}
+
+    # --- The cache ---
+    def load(self) -> "DiscoveryScanner":
+        """Pick up the cache of an earlier scan, if it is there."""
+        try:
+            with open(self.cache_path, encoding="utf-8") as f:
+                cache = json.load(f)
+        except (OSError, ValueError):
+            return self
+        if cache.get("version") == DISCOVERY_CACHE_VERSION:
+            self.roads = cache["roads"]
+        return self
+
+    def save(self):
+        temporary_path = self.cache_path + ".tmp"
+        with open(temporary_path, "w", encoding="utf-8") as f:
+            json.dump({"version": DISCOVERY_CACHE_VERSION, "roads": self.roads}, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(temporary_path, self.cache_path)
+
+    # --- Scanning ---
+    def scan(self) -> List[dict]:
+        """Every building folder under a block, as a location record."""
+        self.counts = {"statted": 0, "listed": 0}
+        roads = {}
+        for folder in ROAD_FOLDERS:
+            for road in self._listdir(folder, directories_only=True):
+                road_path = f"{folder}/{road}"
+                key = self._stat(None, road_path)
+                if key is None:
+                    continue
+                cached = self.roads.get(road_path)
+                old = cached[2] if cached else {}
+                names = old if cached and cached[:2] == key else self._listdir(road_path, directories_only=True)
+                roads[road_path] = [*key, self._scan_blocks(road_path, names, old)]
+        self.roads = roads
+        return self.records()
+
+    def rescan(self, block_paths: Iterable[str]) -> List[dict]:
+        """
+        Like scan(), but only looks again at the given block directories (relative to
+        the map contents, e.g. "horizontals/Oak St blocks/1800-1899 Oak St"), for when
+        it is already known what changed. Falls back to a full scan for anything
+        that isn't a block the last scan saw.
+        """
+        self.counts = {"statted": 0, "listed": 0}
+        for block_path in set(block_paths):
+            road_path, _, name = block_path.rpartition("/")
+            road = self.roads.get(road_path)
+            if road is None or road_path.count("/") != 1:
+                return self.scan()
+            blocks = self._scan_blocks(road_path, [name], road[2])
+            if name in blocks:
+                road[2][name] = blocks[name]
+            else:
+                road[2].pop(name, None)  # the next full scan lists the road again, its mtime is stale
+        return self.records()
+
+    def records(self) -> List[dict]:
+        """The location records found by the last scan."""
+        return [record for _, _, blocks in self.roads.values() for _, _, buildings in blocks.values() for record in buildings.values()]
+
+    def _scan_blocks(self, road_path: str, names, old: Dict[str, list]) -> Dict[str, list]:
+        blocks = {}
+        dir_fd = self._open(road_path) if STAT_DIR_FD else None
+        try:
+            for name in names:
+                key = self._stat(dir_fd, name if dir_fd is not None else f"{road_path}/{name}")
+                if key is None:
+                    continue
+                cached = old.get(name)
+                if cached and cached[:2] == key and not cached[2]:
+                    blocks[name] = cached  # nothing was built here by hand, and nothing changed
+                    continue
+                block_path = f"{road_path}/{name}"
+                known = cached[2] if cached else {}
+                folders = known if cached and cached[:2] == key else self._listdir(block_path, directories_only=True)
+                buildings = {}
+                for folder in folders:
+                    # The buildings stay the same while the block doesn't change, but their contents may not
+                    building = f"{block_path}/{folder}"
+                    building_key = self._stat(dir_fd, f"{name}/{folder}" if dir_fd is not None else building)
+                    if building_key is None:
+                        continue
+                    record = known.get(folder)
+                    if record is None or record.get("key") != building_key or self._inside_changed(building, record):
+                        entries, inside = self._building(building)
+                        record = location_record(block_path, folder, entries)
+                        record["key"], record["inside"] = building_key, inside
+                    buildings[folder] = record
+                blocks[name] = [*key, buildings]
+        finally:
+            if dir_fd is not None:
+                os.close(dir_fd)
+        return blocks
+
+    def _building(self, building: str) -> Tuple[Dict[str, str], Dict[str, list]]:
+        """
+        Everything in a building folder by its path relative to the building, and the
+        inode and mtime of every folder inside it. Links aren't followed.
+        """
+        entries, inside = {}, {}
+        pending = [""]
+        while pending:
+            folder = pending.pop()
+            for name, kind in self._entries(f"{building}/{folder}" if folder else building).items():
+                path = f"{folder}/{name}" if folder else name
+                entries[path] = kind
+                if kind == "dir":
+                    key = self._stat(None, f"{building}/{path}")
+                    if key is not None:
+                        inside[path] = key
+                        pending.append(path)
+        return entries, inside
+
+    def _inside_changed(self, building: str, record: dict) -> bool:
+        """Whether something was added, removed or renamed in a folder inside the building since its record was made."""
+        return any(self._stat(None, f"{building}/{path}") != key for path, key in record.get("inside", {}).items())
+
+    # --- Filesystem calls ---
+    def _open(self, path: str) -> Optional[int]:
+        try:
+            return os.open(os.path.join(self.map_contents, path), os.O_RDONLY | O_DIRECTORY)
+        except OSError:
+            return None
+
+    def _stat(self, dir_fd: Optional[int], path: str) -> Optional[Tuple[int, int]]:
+        self.counts["statted"] += 1
+        try:
+            if dir_fd is not None:
+                st = os.stat(path, dir_fd=dir_fd, follow_symlinks=False)
+            else:
+                st = os.stat(os.path.join(self.map_contents, path), follow_symlinks=False)
+        except OSError:
+            return None
+        return [st.st_ino, st.st_mtime_ns] if stat.S_ISDIR(st.st_mode) else None
+
+    def _listdir(self, path: str, directories_only: bool = False) -> List[str]:
+        entries = self._entries(path)
+        return [name for name, kind in entries.items() if kind == "dir" or not directories_only]
+
+    def _entries(self, path: str) -> Dict[str, str]:
+        self.counts["listed"] += 1
+        entries = {}
+        try:
+            with os.scandir(os.path.join(self.map_contents, path)) as scan:
+                for entry in scan:
+                    if entry.is_symlink():
+                        entries[entry.name] = "link"
+                    elif entry.is_dir():
+                        entries[entry.name] = "dir"
+                    else:
+                        entries[entry.name] = "file"
+        except OSError:
+            pass
+        return entries
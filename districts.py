@@ -0,0 +1,103 @@
+import itertools
+import math
+import multiprocessing
+import os
+import time
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from build_plan import PlanCompiler, plan_streets_and_avenues, plan_navigation, plan_district_borders
+from grid import Grid
+from inode_pool import InodePool
+from manifest import MANIFEST_NAME, ManifestPart, ManifestRecorder
+from materializer import Materializer
+
+DISTRICTS_PER_WORKER = 4  # more districts than workers, so one slow district doesn't leave the others idle
+
+
+class District(NamedTuple):
+    """A rectangle of the grid, by street and avenue indexes."""
+    index: int
+    streets: range
+    avenues: range
+
+
+def split_districts(grid: Grid, count: int) -> List[District]:
+    """Split the grid into about count rectangular districts of about the same size and shape."""
+    columns = max(1, min(grid.width, round(math.sqrt(count * grid.width / max(grid.height, 1)))))
+    rows = max(1, min(grid.height, math.ceil(count / columns)))
+    avenue_cuts = [grid.width * i // columns for i in range(columns + 1)]
+    street_cuts = [grid.height * j // rows for j in range(rows + 1)]
+    districts = []
+    for j in range(rows):
+        for i in range(columns):
+            districts.append(District(len(districts), range(street_cuts[j], street_cuts[j + 1]),
+                                      range(avenue_cuts[i], avenue_cuts[i + 1])))
+    return districts
+
+
+def _build_district(task: tuple) -> Tuple[int, Dict[str, int], int, int, int]:
+    """
+    Build one district in a worker process, recording its manifest part. Returns
+    the district's index, op counts and bytes written, and the files it linked to
+    the inode pool and the pool files it made (0 without a pool).
+    """
+    base_path, map_contents, grid, district, part_path, threads, batch_size, max_seen, pool_path = task
+    materializer = Materializer(threads, batch_size)
+    # Every worker links into the same pool folder, a pool file another worker made first is used as it is
+    pool: Optional[InodePool] = InodePool(pool_path) if pool_path is not None else None
+    materializer.inode_pool = pool
+    operations = itertools.chain(plan_streets_and_avenues(map_contents, grid, district.streets, district.avenues),
+                                 plan_navigation(map_contents, grid, district.streets, district.avenues))
+    part = ManifestPart(part_path)
+    try:
+        # Each worker compiles its own district, so the road folders it needs are made if it gets there first
+        materializer.apply(part.record(PlanCompiler(max_seen).compile(operations)), base_path)
+    finally:
+        part.close()
+        if pool:
+            pool.close()
+    return (district.index, materializer.counts, materializer.bytes_written,
+            pool.linked if pool else 0, pool.created if pool else 0)
+
+
+def build_districts(base_path, map_contents: str, grid: Grid, workers: int, materializer: Materializer,
+                    recorder: ManifestRecorder, max_seen: int = None) -> int:
+    """
+    Build the streets, avenues, intersections and navigation links of the grid with
+    a pool of worker processes. The grid is split into districts, and each worker
+    builds whole districts, each the only writer of its own blocks and
+    intersections. The links crossing district borders are stitched in afterwards
+    by materializer. Every worker records its own manifest part, joined into
+    recorder in district order, and its op counts are added to materializer's.
+    With an inode pool on materializer, the workers link their files into the same
+    pool folder and their links are added to its counts.
+    Returns the number of districts.
+    """
+    base_path = os.fspath(base_path)
+    districts = split_districts(grid, workers * DISTRICTS_PER_WORKER)
+    part_dir = os.path.join(base_path, map_contents)
+    os.makedirs(part_dir, exist_ok=True)
+    part_paths = [os.path.join(part_dir, f"{MANIFEST_NAME}.{district.index}.part") for district in districts]
+    threads = max(1, materializer.threads // workers)
+    pool_path = materializer.inode_pool.path if materializer.inode_pool else None
+    tasks = [(base_path, map_contents, grid, district, part_path, threads, materializer.batch_size, max_seen, pool_path)
+             for district, part_path in zip(districts, part_paths)]
+    start = time.perf_counter()
+    with multiprocessing.Pool(workers) as pool:
+        for _, counts, written, linked, created in pool.imap_unordered(_build_district, tasks):
+            for kind, count in counts.items():
+                materializer.counts[kind] = materializer.counts.get(kind, 0) + count
+            materializer.bytes_written += written
+            if materializer.inode_pool:
+                materializer.inode_pool.linked += linked
+                materializer.inode_pool.created += created
+            if materializer.progress:
+                materializer.progress(sum(counts.values()))
+    materializer.seconds += time.perf_counter() - start
+    for part_path in part_paths:
+        recorder.append(part_path)
+
+    street_cuts = sorted({district.streets.start for district in districts} - {0})
+    avenue_cuts = sorted({district.avenues.start for district in districts} - {0})
+    materializer.apply(recorder.record(plan_district_borders(map_contents, grid, street_cuts, avenue_cuts)), base_path)
+    return len(districts)
@@ -3,12 +3,37 @@ import time
 import os
 import sys
 import random
-import shutil
-from tqdm import tqdm
+import argparse
+import importlib.util
+import itertools
+from contextlib import contextmanager
 from pathlib import Path
-from typing import List, Dict, Union
-from locations import LOCATIONS
-from map_plot import draw_map
+from typing import TYPE_CHECKING, List, Dict, Iterable, Union
+from locations import LOCATIONS as BUILTIN_LOCATIONS
+from catalog import Catalog, CATALOG_CACHE_DIR
+from materializer import Materializer, DEFAULT_THREADS, DEFAULT_BATCH_SIZE
+from instrumentation import Instrumentation, PhaseRecord
+from manifest import PlanDiff, ManifestRecorder, load_manifest, manifest_seed, write_manifest, diff_plan
+from grid import Grid
+from address_index import AddressIndex
+from archive import FORMATS, ArchiveReader, export_archive
+from virtual_city import VirtualCity, DiskCity, CityShell
+from routing import Router, ROUTE_TABLE_NAME, find_place
+from discovery import DiscoveryScanner
+from search_index import SearchIndex, source_paths
+from inode_pool import InodePool, INODE_POOL_DIR
+from build_plan import (
+    Operation, PlanCompiler, SYMLINK, WELCOME_CENTER_DIR,
+    PHASES, STREETS_AND_AVENUES, NAVIGATION, WELCOME_CENTER, LOCATIONS_PHASE,
+    plan_streets_and_avenues, plan_navigation, plan_welcome_center, plan_locations, plan_objects,
+    compile_plan, phase_operations, summarize_plan,
+)
+
+# The living city, the integrity check, the district workers, the watcher and the
+# generations of --fresh need NumPy, asyncio, multiprocessing or ctypes, so they
+# are imported where they're used and a walk or a small rebuild doesn't wait for them
+if TYPE_CHECKING:
+    from simulation import Simulation, Tick
 
 # Define key locations
 if getattr(sys, 'frozen', False):
@@ -17,7 +42,18 @@ if getattr(sys, 'frozen', False):
 else:
     # If running in a regular Python environment, use the directory of the script.
     BASE_PATH = Path(__file__).parent
-MAP_CONTENTS = BASE_PATH / "the welcome center/basement/unmarked box/flash drive/users/home/library/application support/folder city/map contents"
+MAP_CONTENTS_DIR = "the welcome center/basement/unmarked box/flash drive/users/home/library/application support/folder city/map contents"
+MAP_CONTENTS = BASE_PATH / MAP_CONTENTS_DIR
+
+# The built-in locations, then the ones of any catalogs given with --catalog, read as they're needed
+LOCATIONS = Catalog(BUILTIN_LOCATIONS, cache_dir=BASE_PATH / CATALOG_CACHE_DIR)
+
+# All filesystem work goes through one materializer so its directory cache is shared
+MATERIALIZER = Materializer()
+STATS = Instrumentation(MATERIALIZER)
+
+# Cosmetic delays (the banner typing itself out) only when someone is watching
+INTERACTIVE = sys.stdout.isatty()
 
 # Define street and avenue names
 STREET_NAMES = [
@@ -60,88 +96,141 @@ AVENUE_NUMBERS = [
     "700-799",
 ]
 
+# Grids with more intersections than this stream from the planner straight to the disk
+STREAMING_THRESHOLD = 10_000
+STREAMING_MAX_SEEN = 100_000  # paths the streaming planner remembers for deduplication
+MAX_FIND_RESULTS = 20
+MAX_DRIFT_SHOWN = 10  # paths listed per kind of problem by --verify
+MAX_CATALOG_PROBLEMS_SHOWN = 10  # skipped catalog records listed after a build
+MAP_FORMATS = ["png", "svg", "text"]
+
+def make_grid(width: int = len(AVENUE_NAMES), height: int = len(STREET_NAMES)) -> Grid:
+    """The city grid. The named roads above come first; bigger grids continue with generated names."""
+    return Grid(
+        width, height,
+        street_names=STREET_NAMES,
+        avenue_names=AVENUE_NAMES,
+        first_street_number=int(STREET_NUMBERS[0].split("-")[0]),
+        first_avenue_number=int(AVENUE_NUMBERS[0].split("-")[0]),
+    )
+
+GRID = make_grid()
+ADDRESSES = AddressIndex(GRID)  # every address lookup goes through here, so each is parsed once
+
+# Seed for the objects in the city; the same seed always plans the same city (None: different every time)
+SEED = None
+
 def reset_map_contents():
-    """Delete the welcome center folder if it already exists"""
+    """Throw the welcome center folder away if it already exists, it is deleted in the background"""
+    from generations import move_to_trash, start_teardown
     welcome_center = BASE_PATH / "the welcome center"
     if welcome_center.exists():
-        shutil.rmtree(welcome_center)
+        move_to_trash(welcome_center, BASE_PATH)
+        start_teardown(teardown_command())
+    MATERIALIZER.forget()
+
+def teardown_command() -> List[str]:
+    """How to run this program so it empties the trash and exits."""
+    program = [sys.executable] if getattr(sys, 'frozen', False) else [sys.executable, os.path.abspath(__file__)]
+    return program + ["--empty-trash"]
+
+def swap_in_city(live_base: Path, carried: List[Dict]) -> int:
+    """
+    Swap the city built in the staging base path (BASE_PATH) with the live one in
+    one atomic rename, move the buildings people made into the new city when their
+    block is still there, and throw the old city away, to be deleted in the
+    background. Returns how many buildings were moved.
+    """
+    from generations import exchange, move_to_trash, start_teardown
+    live = live_base / WELCOME_CENTER_DIR
+    exchange(os.fspath(live), os.fspath(BASE_PATH / WELCOME_CENTER_DIR))
+    moved = 0
+    for record in carried:
+        building = f"{MAP_CONTENTS_DIR}/{record['block_location']}/{record['folder']}"
+        old, new = BASE_PATH / building, live_base / building
+        if new.parent.is_dir() and not os.path.lexists(new):
+            os.rename(old, new)
+            moved += 1
+    move_to_trash(BASE_PATH, live_base)
+    start_teardown(teardown_command())
+    return moved
 
 def create_directory(path):
     """Create a directory if it doesn't already exist."""
-    os.makedirs(path, exist_ok=True)
+    MATERIALIZER.create_directory(path)
 
 def create_file(path: Path, contents: str = ""):
     """Create a file with optional contents, ensuring the parent directory exists first."""
-    path.parent.mkdir(parents=True, exist_ok=True)  # Ensure parent directory exists
-    if not path.exists():
-        path.write_text(contents)
+    MATERIALIZER.create_file(path, contents)
 
 def create_symlink(target, destination):
     """Create a symbolic link to target if it doesn't already exist. Destination is the symlink path and target is the file to link to."""
-    if not destination.exists():
-        os.symlink(target, destination)
+    MATERIALIZER.create_symlink(target, destination)
+
+def relink_city(streaming: bool = False) -> int:
+    """
+    Rewrite the symlinks of a city built with absolute links as relative ones, in
+    place, so it can be moved. The links come from the last build's manifest, or from
+    the plan when there is none. Returns how many links were rewritten.
+    """
+    links = [entry for entry in load_manifest(MAP_CONTENTS).values() if entry.kind == SYMLINK]
+    if not links:
+        plan = itertools.chain(*stream_city_plan()) if streaming else build_city_plan()
+        links = [op for op in plan if op.kind == SYMLINK]
+    return MATERIALIZER.relink(links, BASE_PATH)
+
+def city_phase_plans() -> List[Iterable[Operation]]:
+    """The operations of every build phase, in build order, generated lazily."""
+    return [
+        plan_streets_and_avenues(MAP_CONTENTS_DIR, GRID),
+        plan_navigation(MAP_CONTENTS_DIR, GRID),
+        plan_welcome_center(MAP_CONTENTS_DIR, SEED),
+        plan_locations(MAP_CONTENTS_DIR, LOCATIONS, ADDRESSES, SEED),
+    ]
+
+def build_city_plan() -> List[Operation]:
+    """Compile every build phase into one deduplicated list of filesystem operations."""
+    return compile_plan(*city_phase_plans())
 
-def setup_streets_and_avenues():
+def stream_city_plan() -> List[Iterable[Operation]]:
+    """Like build_city_plan, but one lazy stream per phase with bounded memory, for huge grids."""
+    compiler = PlanCompiler(max_seen=STREAMING_MAX_SEEN)
+    return [compiler.compile(operations) for operations in city_phase_plans()]
+
+def remove_stale(recorder: ManifestRecorder):
+    """
+    After a streamed build, which never compared the plan with the last build's
+    manifest: remove what the last build made that isn't planned any more, and
+    make again what is planned differently now (a new link target, say), since
+    the stream skipped paths that were already there.
+    """
+    replace, remove = recorder.stale()
+    MATERIALIZER.remove(replace + remove, BASE_PATH)
+    if replace:
+        changed = {entry.path for entry in replace}
+        apply_operations(op for op in itertools.chain(*stream_city_plan()) if op.path in changed)
+
+def apply_operations(operations: Iterable[Operation]):
+    """Perform planned operations relative to the base path."""
+    MATERIALIZER.apply(operations, BASE_PATH)
+
+def apply_phase(plan: Iterable[Operation], phase: str):
+    """Apply one phase's slice of the plan, compiling a fresh plan if none is given."""
+    if plan is None:
+        plan = build_city_plan()
+    apply_operations(phase_operations(plan, phase))
+
+def plan_changes(plan: List[Operation]) -> PlanDiff:
+    """Diff the plan against the manifest of the previous build."""
+    return diff_plan(load_manifest(MAP_CONTENTS), plan)
+
+def setup_streets_and_avenues(plan: Iterable[Operation] = None):
     """Create directories for streets, avenues, and their intersections."""
-    for street in STREET_NAMES:
-        street_path = MAP_CONTENTS / f"horizontals/{street} blocks"
-        create_directory(street_path)
-        
-        for st_number in STREET_NUMBERS:
-            block_path = street_path / f"{st_number} {street}"
-            create_directory(block_path)
-            create_file(block_path / f"[ {st_number} {street} ]")
-
-            for avenue in AVENUE_NAMES:
-                avenue_path = MAP_CONTENTS / f"verticals/{avenue} blocks"
-                create_directory(avenue_path)
-                
-                for av_number in AVENUE_NUMBERS:
-                    av_block_path = avenue_path / f"{av_number} {avenue}"
-                    create_directory(av_block_path)
-                    create_file(av_block_path / f"[ {av_number} {avenue} ]")
-                    
-                    intersection_path = MAP_CONTENTS / f"intersections/{street} & {avenue}"
-                    create_directory(intersection_path)
-                    create_file(intersection_path / f"[ {street} & {avenue} ]")
-
-def setup_navigation():
+    apply_phase(plan, STREETS_AND_AVENUES)
+
+def setup_navigation(plan: Iterable[Operation] = None):
     """Create symbolic links between streets and avenues for navigation."""
-    for street in STREET_NAMES:
-        street_path = MAP_CONTENTS / f"horizontals/{street} blocks"
-
-        for index, st_number in enumerate(STREET_NUMBERS):
-            block = street_path / f"{st_number} {street}"
-
-            if index < len(AVENUE_NAMES):
-                east_avenue = AVENUE_NAMES[index]
-                east_intersection = MAP_CONTENTS / f"intersections/{street} & {east_avenue}"
-                create_symlink(block, east_intersection / f"⏴ west to {st_number} {street}")
-                create_symlink(east_intersection, block / f"⏵ east to {street} & {east_avenue}")
-
-            if index > 0:
-                west_avenue = AVENUE_NAMES[index - 1]
-                west_intersection = MAP_CONTENTS / f"intersections/{street} & {west_avenue}"
-                create_symlink(block, west_intersection / f"⏵ east to {st_number} {street}")
-                create_symlink(west_intersection, block / f"⏴ west to {street} & {west_avenue}")
-
-    for avenue in AVENUE_NAMES:
-        avenue_path = MAP_CONTENTS / f"verticals/{avenue} blocks"
-
-        for index, av_number in enumerate(AVENUE_NUMBERS):
-            block = avenue_path / f"{av_number} {avenue}"
-
-            if index < len(STREET_NAMES):
-                south_street = STREET_NAMES[index]
-                south_intersection = MAP_CONTENTS / f"intersections/{south_street} & {avenue}"
-                create_symlink(block, south_intersection / f"⏶ north to {av_number} {avenue}")
-                create_symlink(south_intersection, block / f"⏷ south to {south_street} & {avenue}")
-
-            if index > 0:
-                north_street = STREET_NAMES[index - 1]
-                north_intersection = MAP_CONTENTS / f"intersections/{north_street} & {avenue}"
-                create_symlink(block, north_intersection / f"⏷ south to {av_number} {avenue}")
-                create_symlink(north_intersection, block / f"⏶ north to {north_street} & {avenue}")
+    apply_phase(plan, NAVIGATION)
 
 def create_objects(base_path: Path, objects: List[Dict[str, Union[str, int, float]]]) -> None:
     """Create objects in the specified base path.
@@ -155,141 +244,44 @@ def create_objects(base_path: Path, objects: List[Dict[str, Union[str, int, floa
                 - max (int, optional): Maximum number for object naming (ex. obj_005) (default: count or 1).
                 - count (int, optional): Fixed number of objects (overrides min/max).
                 - chance (float, optional): Probability (0 to 1) that each object is created (default: 1.0).
+                - appear (float, optional): With --simulate, probability per tick that a missing one comes (back), e.g. restocked.
+                - disappear (float, optional): With --simulate, probability per tick that one goes away, e.g. sold.
+                - cleared_every (int, optional): With --simulate, every this many ticks they all go away, e.g. taken out with the trash.
     """
-    for obj in objects:
-        min = obj.get("min", 1)
-        max = obj.get("max", obj.get("count", 1))
-        chance = obj.get("chance", 1.0)
-        contents = obj.get("contents", "")
-        for i in range(min, max + 1):
-            if random.random() < chance:
-                suffix = f"_{i:03}" if max > 1 else ""  # format as three-digit number if more than 1 item
-                create_file(base_path / f"{obj['path']}{suffix}")
-
-def setup_welcome_center():
-    """Link the welcome center to different locations in the folder city."""
-    welcome_center = BASE_PATH / "the welcome center"
-    block_location = MAP_CONTENTS / "horizontals/Juniper St blocks/1900-1999 Juniper St"
-    basement = welcome_center / "basement"
-    home_folder = basement / "unmarked box/flash drive/users/home"
-
-    # Create symbolic links
-    create_symlink(welcome_center, block_location / "1995 Juniper St - the welcome center")
-    create_symlink(block_location, welcome_center / "front door")
-
-    # Create a marker file
-    create_file(welcome_center / "[ the welcome center ]")
-
-    # Home structure
-    home_dirs = ["movies", "music", "pictures", "public", "downloads", "applications/folder city"]
-    for directory in home_dirs:
-        create_directory(basement / f"unmarked box/flash drive/users/home/{directory}")
-
-    app_folder_symlink = home_folder / "applications/folder city/the welcome center"
-    create_symlink(welcome_center, app_folder_symlink)
-
-    # Filing cabinet
-    filing_drawers = ["top drawer", "middle drawer", "bottom drawer"]
-    for drawer in filing_drawers:
-        create_directory(basement / f"filing cabinet/{drawer}")
-
-    # Paperclip box
-    paperclip_box = basement / "unmarked box/box of paperclips"
-    create_directory(paperclip_box)
-    for i in range(1, 251):
-        create_file(paperclip_box / f"paperclip {i}")
-
-    # Upstairs
-    upstairs_paths = [
-        "upstairs/balcony",
-        "upstairs/bedroom/dresser/top drawer",
-        "upstairs/bedroom/dresser/middle drawer",
-        "upstairs/bedroom/dresser/bottom drawer",
-    ]
-    for path in upstairs_paths:
-        create_directory(BASE_PATH / f"the welcome center/{path}")
-
-    # Individual items
-    item_paths = [
-        "upstairs/bedroom/bed",
-        "upstairs/washroom/toilet",
-        "upstairs/washroom/sink",
-        "upstairs/washroom/bathtub",
-        "kitchen/sink",
-        "kitchen/table",
-    ]
-    for item in item_paths:
-        create_file(BASE_PATH / f"the welcome center/{item}")
-
-    create_file(BASE_PATH / "the welcome center/kitchen/stove/large pot/ladle")
-    create_file(BASE_PATH / "the welcome center/kitchen/stove/large pot/potato stew?")
-
-    # Kitchen utensils
-    clean_chance = 1
-    for i in range(12, 21):
-        prefix = "0" if i < 10 else ""
-        if random.random() < clean_chance:
-            create_file(BASE_PATH / f"the welcome center/kitchen/cabinet/drawer/utensil tray/forks/fork_00{prefix}{i}")
-        else:
-            create_file(BASE_PATH / f"the welcome center/kitchen/dishwasher/fork_00{prefix}{i}")
-    for i in range(15, 26):
-        prefix = "0" if i < 10 else ""
-        if random.random() < clean_chance:
-            create_file(BASE_PATH / f"the welcome center/kitchen/cabinet/drawer/utensil tray/spoons/spoon_00{prefix}{i}")
-        else:
-            create_file(BASE_PATH / f"the welcome center/kitchen/dishwasher/spoon_00{prefix}{i}")
-    for i in range(7, 14):
-        prefix = "0" if i < 10 else ""
-        if random.random() < clean_chance:
-            create_file(BASE_PATH / f"the welcome center/kitchen/cabinet/drawer/utensil tray/knives/knife_00{prefix}{i}")
-        else:
-            create_file(BASE_PATH / f"the welcome center/kitchen/dishwasher/knife_00{prefix}{i}")
-    shelf_paths = [
-        "kitchen/cabinet/top shelf",
-        "kitchen/cabinet/middle shelf",
-        "kitchen/cabinet/bottom shelf",
-    ]
-    for shelf in shelf_paths:
-        create_directory(BASE_PATH / f"the welcome center/{shelf}")
-    for i in range(15, 32):
-        prefix = "0" if i < 10 else ""
-        if random.random() < clean_chance:
-            create_file(BASE_PATH / f"the welcome center/kitchen/cabinet/top shelf/cup_00{prefix}{i}")
-        else:
-            create_file(BASE_PATH / f"the welcome center/kitchen/dishwasher/cup_00{prefix}{i}")
-    for i in range(1, 13):
-        prefix = "0" if i < 10 else ""
-        if random.random() < clean_chance:
-            create_file(BASE_PATH / f"the welcome center/kitchen/cabinet/middle shelf/large_plate_00{prefix}{i}")
-        else:
-            create_file(BASE_PATH / f"the welcome center/kitchen/dishwasher/large_plate_00{prefix}{i}")
-        if random.random() < clean_chance:
-            create_file(BASE_PATH / f"the welcome center/kitchen/cabinet/middle shelf/small_plate_00{prefix}{i}")
-        else:
-            create_file(BASE_PATH / f"the welcome center/kitchen/dishwasher/small_plate_00{prefix}{i}")
-    for i in range(1, 9):
-        prefix = "0" if i < 10 else ""
-        if random.random() < clean_chance:
-            create_file(BASE_PATH / f"the welcome center/kitchen/cabinet/bottom shelf/bowl_00{prefix}{i}")
-        else:
-            create_file(BASE_PATH / f"the welcome center/kitchen/dishwasher/bowl_00{prefix}{i}")
+    for op in plan_objects(LOCATIONS_PHASE, base_path.as_posix(), objects, SEED):
+        create_file(Path(op.path), op.contents)
 
-def create_locations():
-    for location in LOCATIONS:
-        sidewalk = MAP_CONTENTS / location["block_location"]
-        building = MAP_CONTENTS / location["block_location"] / location["address"]
-        create_file(building / location["marker"])
-        create_symlink(sidewalk, building / location["exit_name"])
-        create_objects(building, location["objects"])
-
-def show_progress_bar(description, length):
-    with tqdm(total=length, desc=description, bar_format="{l_bar:35}{bar:50}", ascii=True) as pbar:
-        for i in range(length):
-            time.sleep(0.015)
-            pbar.update(1)
+def setup_welcome_center(plan: Iterable[Operation] = None):
+    """Link the welcome center to different locations in the folder city."""
+    apply_phase(plan, WELCOME_CENTER)
+
+def create_locations(plan: Iterable[Operation] = None):
+    """Construct the buildings from LOCATIONS."""
+    apply_phase(plan, LOCATIONS_PHASE)
+
+@contextmanager
+def build_phase(name: str, description: str, total: int = None) -> Iterable[PhaseRecord]:
+    """Measure a phase and show a progress bar driven by the ops the materializer actually does."""
+    if not sys.stderr.isatty():
+        # tqdm would leave the bar out (disable=None), so don't wait for it to load either
+        with STATS.phase(name) as record:
+            yield record
+        return
+    from tqdm import tqdm
+    with STATS.phase(name) as record, tqdm(total=total, desc=description, bar_format="{l_bar:35}{bar:50} {n_fmt}/{total_fmt}", ascii=True, disable=None) as pbar:
+        MATERIALIZER.progress = pbar.update
+        try:
+            yield record
+        finally:
+            MATERIALIZER.progress = None
+
+def phase_totals(plan: Iterable[Operation]) -> Dict[str, int]:
+    """The number of operations in each phase of a plan, for the progress bars."""
+    summary = summarize_plan(plan)
+    return {phase: sum(summary.get(phase, {}).values()) for phase in PHASES}
 
 # print each character of the banner, line by line
-def print_banner_by_char():
+def print_banner_by_char(delay: float = 0.01):
     banner = """ _______       __    __             _______ __ __         
 |   _   .-----|  .--|  .-----.----.|   _   |__|  |_.--.--.
 |.  1___|  _  |  |  _  |  -__|   _||.  1___|  |   _|  |  |
@@ -299,30 +291,511 @@ def print_banner_by_char():
 `---'                              `-------'              """
     for char in banner:
         print(char, end='', flush=True)
-        if not char == ' ':
-            time.sleep(0.01)  # Adjust the speed of printing each character
+        if delay and not char == ' ':
+            time.sleep(delay)  # Adjust the speed of printing each character
     print() # new line at the end
 
 
-if __name__ == "__main__":
-    print_banner_by_char()
+def virtual_city() -> VirtualCity:
+    """The city as an in-memory model, built from the same definitions as the plan."""
+    return VirtualCity(MAP_CONTENTS_DIR, GRID, itertools.chain(plan_welcome_center(MAP_CONTENTS_DIR, SEED), plan_locations(MAP_CONTENTS_DIR, LOCATIONS, ADDRESSES, SEED)))
 
-    # Run setup functions
-    show_progress_bar("Initializing", random.randint(25, 75))
-    # reset_map_contents()
-
-    show_progress_bar("Paving the roads", random.randint(25, 75))
-    setup_streets_and_avenues()
-
-    show_progress_bar("Setting up navigation", random.randint(25, 75))
-    setup_navigation()
+def discover_locations() -> List[Dict]:
+    """
+    Location records for the buildings people made by hand in the built city, i.e.
+    folders under a block that aren't in LOCATIONS. The scan is incremental: its
+    cache is kept in the map contents, and only directories that changed are listed.
+    """
+    if not MAP_CONTENTS.exists():
+        return []
+    scanner = DiscoveryScanner(MAP_CONTENTS).load()
+    records = scanner.scan()
+    scanner.save()
+    return hand_made(records)
+
+def hand_made(records: List[Dict]) -> List[Dict]:
+    """The discovered location records that aren't one of LOCATIONS."""
+    planned = {(ADDRESSES.location_block(location), location["address"]) for location in LOCATIONS}
+    return [record for record in records if (record["block_location"], record["folder"]) not in planned]
+
+def draw_city_map(discovered: List[Dict], tiles: bool, map_format: str = "png") -> Dict[str, int]:
+    """Draw the map of LOCATIONS and the discovered locations, as tiles, one png, svg or text. Returns the tile counts and bytes written."""
+    if map_format == "png" and not tiles and importlib.util.find_spec("matplotlib") is None:
+        print("matplotlib isn't installed, drawing the map as svg")
+        map_format = "svg"
+    if map_format != "png":
+        # Drawn by hand without matplotlib or NumPy, in milliseconds
+        from map_render import draw_light_map
+        return {"bytes": draw_light_map(BASE_PATH, itertools.chain(LOCATIONS, discovered), GRID, ADDRESSES, map_format)}
+    # matplotlib is slow to import, so only load it when drawing a png
+    if tiles:
+        # One png of a huge grid is slow to draw and useless to look at, so draw tiles,
+        # and only the ones whose contents changed since the last build
+        from map_tiles import draw_tiles
+        return draw_tiles(BASE_PATH, itertools.chain(LOCATIONS, discovered), GRID, ADDRESSES)
+    from map_plot import draw_map
+    draw_map(BASE_PATH, itertools.chain(LOCATIONS, discovered), GRID, ADDRESSES)
+    map_path = BASE_PATH / "the welcome center" / "frammed_map.png"
+    return {"bytes": map_path.stat().st_size if map_path.exists() else 0}
+
+def watch_city(tiles: bool, polling: bool = False, map_format: str = "png"):
+    """
+    Keep the map up to date while people build in the city, until interrupted.
+    Watches the road, block and building folders, and after each burst of changes
+    rescans only the blocks they were in and redraws the map if a building was
+    added, moved, removed or changed.
+    """
+    from watcher import Inotify, open_watcher, subdirectories, watch
+    map_contents = os.fspath(MAP_CONTENTS)
+    scanner = DiscoveryScanner(MAP_CONTENTS).load()
+    scanner.scan()
+    scanner.save()
+    paths = [os.path.join(map_contents, folder) for folder in ("horizontals", "verticals")]
+    for road_path, (_, _, blocks) in scanner.roads.items():
+        paths.append(os.path.join(map_contents, road_path))
+        for block, (_, _, buildings) in blocks.items():
+            paths.append(os.path.join(map_contents, road_path, block))
+            paths.extend(os.path.join(map_contents, road_path, block, folder) for folder in buildings)
+    watcher = open_watcher(paths, polling)
+    drawn = hand_made(scanner.records())
+    draw_city_map(drawn, tiles, map_format)
+    print(f"watching {len(paths):,} folders with {'inotify' if isinstance(watcher, Inotify) else 'polling'}, "
+          f"{len(drawn)} locations built by hand (ctrl-c to stop)")
+
+    def on_change(changed):
+        begin = time.perf_counter()
+        blocks = set()
+        for path in changed if changed is not None else ():
+            parts = os.path.relpath(path, map_contents).split(os.sep)
+            if len(parts) < 3 or parts[0] == os.pardir:
+                changed = None  # a road itself changed, look at everything
+                break
+            blocks.add("/".join(parts[:3]))
+        records = scanner.scan() if changed is None else scanner.rescan(blocks)
+        # New buildings (and blocks) get watched too, so changes inside them are seen
+        for block in blocks:
+            block_path = os.path.join(map_contents, block)
+            for path in subdirectories(block_path):
+                watcher.add(path)
+        discovered = hand_made(records)
+        scanner.save()
+        nonlocal drawn
+        if discovered == drawn:
+            return
+        before = {(record["block_location"], record["folder"]) for record in drawn}
+        after = {(record["block_location"], record["folder"]) for record in discovered}
+        draw_city_map(discovered, tiles, map_format)
+        drawn = discovered
+        print(f"map updated: {len(after - before)} added, {len(before - after)} removed, "
+              f"{len(after & before)} kept ({time.perf_counter() - begin:.2f}s)")
+
+    try:
+        watch(watcher, on_change)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.close()
+
+def city_places(discovered: List[Dict] = ()) -> Dict[str, str]:
+    """The named places of the city (the welcome center, LOCATIONS and any discovered ones) and their paths."""
+    places = {"the welcome center": "the welcome center"}
+    for location in LOCATIONS:
+        block = ADDRESSES.location_block(location)
+        if block is None:
+            continue  # not on this grid
+        places[location["name"]] = f"{MAP_CONTENTS_DIR}/{block}/{location['address']}"
+    for location in discovered:
+        places.setdefault(location["name"], f"{MAP_CONTENTS_DIR}/{location['block_location']}/{location['folder']}")
+    return places
+
+def city_router(scan: bool = False) -> Router:
+    """A router over the planned city, or over the tree on disk with scan."""
+    return Router(DiskCity(BASE_PATH) if scan else virtual_city(), MAP_CONTENTS_DIR, GRID)
+
+def print_route(router: Router, origin: str, destination: str, places: Dict[str, str] = None):
+    places = places or city_places()
+    start = find_place(origin, places, MAP_CONTENTS_DIR, ADDRESSES)
+    goal = find_place(destination, places, MAP_CONTENTS_DIR, ADDRESSES)
+    begin = time.perf_counter()
+    steps = router.route(start, goal)
+    elapsed = (time.perf_counter() - begin) * 1000
+    if steps is None:
+        print(f"no way from {origin} to {destination}")
+        return
+    print(f"from {origin} to {destination}: {len(steps)} steps ({elapsed:.2f} ms)")
+    for number, (name, _) in enumerate(steps, 1):
+        print(f"{number:>4}. {name}")
+
+def print_distances(router: Router, cache: bool = True, places: Dict[str, str] = None):
+    places = places or city_places()
+    cache_path = str(MAP_CONTENTS / ROUTE_TABLE_NAME) if cache and MAP_CONTENTS.exists() else None
+    distances = router.distance_table(places, cache_path)
+    width = max(len(name) for name in places)
+    print(" " * (width + 4) + "  ".join(f"{column:>4}" for column in range(1, len(places) + 1)))
+    for row_number, a in enumerate(places, 1):
+        row = "  ".join(f"{'-' if distances[a][b] is None else distances[a][b]:>4}" for b in places)
+        print(f"{row_number:>2}. {a:<{width}}  {row}")
+
+def search_city(discovered: List[Dict] = (), index: SearchIndex = None) -> SearchIndex:
+    """
+    Bring the search index up to date with the plan and the buildings people made:
+    the welcome center, every location and every road are one source each, and only
+    sources whose paths changed since the last build are indexed again.
+    """
+    index = index or SearchIndex()
+    sources = {"the welcome center": (WELCOME_CENTER_DIR, source_paths(WELCOME_CENTER_DIR, plan_welcome_center(MAP_CONTENTS_DIR, SEED)))}
+    for location in LOCATIONS:
+        block = ADDRESSES.location_block(location)
+        if block is None:
+            continue  # not on this grid
+        building = f"{MAP_CONTENTS_DIR}/{block}/{location['address']}"
+        sources[building] = (building, source_paths(building, plan_locations(MAP_CONTENTS_DIR, [location], ADDRESSES, SEED)))
+    for folder, names, numbers in (("horizontals", GRID.street_names(), GRID.street_number), ("verticals", GRID.avenue_names(), GRID.avenue_number)):
+        for road in names:
+            road_path = f"{MAP_CONTENTS_DIR}/{folder}/{road} blocks"
+            sources[road_path] = (f"{road_path}/{numbers(0)} {road}", [road_path])  # routes go to its first block
+    for record in discovered:
+        building = f"{MAP_CONTENTS_DIR}/{record['block_location']}/{record['folder']}"
+        # Everything inside it, folders in folders too
+        names = [obj["path"] for obj in record["objects"]] + record.get("folders", []) + ([record["marker"]] if record["marker"] else [])
+        sources.setdefault(building, (building, [building] + sorted(f"{building}/{name}" for name in names)))
+    for source, (place, paths) in sources.items():
+        index.update(source, place, paths)
+    index.prune(sources)
+    return index
+
+def print_matches(query: str, index: SearchIndex, router: Router, limit: int = MAX_FIND_RESULTS):
+    """Print what the query found, with the full path and the way there from the welcome center."""
+    begin = time.perf_counter()
+    matches = index.search(query, ADDRESSES)
+    elapsed = (time.perf_counter() - begin) * 1000
+    print(f"{query}: {len(matches)} found ({elapsed:.2f} ms)")
+    for match in matches[:limit]:
+        # Routes go as far as the navigation graph does (a location or block), then it's folders to open
+        goal = match.place
+        steps = router.route(WELCOME_CENTER_DIR, goal)
+        while steps is None and "/" in goal:
+            goal = goal.rpartition("/")[0]
+            steps = router.route(WELCOME_CENTER_DIR, goal)
+        rest = match.path[len(goal) + 1:].split("/") if match.path.startswith(goal + "/") else []
+        way = [name for name, _ in steps or ()] + rest
+        print(f"  {match.path.rpartition('/')[2]}")
+        print(f"    {BASE_PATH / match.path}")
+        print(f"    {' > '.join(way) if way else 'right here in the welcome center'}")
+    if len(matches) > limit:
+        print(f"  ... and {len(matches) - limit} more")
+
+def living_city() -> "Simulation":
+    """Everything in the city that changes over time: the welcome center's dishes and the stock of LOCATIONS."""
+    from simulation import Simulation
+    simulation = Simulation(BASE_PATH, MAP_CONTENTS, SEED, MATERIALIZER.threads, MATERIALIZER.batch_size)
+    simulation.add_dishes()
+    for location in LOCATIONS:
+        block = ADDRESSES.location_block(location)
+        if block is None:
+            continue  # not on this grid
+        simulation.add_objects(f"{MAP_CONTENTS_DIR}/{block}/{location['address']}", location["objects"])
+    return simulation
+
+def print_catalog_problems(limit: int = MAX_CATALOG_PROBLEMS_SHOWN):
+    """List the catalog records that were skipped for not fitting the location schema."""
+    problems = list(LOCATIONS.problems)
+    if not problems:
+        return
+    print(f"{len(problems)} catalog records skipped:")
+    for problem in problems[:limit]:
+        print(f"  {problem}")
+    if len(problems) > limit:
+        print(f"  ... and {len(problems) - limit} more")
+
+def print_tick(tick: "Tick"):
+    missed = f", {tick.missed} missed" if tick.missed else ""
+    print(f"tick {tick.number}: {tick.moved} moved, {tick.made} made, {tick.removed} removed{missed} ({tick.seconds * 1000:.1f} ms)")
+
+def verify_city(streaming: bool = False, fix: bool = False):
+    """
+    Compare the city on disk with its plan and print what drifted: missing, extra,
+    broken and misdirected entries. With fix, put back only what is missing or points
+    the wrong way; nothing is ever deleted.
+    """
+    from integrity import IntegrityChecker, PROBLEMS, repair, summarize_drift
+    from simulation import SIMULATION_STATE_NAME
+    plan = itertools.chain(*stream_city_plan()) if streaming else build_city_plan()
+    # The drawn map isn't in the plan, but it belongs there
+    welcome_center = WELCOME_CENTER_DIR
+    ignore = [f"{welcome_center}/{name}" for name in ("frammed_map.png", "frammed_map.svg", "frammed_map.txt", "map tiles")]
+    if (MAP_CONTENTS / SIMULATION_STATE_NAME).exists():
+        # Once the city has lived, its dishes and stock are wherever the simulation put them
+        simulation = living_city()
+        living = set(simulation.paths())
+        plan = (op for op in plan if op.path not in living)
+        ignore.extend(living.union(simulation.folders))
+    checker = IntegrityChecker(MATERIALIZER.threads, MATERIALIZER.batch_size)
+    drift = checker.check(plan, BASE_PATH, [welcome_center], ignore)
+    counts = summarize_drift(drift)
+    print(f"checked {checker.counts['checked']:,} planned entries and {checker.counts['scanned']:,} folders in {checker.seconds:.2f}s: "
+          + ", ".join(f"{count:,} {problem}" for problem, count in counts.items()))
+    for problem in PROBLEMS:
+        paths = [item.path for item in drift if item.problem == problem]
+        for path in paths[:MAX_DRIFT_SHOWN]:
+            print(f"  {problem:<13} {path}")
+        if len(paths) > MAX_DRIFT_SHOWN:
+            print(f"  {problem:<13} ... and {len(paths) - MAX_DRIFT_SHOWN:,} more")
+    if fix:
+        done = repair(drift, BASE_PATH, MATERIALIZER)
+        print(f"repaired: {done['created']:,} created, {done['relinked']:,} relinked (extras and entries of the wrong kind are left alone)")
+
+def print_plan_summary(plan: Iterable[Operation], show_changes: bool = True):
+    """Print how many operations the plan has, per phase and kind."""
+    total = 0
+    for phase, counts in summarize_plan(plan).items():
+        details = ", ".join(f"{count} {kind}" for kind, count in counts.items())
+        print(f"{phase:<20} {sum(counts.values()):>6} ops ({details})")
+        total += sum(counts.values())
+    print(f"{'total':<20} {total:>6} ops")
+    if show_changes:
+        changes = plan_changes(plan)
+        print(f"since the last build: {len(changes.build) - len(changes.replace)} to create, {len(changes.replace)} to update, {len(changes.remove)} to remove")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Build the folder city.")
+    parser.add_argument("--catalog", action="append", default=[], metavar="PATH", help="also build the locations of a JSON Lines file (one location a line) or a folder of .json and .jsonl files; can be given more than once")
+    parser.add_argument("--dry-run", action="store_true", help="compile the build plan and print how many operations it has, without touching the disk")
+    parser.add_argument("--full", action="store_true", help="ignore the manifest of the previous build and check every path")
+    parser.add_argument("--width", type=int, default=len(AVENUE_NAMES), help=f"number of avenues, i.e. blocks per street (default: {len(AVENUE_NAMES)})")
+    parser.add_argument("--height", type=int, default=len(STREET_NAMES), help=f"number of streets, i.e. blocks per avenue (default: {len(STREET_NAMES)})")
+    parser.add_argument("--seed", type=int, help="seed for the objects in the city; the same seed always gives the same city (default: the last build's, or a new one)")
+    parser.add_argument("--stream", action="store_true", help=f"stream the plan straight to the disk with bounded memory (automatic above {STREAMING_THRESHOLD} intersections)")
+    parser.add_argument("--walk", action="store_true", help="walk around a virtual copy of the city in an interactive shell, without building anything")
+    parser.add_argument("--route", nargs=2, metavar=("FROM", "TO"), help="print the shortest way between two places (names, addresses, intersections or blocks)")
+    parser.add_argument("--distances", action="store_true", help="print the distances between all named places, cached on disk")
+    parser.add_argument("--scan", action="store_true", help="route over the city built on disk instead of the plan, including the places people built")
+    parser.add_argument("--find", metavar="QUERY", help="find objects, markers, places and roads by name, with the way to each, from the search index of the last build")
+    parser.add_argument("--discover", action="store_true", help="list the locations people built by hand in the city")
+    parser.add_argument("--watch", action="store_true", help="keep the map up to date while people build in the city, until interrupted")
+    parser.add_argument("--poll", action="store_true", help="with --watch, poll the folders instead of using inotify")
+    parser.add_argument("--export", metavar="FILE", help="write the city as a tar or zip archive instead of building it on disk (- for stdout)")
+    parser.add_argument("--import", dest="import_from", metavar="FILE", help="unpack a city archive made with --export (- for stdin)")
+    parser.add_argument("--format", choices=sorted(FORMATS), help="archive format for --export/--import (default: from the file extension, else tar)")
+    parser.add_argument("--verify", action="store_true", help="check the built city against its plan and list what is missing, extra, broken or pointing the wrong way")
+    parser.add_argument("--repair", action="store_true", help="like --verify, then make what is missing again and fix the links that point the wrong way, without deleting anything")
+    parser.add_argument("--simulate", type=int, metavar="TICKS", help="bring the built city to life: dishes get used and washed, stock sold and restocked, trash piles up (0 runs until interrupted)")
+    parser.add_argument("--tick", type=float, metavar="SECONDS", help="with --simulate, seconds per tick, 0 for as fast as possible (default: the simulation's, one a second)")
+    parser.add_argument("--relink", action="store_true", help="rewrite the links of a city built with absolute links as relative ones, so it can be moved")
+    parser.add_argument("--fresh", action="store_true", help="build a whole new city next to the live one and swap it in at once, keeping the buildings people made; the old one is deleted in the background")
+    parser.add_argument("--empty-trash", action="store_true", help=argparse.SUPPRESS)  # the background teardown
+    parser.add_argument("--share-inodes", action="store_true", help=f"make files with the same contents hard links to one shared inode (kept in the map contents' '{INODE_POOL_DIR}'), so a big city needs far fewer inodes")
+    parser.add_argument("--workers", type=int, default=1, help="processes that build the streets, avenues and navigation in parallel, one district of the grid at a time (implies --stream)")
+    parser.add_argument("--threads", type=int, default=DEFAULT_THREADS, help=f"filesystem worker threads (default: {DEFAULT_THREADS})")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help=f"operations per worker batch (default: {DEFAULT_BATCH_SIZE})")
+    parser.add_argument("--tiles", action="store_true", help="draw the map as zoomable tiles with an index.html viewer instead of one big png (automatic when streaming)")
+    parser.add_argument("--map", choices=MAP_FORMATS, default="png", help="draw the map as a png with matplotlib, or as svg or text without it, which is much quicker (default: png)")
+    parser.add_argument("--stats", metavar="FILE", help="write the time, ops, bytes and memory of every build phase to a JSON file")
+    return parser.parse_args()
 
-    show_progress_bar("Planning the Welcome Center", random.randint(25, 75))
-    setup_welcome_center()
 
-    show_progress_bar("Constructing buildings", random.randint(25, 75))
-    create_locations()
+if __name__ == "__main__":
+    args = parse_args()
+    if args.empty_trash:
+        from generations import empty_trash, lower_priority
+        lower_priority()
+        empty_trash(BASE_PATH)
+        sys.exit(0)
+    for source in args.catalog:
+        if not os.path.exists(source):
+            sys.exit(f"there is no catalog at {source}")
+        LOCATIONS.add(source)
+    GRID = make_grid(args.width, args.height)
+    ADDRESSES = AddressIndex(GRID)
+    # Rebuilds keep the seed of the last build, so only real changes show up in the diff
+    SEED = args.seed if args.seed is not None else manifest_seed(MAP_CONTENTS)
+    if SEED is None:
+        SEED = random.randrange(2 ** 32)
+    streaming = args.stream or args.workers > 1 or GRID.intersections > STREAMING_THRESHOLD
+    # Big streamed cities get tiles instead of one png, unless another kind of map was asked for
+    tiles = args.tiles or (streaming and args.map == "png")
+
+    if args.dry_run:
+        if streaming:
+            print_plan_summary(itertools.chain(*stream_city_plan()), show_changes=False)
+        else:
+            print_plan_summary(build_city_plan())
+        print_catalog_problems()
+        sys.exit(0)
+
+    if args.walk:
+        CityShell(virtual_city()).cmdloop()
+        sys.exit(0)
+
+    if args.discover:
+        begin = time.perf_counter()
+        discovered = discover_locations()
+        elapsed = time.perf_counter() - begin
+        for location in discovered:
+            print(f"{location['name']:<30} {location['block_location']}/{location['folder']}")
+        print(f"{len(discovered)} locations built by hand ({elapsed * 1000:.1f} ms)")
+        sys.exit(0)
+
+    if args.watch:
+        if not MAP_CONTENTS.exists():
+            sys.exit("build the city before watching it")
+        watch_city(tiles, args.poll, args.map)
+        sys.exit(0)
+
+    if args.find:
+        # The index of the last build, or one made from the plan when nothing is built
+        index = SearchIndex(MAP_CONTENTS).load() if MAP_CONTENTS.exists() else SearchIndex()
+        print_matches(args.find, index if index.sources else search_city(), city_router())
+        sys.exit(0)
+
+    if args.route or args.distances:
+        router = city_router(args.scan)
+        # Buildings made by hand only exist on disk, so only a scanned city can route to them
+        places = city_places(discover_locations() if args.scan else ())
+        if args.distances:
+            print_distances(router, cache=not args.scan, places=places)
+        if args.route:
+            print_route(router, *args.route, places=places)
+        sys.exit(0)
+
+    if args.export:
+        # Stream every phase straight into the archive, nothing touches the disk
+        count = export_archive(itertools.chain(*stream_city_plan()), args.export, args.format, SEED)
+        print(f"exported {count} entries", file=sys.stderr)
+        sys.exit(0)
+
+    MATERIALIZER.threads = args.threads
+    MATERIALIZER.batch_size = args.batch_size
+    if args.share_inodes:
+        MATERIALIZER.inode_pool = InodePool(MAP_CONTENTS / INODE_POOL_DIR)
+
+    if args.relink:
+        if not MAP_CONTENTS.exists():
+            sys.exit("there is no city here to relink")
+        count = relink_city(streaming)
+        print(f"{count} links made relative")
+        print(MATERIALIZER.report())
+        sys.exit(0)
+
+    if args.verify or args.repair:
+        if not MAP_CONTENTS.exists():
+            sys.exit("there is no city here to verify")
+        verify_city(streaming, fix=args.repair)
+        if args.repair:
+            print(MATERIALIZER.report())
+        sys.exit(0)
+
+    if args.simulate is not None:
+        if not MAP_CONTENTS.exists():
+            sys.exit("build the city before bringing it to life")
+        simulation = living_city().load()
+        print(f"{len(simulation):,} things living in {len(simulation.folders):,} folders"
+              + (f", {simulation.counts['lost']:,} gone missing" if simulation.counts["lost"] else ""))
+        import asyncio
+        from simulation import DEFAULT_TICK_SECONDS
+        try:
+            asyncio.run(simulation.run(args.simulate, args.tick if args.tick is not None else DEFAULT_TICK_SECONDS, print_tick))
+        except KeyboardInterrupt:
+            pass
+        sys.exit(0)
+
+    if args.import_from:
+        with ArchiveReader(args.import_from, args.format) as archive:
+            # The city's random objects came from the seed of the export, later rebuilds have to keep it
+            if archive.seed is None and args.seed is None:
+                sys.exit("this archive doesn't say which seed its city was built with, give it with --seed")
+            if archive.seed is not None and args.seed is not None and archive.seed != args.seed:
+                sys.exit(f"this archive was built with --seed {archive.seed}, not {args.seed}")
+            with ManifestRecorder(MAP_CONTENTS, archive.seed if archive.seed is not None else args.seed) as recorder:
+                apply_operations(recorder.record(archive.operations()))
+        print(MATERIALIZER.report())
+        sys.exit(0)
+
+    if args.fresh:
+        # Build the next generation in a staging copy of the base path, the live city
+        # stays as it is until it is swapped out at the end
+        from generations import new_stage
+        carried = discover_locations()
+        live_base = BASE_PATH
+        BASE_PATH = Path(new_stage(live_base))
+        MAP_CONTENTS = BASE_PATH / MAP_CONTENTS_DIR
+        MATERIALIZER.forget()
+        if args.share_inodes:
+            MATERIALIZER.inode_pool = InodePool(MAP_CONTENTS / INODE_POOL_DIR)
+
+    if streaming:
+        # Stream every phase straight to the disk, recording the manifest on the way
+        recorder = ManifestRecorder(MAP_CONTENTS, SEED)
+        streets, navigation, welcome_center, locations = (recorder.record(ops) for ops in stream_city_plan())
+        totals = dict.fromkeys(PHASES)  # unknown until the stream has been read
+    else:
+        # Only build what changed since the last build, unless asked to check everything
+        plan = build_city_plan()
+        work = plan
+        if not args.full:
+            changes = plan_changes(plan)
+            with STATS.phase("remove_changed"):
+                MATERIALIZER.remove(changes.replace + changes.remove, BASE_PATH)
+            work = changes.build
+        streets = navigation = welcome_center = locations = work
+        totals = phase_totals(work)
+
+    print_banner_by_char(0.01 if INTERACTIVE else 0)
 
-    show_progress_bar("Drawing the map", random.randint(25, 75))
-    draw_map(BASE_PATH, LOCATIONS, STREET_NAMES, AVENUE_NAMES, STREET_NUMBERS, AVENUE_NUMBERS)
+    # Run setup functions
+    # reset_map_contents()
 
+    if args.workers > 1:
+        # Worker processes build the roads and their links district by district, the
+        # streets and navigation streams above are left unread
+        from districts import build_districts
+        with build_phase("build_districts", f"Building districts with {args.workers} workers"):
+            build_districts(BASE_PATH, MAP_CONTENTS_DIR, GRID, args.workers, MATERIALIZER, recorder, STREAMING_MAX_SEEN)
+    else:
+        with build_phase("setup_streets_and_avenues", "Paving the roads", totals[STREETS_AND_AVENUES]):
+            setup_streets_and_avenues(streets)
+
+        with build_phase("setup_navigation", "Setting up navigation", totals[NAVIGATION]):
+            setup_navigation(navigation)
+
+    with build_phase("setup_welcome_center", "Planning the Welcome Center", totals[WELCOME_CENTER]):
+        setup_welcome_center(welcome_center)
+
+    with build_phase("create_locations", "Constructing buildings", totals[LOCATIONS_PHASE]):
+        create_locations(locations)
+
+    if streaming:
+        with STATS.phase("remove_changed"):
+            remove_stale(recorder)
+
+    with build_phase("draw_map", "Drawing the map", 1) as record:
+        if args.fresh:
+            # The buildings people made are still in the live city, the ones on a block the new city has are moved over
+            discovered = [location for location in carried if (MAP_CONTENTS / location["block_location"]).is_dir()]
+        else:
+            discovered = discover_locations()
+        drawn = draw_city_map(discovered, tiles, args.map)
+        record.bytes_written += drawn["bytes"]
+        if MATERIALIZER.progress:
+            MATERIALIZER.progress(1)
+
+    with STATS.phase("index_search"):
+        search_city(discovered, SearchIndex(MAP_CONTENTS).load()).save()
+
+    if streaming:
+        recorder.close()
+    else:
+        write_manifest(MAP_CONTENTS, plan, SEED)
+    if args.fresh:
+        with STATS.phase("swap"):
+            moved = swap_in_city(live_base, discovered)
+        BASE_PATH, MAP_CONTENTS = live_base, live_base / MAP_CONTENTS_DIR
+        MATERIALIZER.forget()
+        print(f"new city swapped in, {moved} buildings moved over")
+    print(MATERIALIZER.report())
+    if tiles:
+        print(f"map tiles: {drawn['drawn']} drawn, {drawn['kept']} unchanged, {drawn['removed']} removed")
+    print_catalog_problems()
+    print(STATS.report())
+    if args.stats:
+        STATS.write_json(args.stats)
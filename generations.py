@@ -0,0 +1,122 @@
+import ctypes
+import ctypes.util
+import os
+import shutil
+import subprocess
+import sys
+import uuid
+from typing import List, Optional
+
+STAGING_DIR = ".folder city staging"  # next to the live city, so the swap is a rename on the same filesystem
+TRASH_DIR = ".folder city trash"
+
+# From <linux/fs.h> and <fcntl.h>
+RENAME_EXCHANGE = 2
+AT_FDCWD = -100
+# From <linux/ioprio.h>, for ioprio_set, which libc has no wrapper for
+IOPRIO_SET_X86_64 = 251
+IOPRIO_WHO_PROCESS = 1
+IOPRIO_CLASS_IDLE = 3
+IOPRIO_CLASS_SHIFT = 13
+
+
+def _renameat2():
+    """libc's renameat2, or None where there is no such call (not Linux, or glibc before 2.28)."""
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        function = libc.renameat2
+    except (OSError, AttributeError):
+        return None
+    function.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_int, ctypes.c_char_p, ctypes.c_uint]
+    return function
+
+
+RENAMEAT2 = _renameat2()
+
+
+def new_stage(base_path) -> str:
+    """
+    An empty staging base path for a new generation of the city, with the same
+    layout as the base path. Whatever an interrupted build left there goes to the trash.
+    """
+    stage = os.path.join(os.fspath(base_path), STAGING_DIR)
+    if os.path.lexists(stage):
+        move_to_trash(stage, base_path)
+    os.mkdir(stage)
+    return stage
+
+
+def exchange(live: str, staged: str) -> bool:
+    """
+    Swap two paths in one atomic rename, so the live path is always either the
+    old or the new generation. Returns False where the kernel can't exchange (or
+    nothing is live yet); then staged is renamed over live, after live was moved
+    aside, leaving live missing for the moment in between.
+    """
+    if RENAMEAT2 is not None and os.path.lexists(live):
+        if RENAMEAT2(AT_FDCWD, os.fsencode(live), AT_FDCWD, os.fsencode(staged), RENAME_EXCHANGE) == 0:
+            return True
+    if os.path.lexists(live):
+        aside = f"{staged}.old"
+        os.rename(live, aside)
+        os.rename(staged, live)
+        os.rename(aside, staged)
+    else:
+        os.rename(staged, live)
+    return False
+
+
+def move_to_trash(path: str, base_path) -> str:
+    """Rename a tree into the trash, where the teardown worker deletes it. Returns where it went."""
+    trash = os.path.join(os.fspath(base_path), TRASH_DIR)
+    os.makedirs(trash, exist_ok=True)
+    destination = os.path.join(trash, uuid.uuid4().hex)
+    os.rename(path, destination)
+    return destination
+
+
+def empty_trash(base_path) -> int:
+    """Delete everything in the trash, including what earlier teardowns didn't finish. Returns how many trees were removed."""
+    trash = os.path.join(os.fspath(base_path), TRASH_DIR)
+    try:
+        names = os.listdir(trash)
+    except OSError:
+        return 0
+    for name in names:
+        shutil.rmtree(os.path.join(trash, name), ignore_errors=True)
+    try:
+        os.rmdir(trash)
+    except OSError:
+        pass  # something new was thrown away meanwhile, the next teardown takes it
+    return len(names)
+
+
+def lower_priority():
+    """Give this process the lowest CPU priority, and on Linux the idle I/O class, so it only uses what nothing else wants."""
+    if hasattr(os, "nice"):
+        os.nice(19)
+    if sys.platform.startswith("linux") and os.uname().machine == "x86_64":
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+            libc.syscall(IOPRIO_SET_X86_64, IOPRIO_WHO_PROCESS, 0, IOPRIO_CLASS_IDLE << IOPRIO_CLASS_SHIFT)
+        except (OSError, AttributeError):
+            pass
+
+
+def start_teardown(command: List[str]) -> Optional[subprocess.Popen]:
+    """
+    Run command (one that calls lower_priority and empty_trash) in a detached process,
+    so deleting the old city doesn't hold anything up and carries on after the
+    build is done. Returns None if the process couldn't be started.
+    """
+    kwargs = {"stdin": subprocess.DEVNULL, "stdout": subprocess.DEVNULL, "stderr": subprocess.DEVNULL}
+    if os.name == "posix":
+        kwargs["start_new_session"] = True
+    else:
+        kwargs["creationflags"] = getattr(subprocess, "DETACHED_PROCESS", 0)
+    try:
+        return subprocess.Popen(command, **kwargs)
+    except OSError:
+        return None
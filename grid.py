@@ -0,0 +1,115 @@
+import re
+from typing import Iterator, List, Optional, Tuple
+
+BLOCK_SIZE = 100  # address numbers per block, e.g. "2000-2099"
+
+ORDINAL_ROAD = re.compile(r"^(\d+)(?:st|nd|rd|th) (\w+)$")
+
+
+def ordinal(n: int) -> str:
+    """1 -> "1st", 2 -> "2nd", 11 -> "11th", 23 -> "23rd"."""
+    if 10 <= n % 100 <= 20:
+        suffix = "th"
+    else:
+        suffix = {1: "st", 2: "nd", 3: "rd"}.get(n % 10, "th")
+    return f"{n}{suffix}"
+
+
+class Grid:
+    """
+    The street and avenue grid of a city.
+
+    Streets run east-west (y) and avenues run north-south (x). Every street has one
+    block per avenue and every avenue has one block per street, so a grid of
+    width x height has width * height intersections. The first roads use the given
+    names and the rest are generated ("8th St", "9th Ave", ...). Everything is
+    computed from indexes on demand, so even huge grids never build big lists.
+    """
+
+    def __init__(self, width: int, height: int,
+                 street_names: List[str] = (), avenue_names: List[str] = (),
+                 first_street_number: int = 1600, first_avenue_number: int = 100):
+        self.width = width    # number of avenues, and blocks per street
+        self.height = height  # number of streets, and blocks per avenue
+        self.base_street_names = list(street_names)
+        self.base_avenue_names = list(avenue_names)
+        self.first_street_number = first_street_number
+        self.first_avenue_number = first_avenue_number
+        self._street_indexes = {name: i for i, name in enumerate(self.base_street_names[:height])}
+        self._avenue_indexes = {name: i for i, name in enumerate(self.base_avenue_names[:width])}
+
+    def __repr__(self):
+        return f"Grid({self.width}x{self.height})"
+
+    @property
+    def intersections(self) -> int:
+        return self.width * self.height
+
+    # --- Names and numbers by index ---
+    def street_name(self, index: int) -> str:
+        if index < len(self.base_street_names):
+            return self.base_street_names[index]
+        return f"{ordinal(index + 1)} St"
+
+    def avenue_name(self, index: int) -> str:
+        if index < len(self.base_avenue_names):
+            return self.base_avenue_names[index]
+        return f"{ordinal(index + 1)} Ave"
+
+    def street_number(self, index: int) -> str:
+        """The address range of a street's index-th block, e.g. "1600-1699"."""
+        low = self.first_street_number + index * BLOCK_SIZE
+        return f"{low}-{low + BLOCK_SIZE - 1}"
+
+    def avenue_number(self, index: int) -> str:
+        """The address range of an avenue's index-th block, e.g. "100-199"."""
+        low = self.first_avenue_number + index * BLOCK_SIZE
+        return f"{low}-{low + BLOCK_SIZE - 1}"
+
+    # --- Lazy sequences ---
+    def street_names(self) -> Iterator[str]:
+        return (self.street_name(i) for i in range(self.height))
+
+    def avenue_names(self) -> Iterator[str]:
+        return (self.avenue_name(i) for i in range(self.width))
+
+    def street_numbers(self) -> Iterator[str]:
+        return (self.street_number(i) for i in range(self.width))
+
+    def avenue_numbers(self) -> Iterator[str]:
+        return (self.avenue_number(i) for i in range(self.height))
+
+    # --- Reverse lookups ---
+    def street_index(self, name: str) -> Optional[int]:
+        return self._road_index(name, "St", self._street_indexes, self.base_street_names, self.height)
+
+    def avenue_index(self, name: str) -> Optional[int]:
+        return self._road_index(name, "Ave", self._avenue_indexes, self.base_avenue_names, self.width)
+
+    @staticmethod
+    def _road_index(name, suffix, indexes, base_names, count) -> Optional[int]:
+        if name in indexes:
+            return indexes[name]
+        match = ORDINAL_ROAD.match(name)
+        if match is None or match.group(2) != suffix:
+            return None
+        index = int(match.group(1)) - 1
+        if len(base_names) <= index < count:
+            return index
+        return None
+
+    def street_block(self, number: int) -> Tuple[Optional[int], Optional[int], Optional[int]]:
+        """(index, low, high) of the street block containing an address number, or Nones."""
+        return self._block(number, self.first_street_number, self.width)
+
+    def avenue_block(self, number: int) -> Tuple[Optional[int], Optional[int], Optional[int]]:
+        """(index, low, high) of the avenue block containing an address number, or Nones."""
+        return self._block(number, self.first_avenue_number, self.height)
+
+    @staticmethod
+    def _block(number, first, count):
+        index = (number - first) // BLOCK_SIZE
+        if number < first or index >= count:
+            return None, None, None
+        low = first + index * BLOCK_SIZE
+        return index, low, low + BLOCK_SIZE - 1
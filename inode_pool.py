@@ -0,0 +1,97 @@
+import errno
+import hashlib
+import os
+import threading
+from typing import Dict, Optional
+
+INODE_POOL_DIR = ".inode pool"  # in the map contents, on the same filesystem as the city
+POOL_FILE_MODE = 0o444  # every link shares it, so writing to one file can't change the others
+
+# linkat with two directory fds isn't available everywhere, e.g. on Windows
+USE_DIR_FD = os.link in os.supports_dir_fd
+
+
+class InodePool:
+    """
+    One inode for each distinct contents of the city's files, which every file with
+    those contents is a hard link to, instead of an inode of its own.
+
+    Nearly every file of the city is empty (the markers, the paperclips, every
+    fork), so a whole city's files share a handful of inodes. The pool files are
+    named by the hash of their contents and made on first use; when one has as
+    many links as the filesystem allows (EMLINK, 65,000 on ext4), the next links
+    go to a new pool file for the same contents. Links are made with linkat from
+    the pool's directory fd into the directory fd of the batch they're in.
+    """
+
+    def __init__(self, path):
+        self.path = os.fspath(path)
+        self.linked = 0   # files made as links
+        self.created = 0  # pool files made, each an inode the links share
+        self._fd: Optional[int] = None
+        self._opened = False
+        self._current: Dict[str, int] = {}  # hash -> number of the pool file being linked to
+        self._lock = threading.Lock()
+
+    def link(self, dir_fd, name: str, data: bytes) -> Optional[bool]:
+        """
+        Make name (relative to dir_fd when there is one) a link to the pool file with
+        these contents. True if it was linked, False if something is already there,
+        None if it can't be linked (like on a filesystem without hard links), so it
+        has to be written.
+        """
+        digest = hashlib.blake2b(data, digest_size=16).hexdigest()
+        number = None
+        while True:
+            try:
+                number, source = self._pool_file(digest, data, after=number)
+                os.link(source, name, src_dir_fd=self._fd, dst_dir_fd=dir_fd)
+            except FileExistsError:
+                return False
+            except OSError as error:
+                if error.errno == errno.EMLINK:
+                    continue  # full, on to the next pool file
+                return None
+            with self._lock:
+                self.linked += 1
+            return True
+
+    def saved(self) -> int:
+        """Inodes the city didn't need: every link, less the pool files they share."""
+        return self.linked - self.created
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+        self._fd = None
+        self._opened = False
+
+    def _pool_file(self, digest: str, data: bytes, after: Optional[int] = None):
+        """
+        (number, path relative to the pool fd) of the pool file to link to for some
+        contents, a later one than after when that one is full.
+        """
+        with self._lock:
+            if not self._opened:
+                os.makedirs(self.path, exist_ok=True)
+                self._fd = os.open(self.path, os.O_RDONLY | getattr(os, "O_DIRECTORY", 0)) if USE_DIR_FD else None
+                self._opened = True
+            number = self._current.get(digest, 0)
+            if after is not None and number <= after:
+                number = after + 1
+            name = f"{digest}.{number}" if self._fd is not None else os.path.join(self.path, f"{digest}.{number}")
+            if self._current.get(digest) != number:
+                # Pool files are kept between builds, an existing one is used as it is
+                try:
+                    fd = os.open(name, os.O_WRONLY | os.O_CREAT | os.O_EXCL, POOL_FILE_MODE, dir_fd=self._fd)
+                except FileExistsError:
+                    pass
+                else:
+                    try:
+                        if data:
+                            os.write(fd, data)
+                    finally:
+                        os.close(fd)
+                    self.created += 1
+                self._current[digest] = number
+            return number, name
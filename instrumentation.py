@@ -0,0 +1,138 @@
+import json
+import os
+import sys
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+
+try:
+    import resource
+except ImportError:  # not available on Windows, where peak memory is left out
+    resource = None
+
+
+# Filesystem calls that raise an audit event (PEP 578), and os functions that don't but are counted by wrapping them
+AUDITED_CALLS = {"open", "os.mkdir", "os.symlink", "os.scandir", "os.listdir", "os.rename", "os.remove", "os.rmdir",
+                 "os.chmod", "os.utime", "os.truncate"}
+WRAPPED_CALLS = ("stat", "lstat", "readlink", "write", "close")
+_syscalls: List[int] = []  # the running count, once count_syscalls() was called
+
+
+def count_syscalls():
+    """
+    Start counting the filesystem calls of this process, wherever they come from,
+    so every phase measured afterwards records how many it made. Counting costs a
+    little time on every call, so only the benchmarks turn it on. Calls in other
+    processes (like district workers) aren't counted.
+    """
+    if _syscalls:
+        return
+    _syscalls.append(0)
+
+    def audit(event, args):
+        if event in AUDITED_CALLS:
+            _syscalls[0] += 1
+
+    def counted(function):
+        def call(*args, **kwargs):
+            _syscalls[0] += 1
+            return function(*args, **kwargs)
+        return call
+
+    sys.addaudithook(audit)
+    for name in WRAPPED_CALLS:
+        function = getattr(os, name)
+        wrapper = counted(function)
+        # Code checks these sets to pick dir_fd calls, so the wrappers must keep the same support
+        for supported in (os.supports_dir_fd, os.supports_fd, os.supports_follow_symlinks):
+            if function in supported:
+                supported.add(wrapper)
+        setattr(os, name, wrapper)
+
+
+def syscalls() -> Optional[int]:
+    """Filesystem calls counted so far, or None when count_syscalls() wasn't called."""
+    return _syscalls[0] if _syscalls else None
+
+
+def peak_rss() -> Optional[int]:
+    """Peak resident memory of this process so far, in bytes, or None where unknown."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024  # macOS reports bytes, Linux kilobytes
+
+
+class PhaseRecord:
+    """What one build phase did and what it cost."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.seconds = 0.0
+        self.ops: Dict[str, int] = {}
+        self.bytes_written = 0
+        self.syscalls: Optional[int] = None
+        self.peak_rss: Optional[int] = None
+
+    def as_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "seconds": round(self.seconds, 6),
+            "ops": self.ops,
+            "bytes_written": self.bytes_written,
+            "syscalls": self.syscalls,
+            "peak_rss": self.peak_rss,
+        }
+
+
+class Instrumentation:
+    """
+    Measures each phase of a build: wall time, filesystem ops by kind and bytes
+    written (taken from the materializer's counters) and the peak memory of the
+    process by the end of the phase.
+    """
+
+    def __init__(self, materializer):
+        self.materializer = materializer
+        self.phases: Dict[str, PhaseRecord] = {}
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[PhaseRecord]:
+        """Measure the work done inside the with block as the phase name."""
+        record = self.phases.setdefault(name, PhaseRecord(name))
+        counts = dict(self.materializer.counts)
+        written = self.materializer.bytes_written
+        calls = syscalls()
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record.seconds += time.perf_counter() - start
+            for kind, count in self.materializer.counts.items():
+                if count - counts.get(kind, 0):
+                    record.ops[kind] = record.ops.get(kind, 0) + count - counts.get(kind, 0)
+            record.bytes_written += self.materializer.bytes_written - written
+            if calls is not None:
+                record.syscalls = (record.syscalls or 0) + syscalls() - calls
+            record.peak_rss = peak_rss()
+
+    def as_dict(self) -> dict:
+        return {
+            "phases": [record.as_dict() for record in self.phases.values()],
+            "seconds": round(sum(record.seconds for record in self.phases.values()), 6),
+            "peak_rss": peak_rss(),
+        }
+
+    def write_json(self, path: str):
+        """Write the measurements to a JSON file."""
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.as_dict(), f, indent=2)
+
+    def report(self) -> str:
+        """One line per phase, for the end of a build."""
+        lines = []
+        for record in self.phases.values():
+            ops = sum(record.ops.values())
+            memory = f"{record.peak_rss / 2 ** 20:,.0f} MB peak" if record.peak_rss else "peak unknown"
+            lines.append(f"{record.name:<26} {record.seconds:>8.2f}s {ops:>10,} ops {record.bytes_written:>12,} bytes  {memory}")
+        return "\n".join(lines)
@@ -0,0 +1,186 @@
+import hashlib
+import os
+import posixpath
+import time
+from array import array
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from build_plan import Operation, MKDIR, FILE, SYMLINK, relative_target
+from materializer import Materializer, DEFAULT_THREADS, DEFAULT_BATCH_SIZE
+
+# What can be wrong with the tree
+MISSING = "missing"
+EXTRA = "extra"
+BROKEN_LINK = "broken link"
+WRONG_TARGET = "wrong target"
+WRONG_KIND = "wrong kind"
+PROBLEMS = [MISSING, EXTRA, BROKEN_LINK, WRONG_TARGET, WRONG_KIND]
+
+SCANS_PER_TASK = 32  # directories listed by one pool task while looking for extras
+
+
+class Drift(NamedTuple):
+    """Something in the tree that isn't what the plan says. Paths are relative to the base path."""
+    problem: str
+    path: str
+    op: Optional[Operation] = None  # what the plan puts there, None for extras
+
+
+def path_key(path: str) -> int:
+    """A 64-bit hash of a path, so millions of expected paths fit in one sorted array."""
+    return int.from_bytes(hashlib.blake2b(path.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+class IntegrityChecker:
+    """
+    Compares a built city with its plan, without changing anything.
+
+    The plan is read in windows, like the materializer applies it, and each window
+    is grouped by parent directory: every group is one os.scandir of its directory,
+    plus a readlink (and a stat, for broken links) per symlink, spread over a thread
+    pool. Then the city's directories are walked level by level on the same pool to
+    find what isn't planned, checked against a sorted array of path hashes instead of
+    a set of millions of strings. Extra directories are reported once, not walked.
+    """
+
+    def __init__(self, threads: int = DEFAULT_THREADS, batch_size: int = DEFAULT_BATCH_SIZE):
+        self.threads = threads
+        self.batch_size = batch_size
+        self.counts = {"checked": 0, "scanned": 0}
+        self.seconds = 0.0
+
+    def check(self, operations: Iterable[Operation], base_path, roots: Iterable[str], ignore: Iterable[str] = ()) -> List[Drift]:
+        """
+        Everything that drifted from the planned operations, under the given root
+        directories (relative to base_path). Names starting with a dot (the city's
+        own caches) and the paths in ignore (like the drawn map) aren't extras.
+        """
+        base_path = os.fspath(base_path)
+        start = time.perf_counter()
+        drift: List[Drift] = []
+        keys = array("Q")
+        operations = iter(operations)
+        window_size = self.batch_size * max(self.threads, 1) * 16
+        with ThreadPoolExecutor(max_workers=max(self.threads, 1)) as pool:
+            while True:
+                window = list(islice(operations, window_size))
+                if not window:
+                    break
+                keys.extend(path_key(op.path) for op in window)
+                groups = defaultdict(list)
+                for op in window:
+                    groups[posixpath.dirname(op.path)].append(op)
+                # Most directories only hold a few entries, so one task checks many of them
+                for found in pool.map(lambda batch: self._check_groups(base_path, batch), chunks(groups.items(), self.batch_size)):
+                    drift.extend(found)
+                self.counts["checked"] += len(window)
+            expected = np.sort(np.frombuffer(keys, dtype=np.uint64)) if keys else np.empty(0, dtype=np.uint64)
+            drift.extend(self._extras(pool, base_path, list(roots), set(ignore), expected))
+        self.seconds += time.perf_counter() - start
+        return drift
+
+    def _check_groups(self, base_path: str, groups: List[Tuple[str, List[Operation]]]) -> List[Drift]:
+        return [item for parent, batch in groups for item in self._check_directory(base_path, parent, batch)]
+
+    def _check_directory(self, base_path: str, parent: str, batch: List[Operation]) -> List[Drift]:
+        try:
+            with os.scandir(os.path.join(base_path, parent)) as scan:
+                entries = {entry.name: entry for entry in scan}
+        except OSError:
+            return [Drift(MISSING, op.path, op) for op in batch]  # the directory itself is gone
+        drift = []
+        for op in batch:
+            entry = entries.get(posixpath.basename(op.path))
+            if entry is None:
+                drift.append(Drift(MISSING, op.path, op))
+            elif op.kind == SYMLINK:
+                try:
+                    if not entry.is_symlink():
+                        drift.append(Drift(WRONG_KIND, op.path, op))
+                    elif os.readlink(entry.path) != relative_target(op):
+                        drift.append(Drift(WRONG_TARGET, op.path, op))
+                    elif not os.path.exists(entry.path):
+                        drift.append(Drift(BROKEN_LINK, op.path, op))
+                except OSError:
+                    drift.append(Drift(MISSING, op.path, op))  # gone since the scan
+            elif op.kind == MKDIR and not entry.is_dir(follow_symlinks=False):
+                drift.append(Drift(WRONG_KIND, op.path, op))
+            elif op.kind == FILE and not entry.is_file(follow_symlinks=False):
+                drift.append(Drift(WRONG_KIND, op.path, op))
+        return drift
+
+    def _extras(self, pool, base_path: str, roots: List[str], ignore: set, expected: np.ndarray) -> List[Drift]:
+        extras = []
+        level = [root for root in roots if os.path.isdir(os.path.join(base_path, root))]
+        while level:
+            self.counts["scanned"] += len(level)
+            tasks = [level[i:i + SCANS_PER_TASK] for i in range(0, len(level), SCANS_PER_TASK)]
+            level = []
+            for found, directories in pool.map(lambda task: self._scan(base_path, task, ignore, expected), tasks):
+                extras.extend(found)
+                level.extend(directories)
+        return extras
+
+    @staticmethod
+    def _scan(base_path: str, directories: List[str], ignore: set, expected: np.ndarray) -> Tuple[List[Drift], List[str]]:
+        """The extras in some directories, and their planned subdirectories to look at next."""
+        entries = []
+        for directory in directories:
+            try:
+                with os.scandir(os.path.join(base_path, directory)) as scan:
+                    entries.extend((f"{directory}/{entry.name}", entry.is_dir(follow_symlinks=False))
+                                   for entry in scan if not entry.name.startswith("."))
+            except OSError:
+                continue
+        entries = [(path, is_dir) for path, is_dir in entries if path not in ignore]
+        if not entries:
+            return [], []
+        # One lookup in the sorted hashes for all of them
+        keys = np.fromiter((path_key(path) for path, _ in entries), dtype=np.uint64, count=len(entries))
+        positions = np.minimum(np.searchsorted(expected, keys), max(len(expected) - 1, 0))
+        planned = expected[positions] == keys if len(expected) else np.zeros(len(keys), dtype=bool)
+        extras = [Drift(EXTRA, path) for (path, _), known in zip(entries, planned) if not known]
+        subdirectories = [path for (path, is_dir), known in zip(entries, planned) if known and is_dir]
+        return extras, subdirectories
+
+
+def chunks(groups: Iterable[Tuple[str, list]], size: int) -> Iterator[list]:
+    """Groups of (key, items) bundled until each bundle holds about size items."""
+    bundle, count = [], 0
+    for key, items in groups:
+        bundle.append((key, items))
+        count += len(items)
+        if count >= size:
+            yield bundle
+            bundle, count = [], 0
+    if bundle:
+        yield bundle
+
+
+def summarize_drift(drift: Iterable[Drift]) -> Dict[str, int]:
+    """How many of each problem there are."""
+    counts = dict.fromkeys(PROBLEMS, 0)
+    for item in drift:
+        counts[item.problem] += 1
+    return counts
+
+
+def repair(drift: List[Drift], base_path, materializer: Materializer) -> Dict[str, int]:
+    """
+    Put back only what drifted: missing entries are made again (which also mends the
+    links that were broken because their target was missing) and links pointing the
+    wrong way are swapped for the right ones atomically. Extras and anything of the
+    wrong kind are someone's things, so they are left alone. Returns what was done.
+    """
+    missing = [item.op for item in drift if item.problem == MISSING]
+    relinks = [item.op for item in drift if item.problem == WRONG_TARGET]
+    before = dict(materializer.counts)
+    materializer.apply(missing, base_path)
+    relinked = materializer.relink(relinks, base_path)
+    created = sum(materializer.counts[kind] - before[kind] for kind in (MKDIR, FILE, SYMLINK))
+    return {"created": created, "relinked": relinked}
@@ -0,0 +1,120 @@
+import math
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Where labels are tried around their anchor, in order of preference: above first, like the map always did
+DIRECTIONS = [(0, 1), (1, 1), (-1, 1), (1, 0), (-1, 0), (0, -1), (1, -1), (-1, -1)]
+RADII = (1, 2, 4, 8)  # distances from the anchor tried in each direction, in multiples of the gap
+
+
+class BinIndex:
+    """
+    Boxes (x0, y0, x1, y1) bucketed into square cells, so finding the boxes near
+    a spot only looks at the cells around it instead of every box placed so far.
+    """
+
+    def __init__(self, cell_size: float, capacity: int):
+        self.cell_size = cell_size
+        self.boxes = np.empty((capacity, 4))
+        self.count = 0
+        self.cells: Dict[Tuple[int, int], List[int]] = {}
+
+    def _cells(self, x0, y0, x1, y1):
+        size = self.cell_size
+        for cx in range(math.floor(x0 / size), math.floor(x1 / size) + 1):
+            for cy in range(math.floor(y0 / size), math.floor(y1 / size) + 1):
+                yield cx, cy
+
+    def add(self, box: Sequence[float]):
+        if self.count == len(self.boxes):
+            self.boxes = np.concatenate([self.boxes, np.empty_like(self.boxes)])
+        self.boxes[self.count] = box
+        for cell in self._cells(*box):
+            self.cells.setdefault(cell, []).append(self.count)
+        self.count += 1
+
+    def near(self, x0: float, y0: float, x1: float, y1: float) -> np.ndarray:
+        """The boxes in every cell the area touches, each once even when it spans several cells."""
+        found = set()
+        for cell in self._cells(x0, y0, x1, y1):
+            found.update(self.cells.get(cell, ()))
+        return self.boxes[sorted(found)]
+
+
+def candidate_boxes(anchors: np.ndarray, sizes: np.ndarray, gap: float) -> np.ndarray:
+    """Every candidate box of every label at once, shaped (labels, candidates, 4)."""
+    directions = np.array([direction for _ in RADII for direction in DIRECTIONS], dtype=float)
+    radii = np.repeat(np.array(RADII, dtype=float) * gap, len(DIRECTIONS))[:, None]
+    half = sizes[:, None, :] / 2
+    # Labels sit next to the anchor: the box edge is the radius away along each direction
+    centers = anchors[:, None, :] + directions * (radii + half)
+    return np.concatenate([centers - half, centers + half], axis=2)
+
+
+def overlap_areas(candidates: np.ndarray, boxes: np.ndarray) -> np.ndarray:
+    """Total area each candidate box (k, 4) shares with the boxes (m, 4)."""
+    if len(boxes) == 0:
+        return np.zeros(len(candidates))
+    width = np.minimum(candidates[:, None, 2], boxes[None, :, 2]) - np.maximum(candidates[:, None, 0], boxes[None, :, 0])
+    height = np.minimum(candidates[:, None, 3], boxes[None, :, 3]) - np.maximum(candidates[:, None, 1], boxes[None, :, 1])
+    return (np.clip(width, 0, None) * np.clip(height, 0, None)).sum(axis=1)
+
+
+def outside_areas(candidates: np.ndarray, bounds: Tuple[float, float, float, float]) -> np.ndarray:
+    """Area of each candidate box that falls outside bounds (x0, y0, x1, y1)."""
+    x0, y0, x1, y1 = bounds
+    width = np.minimum(candidates[:, 2], x1) - np.maximum(candidates[:, 0], x0)
+    height = np.minimum(candidates[:, 3], y1) - np.maximum(candidates[:, 1], y0)
+    inside = np.clip(width, 0, None) * np.clip(height, 0, None)
+    return (candidates[:, 2] - candidates[:, 0]) * (candidates[:, 3] - candidates[:, 1]) - inside
+
+
+def place_labels(anchors, sizes, gap: float, bounds: Tuple[float, float, float, float] = None,
+                 marker_size: float = 0.0, obstacles: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Place one label per anchor so labels don't cover each other or the markers.
+
+    anchors are (n, 2) points and sizes (n, 2) label widths and heights, all in the
+    same units (display points work best, so text keeps its shape). Every label is
+    tried at a few distances in eight directions around its anchor, above first,
+    and greedily takes the first spot that is free of the labels placed before it,
+    the markers (squares of marker_size around every anchor, plus any obstacles
+    boxes) and the area outside bounds. When no spot is free it takes the one with
+    the least overlap, so every label is still shown.
+
+    Returns the label centers (n, 2) and whether each label found a free spot.
+    """
+    anchors = np.asarray(anchors, dtype=float).reshape(-1, 2)
+    sizes = np.asarray(sizes, dtype=float).reshape(-1, 2)
+    count = len(anchors)
+    centers = np.empty((count, 2))
+    free = np.zeros(count, dtype=bool)
+    if count == 0:
+        return centers, free
+
+    candidates = candidate_boxes(anchors, sizes, gap)
+    reach = np.concatenate([candidates[:, :, :2].min(axis=1), candidates[:, :, 2:].max(axis=1)], axis=1)
+    obstacles = np.empty((0, 4)) if obstacles is None else np.asarray(obstacles, dtype=float).reshape(-1, 4)
+    index = BinIndex(float(max(np.median(sizes.max(axis=1)), marker_size, 1e-9)), 2 * count + len(obstacles))
+    if marker_size:
+        half = marker_size / 2
+        for x, y in anchors:
+            index.add((x - half, y - half, x + half, y + half))
+    for box in obstacles:
+        index.add(box)
+
+    # Nudge towards the earlier candidates, so among equally bad spots the closest wins
+    preference = np.arange(candidates.shape[1]) * 1e-9
+    for i in range(count):
+        options = candidates[i]
+        cost = overlap_areas(options, index.near(*reach[i]))
+        if bounds is not None:
+            cost += outside_areas(options, bounds)
+        clear = np.flatnonzero(cost <= 0)
+        choice = clear[0] if len(clear) else int(np.argmin(cost + preference))
+        free[i] = len(clear) > 0
+        box = options[choice]
+        index.add(box)
+        centers[i] = (box[0] + box[2]) / 2, (box[1] + box[3]) / 2
+    return centers, free
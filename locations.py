@@ -49,12 +49,12 @@ LOCATIONS = [
         "exit_name": "front door",
         "marker": "[ market deli ]",
         "objects": [
-            {"path": "refrigerator/lemonade", "min": 15, "max": 30, "chance": 0.125},
-            {"path": "refrigerator/iced_coffee", "min": 10, "max": 25, "chance": 0.25},
-            {"path": "freezer/popsicle", "min": 10, "max": 25, "chance": 0.25},
-            {"path": "garbage can/popsicle_stick", "min": 1, "max": 100, "chance": 0.03},
-            {"path": "garbage can/empty_cup", "min": 1, "max": 100, "chance": 0.03},
-            {"path": "sandwhich counter/sandwhich", "min": 25, "max": 55, "chance": 0.25},
+            {"path": "refrigerator/lemonade", "min": 15, "max": 30, "chance": 0.125, "disappear": 0.05, "appear": 0.02},
+            {"path": "refrigerator/iced_coffee", "min": 10, "max": 25, "chance": 0.25, "disappear": 0.08, "appear": 0.03},
+            {"path": "freezer/popsicle", "min": 10, "max": 25, "chance": 0.25, "disappear": 0.06, "appear": 0.03},
+            {"path": "garbage can/popsicle_stick", "min": 1, "max": 100, "chance": 0.03, "appear": 0.01, "cleared_every": 48},
+            {"path": "garbage can/empty_cup", "min": 1, "max": 100, "chance": 0.03, "appear": 0.01, "cleared_every": 48},
+            {"path": "sandwhich counter/sandwhich", "min": 25, "max": 55, "chance": 0.25, "disappear": 0.1, "appear": 0.04},
             {"path": "chair", "min": 1, "max": 8, "chance": 1.0},
             {"path": "cash register", "count": 1},
             {"path": "muted tv", "count": 1},
@@ -68,20 +68,20 @@ LOCATIONS = [
         "exit_name": "front door",
         "marker": "[ rosenberg botanicals ]",
         "objects": [
-            {"path": "bouquets/ornate_bouquet", "min": 1, "max": 5, "chance": 0.75},
-            {"path": "bouquets/simple_bouquet", "min": 3, "max": 10, "chance": 0.75},
-            {"path": "bouquets/assorted_roses", "min": 3, "max": 6, "chance": 0.75},
-            {"path": "bouquets/assorted_tulips", "min": 3, "max": 7, "chance": 0.75},
-            {"path": "potted plants/small_succulent", "min": 5, "max": 15, "chance": 0.5},
-            {"path": "potted plants/snakeplant", "min": 5, "max": 15, "chance": 0.4},
-            {"path": "potted plants/small_fern", "min": 2, "max": 10, "chance": 0.6},
-            {"path": "seed packs/carrot_seeds", "min": 1, "max": 15, "chance": 0.4},
-            {"path": "seed packs/parsley_seeds", "min": 1, "max": 15, "chance": 0.4},
-            {"path": "seed packs/thyme_seeds", "min": 1, "max": 15, "chance": 0.4},
-            {"path": "seed packs/tomato_seeds", "min": 1, "max": 15, "chance": 0.4},
-            {"path": "seed packs/beet_seeds", "min": 1, "max": 15, "chance": 0.4},
-            {"path": "seed packs/onion_seeds", "min": 1, "max": 15, "chance": 0.4},
-            {"path": "seed packs/cucumber_seeds", "min": 1, "max": 15, "chance": 0.4},
+            {"path": "bouquets/ornate_bouquet", "min": 1, "max": 5, "chance": 0.75, "disappear": 0.02, "appear": 0.03},
+            {"path": "bouquets/simple_bouquet", "min": 3, "max": 10, "chance": 0.75, "disappear": 0.05, "appear": 0.05},
+            {"path": "bouquets/assorted_roses", "min": 3, "max": 6, "chance": 0.75, "disappear": 0.04, "appear": 0.04},
+            {"path": "bouquets/assorted_tulips", "min": 3, "max": 7, "chance": 0.75, "disappear": 0.04, "appear": 0.04},
+            {"path": "potted plants/small_succulent", "min": 5, "max": 15, "chance": 0.5, "disappear": 0.02, "appear": 0.02},
+            {"path": "potted plants/snakeplant", "min": 5, "max": 15, "chance": 0.4, "disappear": 0.01, "appear": 0.015},
+            {"path": "potted plants/small_fern", "min": 2, "max": 10, "chance": 0.6, "disappear": 0.02, "appear": 0.015},
+            {"path": "seed packs/carrot_seeds", "min": 1, "max": 15, "chance": 0.4, "disappear": 0.01, "appear": 0.01},
+            {"path": "seed packs/parsley_seeds", "min": 1, "max": 15, "chance": 0.4, "disappear": 0.01, "appear": 0.01},
+            {"path": "seed packs/thyme_seeds", "min": 1, "max": 15, "chance": 0.4, "disappear": 0.01, "appear": 0.01},
+            {"path": "seed packs/tomato_seeds", "min": 1, "max": 15, "chance": 0.4, "disappear": 0.01, "appear": 0.01},
+            {"path": "seed packs/beet_seeds", "min": 1, "max": 15, "chance": 0.4, "disappear": 0.01, "appear": 0.01},
+            {"path": "seed packs/onion_seeds", "min": 1, "max": 15, "chance": 0.4, "disappear": 0.01, "appear": 0.01},
+            {"path": "seed packs/cucumber_seeds", "min": 1, "max": 15, "chance": 0.4, "disappear": 0.01, "appear": 0.01},
             {"path": "storeroom/seed of wonder"},
             {"path": "cash register"},
         ],
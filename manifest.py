@@ -0,0 +1,196 @@
+import gzip
+import hashlib
+import json
+import os
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+from build_plan import Operation, MKDIR, SYMLINK
+
+MANIFEST_NAME = ".build manifest.json.gz"
+MANIFEST_VERSION = 2
+
+
+class ManifestEntry(NamedTuple):
+    """What the last build put at a path. Paths and targets are relative to the base path."""
+    path: str
+    kind: str
+    target: str
+    digest: str
+
+
+class PlanDiff(NamedTuple):
+    build: List[Operation]         # new or changed operations, in plan order
+    replace: List[ManifestEntry]   # what the changed operations built last time, to remove first
+    remove: List[ManifestEntry]    # built last time, no longer planned
+
+
+def content_digest(op: Operation) -> str:
+    """Short hash of what an operation writes, so changed contents and retargeted links are noticed."""
+    if op.kind == MKDIR:
+        return ""
+    data = op.target if op.kind == SYMLINK else op.contents
+    return hashlib.blake2b(data.encode("utf-8"), digest_size=8).hexdigest()
+
+
+def entry_for(op: Operation) -> ManifestEntry:
+    return ManifestEntry(op.path, op.kind, op.target, content_digest(op))
+
+
+def manifest_seed(map_contents) -> Optional[int]:
+    """The seed the previous build was made with, if its manifest recorded one."""
+    try:
+        with gzip.open(os.path.join(map_contents, MANIFEST_NAME), "rt", encoding="utf-8") as f:
+            return json.loads(f.readline()).get("seed")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def load_manifest(map_contents) -> Dict[str, ManifestEntry]:
+    """Read the manifest of the previous build, or return an empty one if there isn't any."""
+    try:
+        return {entry.path: entry for entry in read_manifest(os.path.join(map_contents, MANIFEST_NAME))}
+    except (OSError, ValueError, TypeError, AttributeError, EOFError):
+        return {}
+
+
+def read_manifest(manifest_path: str) -> Iterator[ManifestEntry]:
+    """The entries of a manifest file one at a time, none if it's missing or from another version."""
+    try:
+        f = gzip.open(manifest_path, "rt", encoding="utf-8")
+        header = json.loads(f.readline())
+    except (OSError, ValueError, EOFError):
+        return
+    with f:
+        if not isinstance(header, dict) or header.get("version") != MANIFEST_VERSION:
+            return
+        for line in f:
+            yield ManifestEntry(*json.loads(line))
+
+
+def entry_key(text: str) -> int:
+    """A 64-bit hash of a path or entry, so millions of them fit in one sorted array."""
+    return int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def stale_entries(previous_path: str, current_path: str) -> Tuple[List[ManifestEntry], List[ManifestEntry]]:
+    """
+    What the previous manifest has that the current one doesn't, both read as
+    streams: (replace, remove), the entries whose path is still built but
+    differently (another kind, target or contents) and the ones no longer built at
+    all. The current manifest is only kept as two sorted arrays of 64-bit hashes,
+    of its paths and of its whole entries, so this works for streamed builds of
+    any size at 16 bytes an entry.
+    """
+    import numpy as np  # only streamed builds need the arrays
+
+    paths, entries = [], []
+    for entry in read_manifest(current_path):
+        paths.append(entry_key(entry.path))
+        entries.append(entry_key("\0".join(entry)))
+    paths = np.sort(np.array(paths, dtype=np.uint64))
+    entries = np.sort(np.array(entries, dtype=np.uint64))
+    replace, remove = [], []
+    for entry in read_manifest(previous_path):
+        if _contains(entries, entry_key("\0".join(entry))):
+            continue
+        (replace if _contains(paths, entry_key(entry.path)) else remove).append(entry)
+    return replace, remove
+
+
+def _contains(keys, key: int) -> bool:
+    position = int(keys.searchsorted(key))
+    return position < len(keys) and int(keys[position]) == key
+
+
+class ManifestPart:
+    """
+    Manifest entries recorded by another process, e.g. a district worker, to be
+    joined into the manifest with ManifestRecorder.append. Gzip files can be
+    concatenated, so joining is a plain byte copy.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.file = gzip.open(path, "wt", encoding="utf-8")
+
+    def record(self, operations: Iterable[Operation]) -> Iterator[Operation]:
+        """Pass operations through, recording each one."""
+        for op in operations:
+            self.file.write(json.dumps(entry_for(op), ensure_ascii=False, separators=(",", ":")) + "\n")
+            yield op
+
+    def close(self):
+        self.file.close()
+
+
+class ManifestRecorder(ManifestPart):
+    """
+    Writes the manifest one entry per line while operations stream past, so even
+    huge builds are recorded without holding the plan in memory. The previous
+    manifest is only replaced once the recorder is closed successfully. The seed
+    the city was planned with is kept in the header, so rebuilds plan the same city.
+    """
+
+    def __init__(self, map_contents, seed: int = None):
+        self.manifest_path = os.path.join(map_contents, MANIFEST_NAME)
+        self.temporary_path = self.manifest_path + ".tmp"
+        os.makedirs(map_contents, exist_ok=True)
+        super().__init__(self.temporary_path)
+        self.file.write(json.dumps({"version": MANIFEST_VERSION, "seed": seed}) + "\n")
+
+    def append(self, part_path: str):
+        """Add the entries of a closed ManifestPart, and delete its file."""
+        import shutil  # only --workers builds have parts
+        self.file.close()
+        with open(self.temporary_path, "ab") as manifest, open(part_path, "rb") as part:
+            shutil.copyfileobj(part, manifest)
+        os.remove(part_path)
+        self.file = gzip.open(self.temporary_path, "at", encoding="utf-8")
+
+    def stale(self) -> Tuple[List[ManifestEntry], List[ManifestEntry]]:
+        """
+        (replace, remove) of the previous build against what was recorded so far,
+        see stale_entries: for a streamed build, which never saw the old manifest.
+        """
+        self.file.close()
+        try:
+            return stale_entries(self.manifest_path, self.temporary_path)
+        finally:
+            self.file = gzip.open(self.temporary_path, "at", encoding="utf-8")
+
+    def close(self):
+        self.file.close()
+        os.replace(self.temporary_path, self.manifest_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.file.close()
+            os.remove(self.temporary_path)
+
+
+def write_manifest(map_contents, plan: Iterable[Operation], seed: int = None):
+    """Record every planned path, its kind, symlink target and content hash."""
+    with ManifestRecorder(map_contents, seed) as recorder:
+        for _ in recorder.record(plan):
+            pass
+
+
+def diff_plan(manifest: Dict[str, ManifestEntry], plan: List[Operation]) -> PlanDiff:
+    """Compare a new plan against the previous build's manifest."""
+    build, replace = [], []
+    planned = set()
+    for op in plan:
+        planned.add(op.path)
+        previous = manifest.get(op.path)
+        if previous is None:
+            build.append(op)
+        elif previous != entry_for(op):
+            build.append(op)
+            replace.append(previous)
+    remove = [entry for path, entry in manifest.items() if path not in planned]
+    return PlanDiff(build, replace, remove)
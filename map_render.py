@@ -0,0 +1,269 @@
+import itertools
+import math
+from html import escape
+from typing import Dict, List, Tuple
+
+from address_index import AddressIndex, STREET
+
+# The map as a text grid or a hand-built SVG, from nothing but the grid and the
+# address index: no matplotlib and no NumPy, so a map is drawn in milliseconds on
+# machines (and in the frozen app) that never load either.
+
+# Most tick labels shown along each axis; bigger grids only label every n-th road.
+MAX_TICK_LABELS = 30
+
+# The welcome center isn't in LOCATIONS, but it belongs on the map
+WELCOME_CENTER_LOCATION = {
+    "name": "the welcome center",
+    "block_location": "horizontals/Juniper St blocks/1900-1999 Juniper St",
+    "address": "1995 Juniper St - the welcome center"
+}
+
+MARKER_SIZE = 8      # points
+LABEL_FONT_SIZE = 8  # points
+
+TEXT_MAP_NAME = "frammed_map.txt"
+SVG_MAP_NAME = "frammed_map.svg"
+
+BLOCK_COLUMNS = 14      # characters per block along a street in the text map, when they fit
+BLOCK_ROWS = 5          # lines per block along an avenue
+MAX_TEXT_COLUMNS = 200  # the text map is squeezed to fit this, bigger grids leave roads out
+MAX_TEXT_ROWS = 100
+AVENUE_LABEL_ROWS = 3   # lines above the text map for avenue names, staggered when they're long
+
+SVG_SIZE = 800          # pixels per side of the svg's plot area
+SVG_MARGIN = 90         # room for the road names, left of and below the plot
+SVG_MARKERS = {"o": ("street", "#1f77b4"), "^": ("avenue", "#ff7f0e")}  # the png's tab:blue and tab:orange
+# Where labels are tried around their marker, in order of preference: above first, like the png
+SVG_DIRECTIONS = [(0, -1), (1, -1), (-1, -1), (1, 0), (-1, 0), (0, 1), (1, 1), (-1, 1)]
+SVG_RADII = (1, 2, 4)
+
+Point = Tuple[float, float, str, str]  # x, y, marker, label
+Box = Tuple[float, float, float, float]
+
+
+def label_size(label, dpi, fontsize=LABEL_FONT_SIZE):
+    """
+    Width and height in pixels of a label's box, estimated from its longest line
+    and line count (an average glyph is about 0.6 em wide) plus the box padding.
+    """
+    lines = label.split("\n")
+    pad = 0.2 * fontsize
+    width = max(len(line) for line in lines) * 0.6 * fontsize + 2 * pad
+    height = len(lines) * 1.2 * fontsize + 2 * pad
+    return width * dpi / 72, height * dpi / 72
+
+
+def map_points(LOCATIONS, grid, index=None) -> List[Point]:
+    """
+    Where every location goes on the map, as (x, y, marker, label), the same as
+    map_plot.location_points but one address at a time, without NumPy.
+    """
+    index = index or AddressIndex(grid)
+    points = []
+    for loc in LOCATIONS:
+        point = index.point(loc["address"])
+        if point is None:
+            continue  # not an address on this grid
+        x, y, axis = point
+        address = index.parse(loc["address"])
+        points.append((x, y, 'o' if axis == STREET else '^', f"{loc['name']}\n{address.number} {address.road}"))
+    return points
+
+
+def tick_step(count: int) -> int:
+    return max(1, count // MAX_TICK_LABELS)
+
+
+# --- Text ---
+
+def render_text(grid, points: List[Point]) -> str:
+    """
+    The map as lines of text: streets are rows of '-', avenues columns of '|', and
+    locations 'o' (on a street) or '^' (on an avenue) with their name beside them.
+    Names that don't fit are listed under the map instead.
+    """
+    spans = max(grid.width - 1, 1), max(grid.height - 1, 1)
+    x_scale = min(BLOCK_COLUMNS, (MAX_TEXT_COLUMNS - 1) / spans[0])
+    y_scale = min(BLOCK_ROWS, (MAX_TEXT_ROWS - 1) / spans[1])
+    # Keep roads at least two characters apart, leaving the others out when the grid is big
+    avenues = range(0, grid.width, max(tick_step(grid.width), math.ceil(2 / x_scale)))
+    streets = range(0, grid.height, max(tick_step(grid.height), math.ceil(2 / y_scale)))
+    left = max(len(grid.street_name(y)) for y in streets) + 2
+    top = AVENUE_LABEL_ROWS + 1
+
+    def column(x):
+        return left + round(x * x_scale)
+
+    def row(y):
+        return top + round(y * y_scale)
+
+    canvas = [[" "] * (column(grid.width - 1) + 1) for _ in range(row(grid.height - 1) + 1)]
+    taken = set()  # cells holding a marker or a label, which nothing may overwrite
+
+    def put(r, c, text, claim=False):
+        if r < 0 or r >= len(canvas):
+            return
+        if c + len(text) > len(canvas[r]):
+            canvas[r].extend(" " * (c + len(text) - len(canvas[r])))
+        for offset, char in enumerate(text):
+            canvas[r][c + offset] = char
+            if claim:
+                taken.add((r, c + offset))
+
+    for y in streets:
+        put(row(y), left, "-" * (column(grid.width - 1) - left + 1))
+        put(row(y), 0, grid.street_name(y))
+    for x in avenues:
+        for r in range(row(0), row(grid.height - 1) + 1):
+            put(r, column(x), "+" if canvas[r][column(x)] == "-" else "|")
+    # Avenue names above their columns, each on the first line where it doesn't run into another
+    ends = [0] * AVENUE_LABEL_ROWS
+    for x in avenues:
+        name, c = grid.avenue_name(x), column(x)
+        for line in range(AVENUE_LABEL_ROWS):
+            if ends[line] <= c:
+                put(line, c, name)
+                ends[line] = c + len(name) + 1
+                break
+
+    unlabelled = []
+    for x, y, marker, label in points:
+        r, c = row(y), column(x)
+        put(r, c, marker, claim=True)
+        name = label.split("\n")[0]
+        text = f" {name} "  # set off from the road it's written over
+        for start in (c + 1, c - len(text)):
+            cells = [(r, start + offset) for offset in range(len(text))]
+            if start >= left and start + len(text) <= len(canvas[r]) and not taken.intersection(cells):
+                put(r, start, text, claim=True)
+                break
+        else:
+            unlabelled.append(label.replace("\n", ", "))
+
+    lines = ["Folder City Map".center(len(canvas[-1])), ""]
+    lines += ["".join(line).rstrip() for r, line in enumerate(canvas) if r >= AVENUE_LABEL_ROWS or "".join(line).strip()]
+    if unlabelled:
+        lines += ["", "also on the map:"] + [f"  {label}" for label in unlabelled]
+    return "\n".join(lines) + "\n"
+
+
+# --- SVG ---
+
+def place_svg_labels(anchors: List[Tuple[float, float]], sizes: List[Tuple[float, float]], gap: float) -> List[Tuple[float, float]]:
+    """
+    Centers for the labels, tried around their anchors in SVG_DIRECTIONS at growing
+    distances and kept clear of the labels and markers placed before them. Boxes are
+    bucketed into square cells, so each try only looks at its neighbours. A label
+    that fits nowhere goes above its marker.
+    """
+    cell = max([gap] + [max(size) for size in sizes])
+    cells: Dict[Tuple[int, int], List[Box]] = {}
+
+    def keys(box):
+        for cx in range(math.floor(box[0] / cell), math.floor(box[2] / cell) + 1):
+            for cy in range(math.floor(box[1] / cell), math.floor(box[3] / cell) + 1):
+                yield cx, cy
+
+    def free(box):
+        return not any(box[0] < other[2] and other[0] < box[2] and box[1] < other[3] and other[1] < box[3]
+                       for key in keys(box) for other in cells.get(key, ()))
+
+    def add(box):
+        for key in keys(box):
+            cells.setdefault(key, []).append(box)
+
+    for ax, ay in anchors:
+        add((ax - gap, ay - gap, ax + gap, ay + gap))
+    centers = []
+    for (ax, ay), (width, height) in zip(anchors, sizes):
+        tries = [(ax + dx * (width / 2 + gap * radius), ay + dy * (height / 2 + gap * radius))
+                 for radius in SVG_RADII for dx, dy in SVG_DIRECTIONS]
+        for cx, cy in tries:
+            box = (cx - width / 2, cy - height / 2, cx + width / 2, cy + height / 2)
+            if free(box):
+                break
+        else:
+            cx, cy = tries[0]
+            box = (cx - width / 2, cy - height / 2, cx + width / 2, cy + height / 2)
+        add(box)
+        centers.append((cx, cy))
+    return centers
+
+
+def render_svg(grid, points: List[Point]) -> str:
+    """The map as an SVG document, laid out like the png: dotted roads, markers, and labels on white boxes."""
+    scale = SVG_SIZE / max(grid.width - 1, grid.height - 1, 1)
+    pad = 0.2 * scale if max(grid.width, grid.height) > 1 else SVG_SIZE / 2
+
+    def to_svg(x, y):
+        # First street at the top, like the png's inverted y-axis
+        return SVG_MARGIN + pad + x * scale, 40 + pad + y * scale
+
+    width, height = to_svg(grid.width - 1, grid.height - 1)
+    width, height = width + pad + 20, height + pad + SVG_MARGIN
+    x0, y0 = to_svg(0, 0)
+    x1, y1 = to_svg(grid.width - 1, grid.height - 1)
+    streets = "".join(f"M{x0 - pad:.1f} {to_svg(0, y)[1]:.1f}H{x1 + pad:.1f}" for y in range(grid.height))
+    avenues = "".join(f"M{to_svg(x, 0)[0]:.1f} {y0 - pad:.1f}V{y1 + pad:.1f}" for x in range(grid.width))
+    marker = MARKER_SIZE / 2
+    parts = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{width:.0f}" height="{height:.0f}" '
+        f'viewBox="0 0 {width:.0f} {height:.0f}" font-family="sans-serif">',
+        '<defs>',
+        f'<circle id="street" r="{marker}"/>',
+        f'<path id="avenue" d="M0 {-marker * 1.15:.1f}L{marker:.1f} {marker * 0.85:.1f}H{-marker:.1f}Z"/>',
+        '</defs>',
+        '<rect width="100%" height="100%" fill="white"/>',
+        f'<text x="{(x0 + x1) / 2:.1f}" y="24" font-size="16" text-anchor="middle">Folder City Map</text>',
+        f'<path d="{streets}{avenues}" stroke="gray" stroke-width="0.8" stroke-dasharray="1 2" opacity="0.7" fill="none"/>',
+    ]
+    for y in range(0, grid.height, tick_step(grid.height)):
+        parts.append(f'<text x="{x0 - pad - 6:.1f}" y="{to_svg(0, y)[1] + 4:.1f}" font-size="10" '
+                     f'text-anchor="end">{escape(grid.street_name(y))}</text>')
+    for x in range(0, grid.width, tick_step(grid.width)):
+        tx, ty = to_svg(x, grid.height - 1)[0], y1 + pad + 10
+        parts.append(f'<text x="{tx:.1f}" y="{ty:.1f}" font-size="10" text-anchor="end" '
+                     f'transform="rotate(-45 {tx:.1f} {ty:.1f})">{escape(grid.avenue_name(x))}</text>')
+
+    if points:
+        anchors = [to_svg(x, y) for x, y, m, label in points]
+        sizes = [label_size(label, 72) for x, y, m, label in points]
+        centers = place_svg_labels(anchors, sizes, gap=marker)
+        leaders, labels = [], []
+        for (ax, ay), (w, h), (cx, cy), (x, y, m, label) in zip(anchors, sizes, centers, points):
+            # A leader line to the nearest point of the label, unless it sits right next to its marker
+            ex, ey = min(max(ax, cx - w / 2), cx + w / 2), min(max(ay, cy - h / 2), cy + h / 2)
+            if math.hypot(ex - ax, ey - ay) > 2 * marker:
+                leaders.append(f"M{ax:.1f} {ay:.1f}L{ex:.1f} {ey:.1f}")
+            lines = label.split("\n")
+            line_height = 1.2 * LABEL_FONT_SIZE
+            first = cy - (len(lines) - 1) * line_height / 2 + LABEL_FONT_SIZE * 0.35
+            spans = "".join(f'<tspan x="{cx:.1f}" y="{first + i * line_height:.1f}">{escape(line)}</tspan>'
+                            for i, line in enumerate(lines))
+            labels.append(f'<rect x="{cx - w / 2:.1f}" y="{cy - h / 2:.1f}" width="{w:.1f}" height="{h:.1f}" '
+                          f'rx="2" fill="white" opacity="0.7"/><text font-size="{LABEL_FONT_SIZE}" '
+                          f'text-anchor="middle">{spans}</text>')
+        if leaders:
+            parts.append(f'<path d="{"".join(leaders)}" stroke="gray" stroke-width="0.8" opacity="0.5" fill="none"/>')
+        for kind, (symbol, color) in SVG_MARKERS.items():
+            parts += [f'<use href="#{symbol}" x="{ax:.1f}" y="{ay:.1f}" fill="{color}"/>'
+                      for (ax, ay), (x, y, m, label) in zip(anchors, points) if m == kind]
+        parts += labels
+    parts.append("</svg>")
+    return "\n".join(parts) + "\n"
+
+
+def draw_light_map(BASE_PATH, LOCATIONS, grid, index=None, format: str = "svg") -> int:
+    """
+    Draw the map of the locations and the welcome center as text or svg in the
+    welcome center, like map_plot.draw_map does as a png. Returns the bytes written.
+    """
+    points = map_points(itertools.chain(LOCATIONS, [WELCOME_CENTER_LOCATION]), grid, index)
+    if format == "text":
+        path, contents = BASE_PATH / "the welcome center" / TEXT_MAP_NAME, render_text(grid, points)
+    else:
+        path, contents = BASE_PATH / "the welcome center" / SVG_MAP_NAME, render_svg(grid, points)
+    data = contents.encode("utf-8")
+    path.write_bytes(data)
+    return len(data)
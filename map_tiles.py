@@ -0,0 +1,299 @@
+import hashlib
+import json
+import math
+import os
+import time
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+import matplotlib.pyplot as plt
+from matplotlib.collections import LineCollection
+import numpy as np
+
+from grid import Grid
+from label_placer import place_labels
+from map_plot import WELCOME_CENTER_LOCATION, label_size, location_points
+
+TILE_SIZE = 256            # pixels per side of a tile
+MAX_ZOOM = 6               # 4096 tiles at the deepest level, however big the grid
+BLOCK_PIXELS = 160         # how wide a block should be at the deepest zoom, if MAX_ZOOM allows
+TILE_FONT_PIXELS = 11      # label text size
+MARKER_PIXELS = 12         # marker size
+ROAD_NAME_PIXELS = 72      # blocks must be at least this wide for road names to be drawn
+TILES_DIR = "map tiles"    # in the welcome center, next to frammed_map.png
+TILES_INDEX = "tiles.json"
+RENDER_VERSION = 1         # bump when the look of tiles changes, so every tile is redrawn
+
+Box = Tuple[float, float, float, float]
+
+
+class TileLevel:
+    """
+    One zoom level of the map: how grid coordinates map to pixels, and where
+    every marker, label and leader line goes, in pixels from the top left corner.
+    """
+
+    def __init__(self, grid: Grid, points: List[tuple], zoom: int, max_zoom: int):
+        self.grid = grid
+        self.zoom = zoom
+        self.tiles = 2 ** zoom
+        self.side = max(grid.width, grid.height)  # the map is square, in blocks
+        self.scale = self.tiles * TILE_SIZE / self.side  # pixels per block
+        self.markers = [(*self.to_pixels(x, y), marker) for x, y, marker, label in points]
+        self.labels: List[Tuple[str, Box]] = []
+        self.leaders: List[Box] = []
+        if points:
+            self._place_labels(points, show_all=zoom == max_zoom)
+        # What each tile shows, so a tile only looks at its own markers, labels and lines
+        self.buckets: Dict[Tuple[int, int], Dict[str, list]] = defaultdict(lambda: defaultdict(list))
+        margin = MARKER_PIXELS
+        for px, py, marker in self.markers:
+            self._bucket("markers", (px, py, marker), (px - margin, py - margin, px + margin, py + margin))
+        for label, box in self.labels:
+            self._bucket("labels", (label, box), box)
+        for ax, ay, bx, by in self.leaders:
+            self._bucket("leaders", (ax, ay, bx, by), (min(ax, bx), min(ay, by), max(ax, bx), max(ay, by)))
+
+    def _bucket(self, kind: str, item, box: Box):
+        last = self.tiles - 1
+        for tx in range(max(0, int(box[0] // TILE_SIZE)), min(last, int(box[2] // TILE_SIZE)) + 1):
+            for ty in range(max(0, int(box[1] // TILE_SIZE)), min(last, int(box[3] // TILE_SIZE)) + 1):
+                self.buckets[tx, ty][kind].append(item)
+
+    def to_pixels(self, x: float, y: float) -> Tuple[float, float]:
+        return (x + 0.5) * self.scale, (y + 0.5) * self.scale
+
+    def _place_labels(self, points, show_all):
+        size = self.tiles * TILE_SIZE
+        # The placer works y-up, pixels grow downwards, so flip on the way in and out
+        anchors = np.array([(px, size - py) for px, py, marker in self.markers])
+        sizes = np.array([label_size(label, 72, TILE_FONT_PIXELS) for x, y, marker, label in points])
+        centers, free = place_labels(anchors, sizes, gap=MARKER_PIXELS / 2, bounds=(0, 0, size, size), marker_size=2 * MARKER_PIXELS)
+        ends = np.clip(anchors, centers - sizes / 2, centers + sizes / 2)
+        for (x, y, marker, label), center, extent, end, anchor, ok in zip(points, centers, sizes, ends, anchors, free):
+            if not (ok or show_all):
+                continue  # no room at this zoom, the label shows up further in
+            left, top = center[0] - extent[0] / 2, size - center[1] - extent[1] / 2
+            self.labels.append((label, (left, top, left + extent[0], top + extent[1])))
+            if math.hypot(*(end - anchor)) > MARKER_PIXELS:
+                self.leaders.append((anchor[0], size - anchor[1], end[0], size - end[1]))
+
+    def tile_contents(self, tx: int, ty: int) -> dict:
+        """Everything drawn on one tile, in that tile's own pixels; this is what its cache key hashes."""
+        x0, y0 = tx * TILE_SIZE, ty * TILE_SIZE
+        x1, y1 = x0 + TILE_SIZE, y0 + TILE_SIZE
+        bucket = self.buckets.get((tx, ty), {})
+        grid = self.grid
+        # Roads whose line crosses the tile, within the grid's extent
+        first_avenue = max(0, math.ceil(x0 / self.scale - 0.5))
+        last_avenue = min(grid.width - 1, math.floor(x1 / self.scale - 0.5))
+        first_street = max(0, math.ceil(y0 / self.scale - 0.5))
+        last_street = min(grid.height - 1, math.floor(y1 / self.scale - 0.5))
+        left, top = self.to_pixels(-0.2, -0.2)
+        right, bottom = self.to_pixels(grid.width - 1 + 0.2, grid.height - 1 + 0.2)
+        names = self.scale >= ROAD_NAME_PIXELS
+        streets = [(round(self.to_pixels(0, i)[1] - y0, 2), grid.street_name(i) if names else "")
+                   for i in range(first_street, last_street + 1)] if left < x1 and right > x0 else []
+        avenues = [(round(self.to_pixels(i, 0)[0] - x0, 2), grid.avenue_name(i) if names else "")
+                   for i in range(first_avenue, last_avenue + 1)] if top < y1 and bottom > y0 else []
+        return {
+            "version": RENDER_VERSION,
+            "extent": [round(v, 2) for v in (left - x0, top - y0, right - x0, bottom - y0)],
+            "streets": streets,
+            "avenues": avenues,
+            "markers": [(round(px - x0, 2), round(py - y0, 2), marker) for px, py, marker in bucket.get("markers", ())],
+            "labels": [(label, [round(v, 2) for v in (bx0 - x0, by0 - y0, bx1 - x0, by1 - y0)])
+                       for label, (bx0, by0, bx1, by1) in bucket.get("labels", ())],
+            "leaders": [[round(v, 2) for v in (ax - x0, ay - y0, bx - x0, by - y0)] for ax, ay, bx, by in bucket.get("leaders", ())],
+        }
+
+
+def tile_key(contents: dict) -> str:
+    return hashlib.blake2b(json.dumps(contents, ensure_ascii=False).encode("utf-8"), digest_size=12).hexdigest()
+
+
+def max_zoom_for(grid: Grid) -> int:
+    """The zoom where a block is about BLOCK_PIXELS wide, capped at MAX_ZOOM."""
+    side = max(grid.width, grid.height)
+    return max(0, min(MAX_ZOOM, math.ceil(math.log2(max(1.0, side * BLOCK_PIXELS / TILE_SIZE)))))
+
+
+class TileRenderer:
+    """Draws tiles with one reused matplotlib figure whose axes are the tile's pixels."""
+
+    def __init__(self):
+        self.figure = plt.figure(figsize=(1, 1), dpi=TILE_SIZE)
+
+    def render(self, contents: dict, path: str):
+        fig = self.figure
+        fig.clf()
+        ax = fig.add_axes((0, 0, 1, 1))
+        ax.set_axis_off()
+        ax.set_xlim(0, TILE_SIZE)
+        ax.set_ylim(TILE_SIZE, 0)
+        points = 72 / TILE_SIZE  # points per pixel, since the figure is one inch
+        left, top, right, bottom = contents["extent"]
+        line_style = dict(color='gray', linestyle=':', linewidth=1.5 * points, alpha=0.7)
+        if contents["streets"]:
+            ax.hlines([y for y, name in contents["streets"]], max(left, 0), min(right, TILE_SIZE), **line_style)
+        if contents["avenues"]:
+            ax.vlines([x for x, name in contents["avenues"]], max(top, 0), min(bottom, TILE_SIZE), **line_style)
+        for y, name in contents["streets"]:
+            if name:
+                ax.text(max(left, 0) + 4, y - 2, name, fontsize=9 * points, color='gray', va='bottom')
+        for x, name in contents["avenues"]:
+            if name:
+                ax.text(x + 2, max(top, 0) + 4, name, fontsize=9 * points, color='gray', va='top', rotation=-90)
+        if contents["leaders"]:
+            ax.add_collection(LineCollection([[(ax0, ay0), (bx, by)] for ax0, ay0, bx, by in contents["leaders"]],
+                                             colors='gray', alpha=0.5, linewidths=1.2 * points))
+        for marker, color in (('o', 'tab:blue'), ('^', 'tab:orange')):
+            xs = [x for x, y, m in contents["markers"] if m == marker]
+            ys = [y for x, y, m in contents["markers"] if m == marker]
+            if xs:
+                ax.plot(xs, ys, marker, color=color, markersize=MARKER_PIXELS * points, linestyle='none')
+        for label, (x0, y0, x1, y1) in contents["labels"]:
+            ax.text((x0 + x1) / 2, (y0 + y1) / 2, label, ha='center', va='center', fontsize=TILE_FONT_PIXELS * points,
+                    bbox=dict(boxstyle='round,pad=0.2', fc='white', ec='none', alpha=0.7), color='black')
+        fig.savefig(path, dpi=TILE_SIZE)
+
+    def close(self):
+        plt.close(self.figure)
+
+
+def draw_tiles(BASE_PATH, LOCATIONS, grid: Grid, index=None) -> Dict[str, int]:
+    """
+    Render the map as a pyramid of TILE_SIZE tiles under the welcome center, plus
+    an index.html to browse them. Each tile is keyed by a hash of what is drawn on
+    it (road segments, markers, labels), and the keys of the last run are kept in
+    tiles.json, so only tiles whose contents changed are drawn again.
+    Returns how many tiles were drawn, kept and removed, and the bytes written.
+    """
+    tiles_dir = os.path.join(BASE_PATH, "the welcome center", TILES_DIR)
+    index_path = os.path.join(tiles_dir, TILES_INDEX)
+    try:
+        with open(index_path, encoding="utf-8") as f:
+            previous = json.load(f)["tiles"]
+    except (OSError, ValueError, KeyError):
+        previous = {}
+
+    points = location_points(list(LOCATIONS) + [WELCOME_CENTER_LOCATION], grid, index)
+    max_zoom = max_zoom_for(grid)
+    counts = {"drawn": 0, "kept": 0, "removed": 0, "bytes": 0}
+    keys: Dict[str, str] = {}
+    renderer = TileRenderer()
+    try:
+        for zoom in range(max_zoom + 1):
+            level = TileLevel(grid, points, zoom, max_zoom)
+            for tx in range(level.tiles):
+                for ty in range(level.tiles):
+                    contents = level.tile_contents(tx, ty)
+                    if not (contents["streets"] or contents["avenues"] or contents["labels"] or contents["leaders"]):
+                        continue  # off the grid, the viewer shows the background
+                    name = f"{zoom}/{tx}/{ty}"
+                    keys[name] = key = tile_key(contents)
+                    path = os.path.join(tiles_dir, str(zoom), str(tx), f"{ty}.png")
+                    if previous.get(name) == key and os.path.exists(path):
+                        counts["kept"] += 1
+                        continue
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    renderer.render(contents, path)
+                    counts["drawn"] += 1
+                    counts["bytes"] += os.path.getsize(path)
+    finally:
+        renderer.close()
+
+    for name in previous.keys() - keys.keys():
+        try:
+            os.remove(os.path.join(tiles_dir, *name.split("/")) + ".png")
+            counts["removed"] += 1
+        except OSError:
+            pass
+    os.makedirs(tiles_dir, exist_ok=True)
+    with open(index_path, "w", encoding="utf-8") as f:
+        json.dump({"max_zoom": max_zoom, "tiles": keys}, f)
+    with open(os.path.join(tiles_dir, "index.html"), "w", encoding="utf-8") as f:
+        f.write(VIEWER.replace("{max_zoom}", str(max_zoom)).replace("{tile_size}", str(TILE_SIZE))
+                .replace("{version}", str(int(time.time()))))
+    return counts
+
+
+# A page that pans and zooms through the tiles, with no dependencies, opened straight from disk
+VIEWER = """<!doctype html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>folder city map</title>
+<style>
+  html, body { margin: 0; height: 100%; overflow: hidden; background: #fff; font: 13px sans-serif; }
+  #map { position: absolute; inset: 0; cursor: grab; touch-action: none; }
+  #map img { position: absolute; user-select: none; -webkit-user-drag: none; }
+  #help { position: absolute; top: 8px; left: 8px; background: #fffc; padding: 4px 8px; border-radius: 4px; }
+</style>
+</head>
+<body>
+<div id="map"></div>
+<div id="help">drag to move, scroll or +/- to zoom <span id="zoom"></span></div>
+<script>
+const MAX_ZOOM = {max_zoom}, TILE = {tile_size}, VERSION = "{version}";
+const map = document.getElementById("map"), label = document.getElementById("zoom");
+const shown = new Map();
+let zoom = 0, cx = TILE / 2, cy = TILE / 2;  // the middle of the view, in pixels at this zoom
+
+function draw() {
+  const w = map.clientWidth, h = map.clientHeight, n = 2 ** zoom;
+  const left = cx - w / 2, top = cy - h / 2, wanted = new Set();
+  for (let tx = Math.max(0, Math.floor(left / TILE)); tx <= Math.min(n - 1, Math.floor((left + w) / TILE)); tx++) {
+    for (let ty = Math.max(0, Math.floor(top / TILE)); ty <= Math.min(n - 1, Math.floor((top + h) / TILE)); ty++) {
+      const name = `${zoom}/${tx}/${ty}`;
+      wanted.add(name);
+      let img = shown.get(name);
+      if (!img) {
+        img = new Image(TILE, TILE);
+        img.onerror = () => { img.style.visibility = "hidden"; };
+        img.src = `${name}.png?v=${VERSION}`;
+        shown.set(name, img);
+        map.appendChild(img);
+      }
+      img.style.left = `${tx * TILE - left}px`;
+      img.style.top = `${ty * TILE - top}px`;
+    }
+  }
+  for (const [name, img] of shown) {
+    if (!wanted.has(name)) { img.remove(); shown.delete(name); }
+  }
+  label.textContent = `(zoom ${zoom} of ${MAX_ZOOM})`;
+}
+
+function zoomTo(next, x, y) {
+  next = Math.max(0, Math.min(MAX_ZOOM, next));
+  if (next === zoom) return;
+  const factor = 2 ** (next - zoom), dx = x - map.clientWidth / 2, dy = y - map.clientHeight / 2;
+  cx = (cx + dx) * factor - dx;
+  cy = (cy + dy) * factor - dy;
+  zoom = next;
+  draw();
+}
+
+let drag = null;
+map.addEventListener("pointerdown", e => { drag = [e.clientX, e.clientY]; map.setPointerCapture(e.pointerId); map.style.cursor = "grabbing"; });
+map.addEventListener("pointermove", e => {
+  if (!drag) return;
+  cx -= e.clientX - drag[0];
+  cy -= e.clientY - drag[1];
+  drag = [e.clientX, e.clientY];
+  draw();
+});
+map.addEventListener("pointerup", () => { drag = null; map.style.cursor = "grab"; });
+map.addEventListener("wheel", e => { e.preventDefault(); zoomTo(zoom + (e.deltaY < 0 ? 1 : -1), e.clientX, e.clientY); }, { passive: false });
+map.addEventListener("dblclick", e => zoomTo(zoom + 1, e.clientX, e.clientY));
+document.addEventListener("keydown", e => {
+  if (e.key === "+" || e.key === "=") zoomTo(zoom + 1, map.clientWidth / 2, map.clientHeight / 2);
+  if (e.key === "-") zoomTo(zoom - 1, map.clientWidth / 2, map.clientHeight / 2);
+});
+window.addEventListener("resize", draw);
+draw();
+</script>
+</body>
+</html>
+"""
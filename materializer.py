@@ -0,0 +1,283 @@
+import os
+import stat
+import time
+from collections import defaultdict
+from itertools import islice
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from build_plan import Operation, RecentSet, MKDIR, FILE, SYMLINK, relative_target
+from inode_pool import InodePool
+
+DEFAULT_THREADS = min(8, os.cpu_count() or 1)
+DEFAULT_BATCH_SIZE = 256
+DEFAULT_DIRECTORY_CACHE = 100_000  # directories remembered as existing
+
+# dirfd-relative calls (mkdirat/openat/symlinkat) aren't available everywhere, e.g. on Windows
+USE_DIR_FD = {os.mkdir, os.open, os.symlink} <= os.supports_dir_fd
+O_DIRECTORY = getattr(os, "O_DIRECTORY", 0)
+
+
+def thread_pool(threads: int):
+    """A pool of filesystem worker threads. concurrent.futures is loaded here, so a walk around the city never loads it."""
+    from concurrent.futures import ThreadPoolExecutor
+    return ThreadPoolExecutor(max_workers=max(threads, 1))
+
+
+class Materializer:
+    """
+    Performs filesystem operations for the city.
+
+    Remembers every directory it has created or seen so parents are only made once,
+    groups operations by parent directory so each group works through a single
+    directory fd, and spreads the groups across a bounded thread pool. With an
+    inode pool, files are hard links to one shared inode per contents instead of
+    files of their own.
+    """
+
+    def __init__(self, threads: int = DEFAULT_THREADS, batch_size: int = DEFAULT_BATCH_SIZE,
+                 directory_cache: int = DEFAULT_DIRECTORY_CACHE):
+        self.threads = threads
+        self.batch_size = batch_size
+        self.known_dirs = RecentSet(directory_cache)
+        self.counts = {MKDIR: 0, FILE: 0, SYMLINK: 0, "skipped": 0, "removed": 0, "relinked": 0}
+        self.bytes_written = 0
+        self.seconds = 0.0
+        self.progress: Optional[Callable[[int], object]] = None  # called with the number of ops done after each batch
+        self.inode_pool: Optional[InodePool] = None  # files are made as links to it, when set
+
+    # --- Single operations ---
+    def create_directory(self, path):
+        """Create a directory and its parents, unless we already know it exists."""
+        path = os.fspath(path)
+        if path in self.known_dirs:
+            return
+        start = time.perf_counter()
+        os.makedirs(path, exist_ok=True)
+        self.known_dirs.add(path)
+        self.counts[MKDIR] += 1
+        self.seconds += time.perf_counter() - start
+
+    def create_file(self, path, contents: str = ""):
+        """Create a file with optional contents if it doesn't already exist."""
+        path = os.fspath(path)
+        self.create_directory(os.path.dirname(path))
+        start = time.perf_counter()
+        data = contents.encode("utf-8")
+        kind, written = self._make_file(None, path, data)
+        self._tally(kind)
+        self.bytes_written += written
+        self.seconds += time.perf_counter() - start
+
+    def create_symlink(self, target, destination):
+        """
+        Create a symbolic link at destination pointing to target if nothing is there yet.
+        The link is made relative to its own directory, so it survives moving the city.
+        """
+        destination = os.fspath(destination)
+        self.create_directory(os.path.dirname(destination))
+        start = time.perf_counter()
+        target = os.path.relpath(os.path.abspath(target), os.path.dirname(os.path.abspath(destination)))
+        self._tally(self._write_symlink(None, target, destination))
+        self.seconds += time.perf_counter() - start
+
+    def forget(self):
+        """Drop the directory cache, e.g. after the tree was deleted."""
+        self.known_dirs.clear()
+
+    # --- Batched operations ---
+    def apply(self, operations: Iterable[Operation], base_path):
+        """
+        Perform planned operations relative to base_path.
+        The plan is consumed in windows so memory stays bounded. Within a window,
+        directories are made level by level and then files and symlinks are written,
+        each step grouped by parent directory and run on the thread pool.
+        """
+        base_path = os.fspath(base_path)
+        start = time.perf_counter()
+        operations = iter(operations)
+        window_size = self.batch_size * max(self.threads, 1) * 16
+        with thread_pool(self.threads) as pool:
+            while True:
+                window = list(islice(operations, window_size))
+                if not window:
+                    break
+                directories = [op for op in window if op.kind == MKDIR]
+                entries = [op for op in window if op.kind != MKDIR]
+                for level in sorted(set(op.path.count("/") for op in directories)):
+                    self._run(pool, base_path, [op for op in directories if op.path.count("/") == level])
+                self._run(pool, base_path, entries)
+        self.seconds += time.perf_counter() - start
+
+    def remove(self, entries: Iterable, base_path):
+        """
+        Remove previously built entries (anything with path and kind), deepest first.
+        Files and symlinks are only unlinked if they still are what was built, and
+        directories are only removed once empty, so user content is never touched.
+        """
+        base_path = os.fspath(base_path)
+        start = time.perf_counter()
+        for entry in sorted(entries, key=lambda entry: entry.path.count("/"), reverse=True):
+            path = os.path.join(base_path, entry.path)
+            try:
+                mode = os.lstat(path).st_mode
+                if entry.kind == MKDIR and stat.S_ISDIR(mode):
+                    os.rmdir(path)
+                    self.known_dirs.discard(path)
+                elif (entry.kind == FILE and stat.S_ISREG(mode)) or (entry.kind == SYMLINK and stat.S_ISLNK(mode)):
+                    os.unlink(path)
+                else:
+                    continue
+            except OSError:
+                continue  # already gone, or a directory that still has user content in it
+            self.counts["removed"] += 1
+        self.seconds += time.perf_counter() - start
+
+    def relink(self, entries: Iterable, base_path) -> int:
+        """
+        Point previously built symlinks (anything with path, kind and target, like
+        manifest entries) at their targets relative to their own directory, fixing
+        cities built with absolute links, even after they were moved. Each link is
+        replaced atomically, grouped by parent directory on the thread pool; links
+        that are already right and anything that isn't a symlink are left alone.
+        Returns how many links were rewritten.
+        """
+        base_path = os.fspath(base_path)
+        start = time.perf_counter()
+        groups = defaultdict(list)
+        for entry in entries:
+            if entry.kind == SYMLINK:
+                groups[os.path.dirname(entry.path)].append(entry)
+        batches = [(parent, group[i:i + self.batch_size]) for parent, group in groups.items()
+                   for i in range(0, len(group), self.batch_size)]
+        with thread_pool(self.threads) as pool:
+            relinked = sum(pool.map(lambda args: self._relink_batch(base_path, *args), batches))
+        self.counts["relinked"] += relinked
+        self.seconds += time.perf_counter() - start
+        return relinked
+
+    @staticmethod
+    def _relink_batch(base_path: str, parent: str, batch: List) -> int:
+        try:
+            dir_fd = os.open(os.path.join(base_path, parent), os.O_RDONLY | O_DIRECTORY) if USE_DIR_FD else None
+        except OSError:
+            return 0  # the directory is gone, so are its links
+        relinked = 0
+        try:
+            for entry in batch:
+                name = os.path.basename(entry.path) if USE_DIR_FD else os.path.join(base_path, entry.path)
+                target = relative_target(entry)
+                try:
+                    if os.readlink(name, dir_fd=dir_fd) == target:
+                        continue
+                    # Make the new link beside the old one and rename it over, so the link never goes missing
+                    temporary = name + ".relink"
+                    os.symlink(target, temporary, dir_fd=dir_fd)
+                    os.replace(temporary, name, src_dir_fd=dir_fd, dst_dir_fd=dir_fd)
+                except OSError:
+                    continue  # not a link any more (someone replaced it), or gone
+                relinked += 1
+        finally:
+            if dir_fd is not None:
+                os.close(dir_fd)
+        return relinked
+
+    def _run(self, pool, base_path: str, operations: List[Operation]):
+        groups = defaultdict(list)
+        for op in operations:
+            groups[os.path.dirname(op.path)].append(op)
+        batches = []
+        for parent, group in groups.items():
+            for i in range(0, len(group), self.batch_size):
+                batches.append((os.path.join(base_path, parent), group[i:i + self.batch_size]))
+        if self.threads <= 1 or len(batches) == 1:
+            results = [self._apply_batch(base_path, parent, batch) for parent, batch in batches]
+        else:
+            results = pool.map(lambda args: self._apply_batch(base_path, *args), batches)
+        for counts, written in results:
+            for kind, count in counts.items():
+                self.counts[kind] += count
+            self.bytes_written += written
+            if self.progress:
+                self.progress(sum(counts.values()))
+
+    def _apply_batch(self, base_path: str, parent: str, batch: List[Operation]) -> Tuple[Dict[str, int], int]:
+        """Perform a batch of operations that share a parent directory. Returns the counts by kind and the bytes written."""
+        counts = defaultdict(int)
+        written = 0
+        if parent not in self.known_dirs:
+            os.makedirs(parent, exist_ok=True)
+            self.known_dirs.add(parent)
+        dir_fd = os.open(parent, os.O_RDONLY | O_DIRECTORY) if USE_DIR_FD else None
+        try:
+            for op in batch:
+                name = os.path.basename(op.path) if USE_DIR_FD else os.path.join(base_path, op.path)
+                if op.kind == MKDIR:
+                    counts[self._make_directory(dir_fd, name, os.path.join(base_path, op.path))] += 1
+                elif op.kind == FILE:
+                    kind, size = self._make_file(dir_fd, name, op.contents.encode("utf-8"))
+                    counts[kind] += 1
+                    written += size
+                elif op.kind == SYMLINK:
+                    counts[self._write_symlink(dir_fd, relative_target(op), name)] += 1
+        finally:
+            if dir_fd is not None:
+                os.close(dir_fd)
+        return counts, written
+
+    # --- Primitive calls, relative to dir_fd when one is given ---
+    def _make_directory(self, dir_fd, name: str, full_path: str) -> str:
+        if full_path in self.known_dirs:
+            return "skipped"
+        try:
+            os.mkdir(name, dir_fd=dir_fd)
+            result = MKDIR
+        except FileExistsError:
+            result = "skipped"
+        self.known_dirs.add(full_path)
+        return result
+
+    def _make_file(self, dir_fd, name: str, data: bytes) -> Tuple[str, int]:
+        """A file as a link into the inode pool, or written when there is none (or it can't link). Returns its kind and the bytes written."""
+        linked = self.inode_pool.link(dir_fd, name, data) if self.inode_pool else None
+        if linked is not None:
+            return FILE if linked else "skipped", 0
+        kind = self._write_file(dir_fd, name, data)
+        return kind, len(data) if kind == FILE else 0
+
+    @staticmethod
+    def _write_file(dir_fd, name: str, data: bytes) -> str:
+        try:
+            fd = os.open(name, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666, dir_fd=dir_fd)
+        except FileExistsError:
+            return "skipped"
+        try:
+            if data:
+                os.write(fd, data)
+        finally:
+            os.close(fd)
+        return FILE
+
+    @staticmethod
+    def _write_symlink(dir_fd, target: str, name: str) -> str:
+        try:
+            os.symlink(target, name, dir_fd=dir_fd)
+        except FileExistsError:
+            return "skipped"
+        return SYMLINK
+
+    def _tally(self, kind: str):
+        self.counts[kind] += 1
+
+    # --- Reporting ---
+    def total_ops(self) -> int:
+        return sum(self.counts.values())
+
+    def report(self) -> str:
+        """Summarize what was done and how fast."""
+        total = self.total_ops()
+        rate = total / self.seconds if self.seconds else 0.0
+        details = ", ".join(f"{count} {kind}" for kind, count in self.counts.items())
+        report = f"{total} filesystem ops in {self.seconds:.2f}s ({rate:,.0f} ops/sec; {details}; {self.bytes_written:,} bytes written)"
+        if self.inode_pool:
+            report += f"\n{self.inode_pool.linked:,} files linked to shared inodes ({self.inode_pool.created:,} new), {self.inode_pool.saved():,} inodes saved"
+        return report
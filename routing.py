@@ -0,0 +1,284 @@
+import hashlib
+import heapq
+import json
+import os
+from array import array
+from collections import OrderedDict
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from build_plan import MKDIR, SYMLINK
+from address_index import AddressIndex
+from city_model import CityModel
+from grid import Grid
+from virtual_city import CityView, VirtualCity
+
+ROUTE_TABLE_NAME = ".route table.json"
+ROUTE_CACHE_SIZE = 4096  # point-to-point routes remembered in memory
+SMALL_SEARCH = 50_000  # places a search keeps in dicts, bigger ones move to the flat tables
+
+Step = Tuple[str, str]  # (name of the link or folder to open, the place it leads to)
+
+
+class Router:
+    """
+    Finds routes through the city's navigation graph.
+
+    Places are paths relative to the base path. The edges are the symlinks of a
+    place, plus the buildings inside a block, and are read from any city view, so
+    the graph comes from the plan (VirtualCity) or an existing tree (DiskCity) and
+    is only expanded as far as a search needs. A* uses grid coordinates: every
+    link between a block and an intersection moves half a block.
+
+    Searches run on the node numbers of a CityModel. A search keeps the cost and
+    where it was reached from of the places it saw in dicts, which only cost what
+    it sees, so a route across a few blocks doesn't pay for the size of the city.
+    One that sees more than SMALL_SEARCH places moves on to three flat arrays
+    (the generation of the search that saw a place, its cost, where it was reached
+    from) of 12 bytes a place all told (36 bytes an intersection, with its two
+    blocks), made the first time and reused, so even a search that has to cover a
+    whole grid of a million intersections stays around 40 MB.
+    Places off the grid are numbered after the grid's as searches find them. Over
+    the plan, the grid's links come from the model and aren't listed at all.
+    """
+
+    def __init__(self, city: CityView, map_contents: str, grid: Grid, cache_size: int = ROUTE_CACHE_SIZE):
+        self.city = city
+        self.map_contents = map_contents
+        self.grid = grid
+        self.cache_size = cache_size
+        self.routes: "OrderedDict[Tuple[str, str], Optional[List[Step]]]" = OrderedDict()
+        self.model = city.model if isinstance(city, VirtualCity) and city.grid is grid else CityModel(map_contents, grid)
+        # Over the plan: the grid places that have more than their links (None when the city is on disk)
+        self._planned = None
+        if isinstance(city, VirtualCity) and city.grid is grid:
+            self._planned = {node for node in map(self.model.node, city.extras) if node is not None}
+        self._others: Dict[str, int] = {}
+        self._other_paths: List[str] = []
+        self._generation, self._cost, self._came_from = array("I"), array("I"), array("i")
+        self._search_count = 0
+
+    # --- The graph ---
+    def coordinates(self, path: str) -> Optional[Tuple[float, float]]:
+        """(x, y) of a place on the grid, in avenues and streets; None for places off the grid."""
+        node = self.model.node(path, inside=True)
+        return None if node is None else self.model.coordinates(node)
+
+    def is_block(self, path: str) -> bool:
+        node = self.model.node(path)
+        return node is not None and node >= self.model.area
+
+    def neighbors(self, path: str) -> Iterator[Step]:
+        entries = self.city.listdir(path) or {}
+        in_block = self.is_block(path)
+        for name, entry in entries.items():
+            if entry.kind == SYMLINK:
+                yield name, entry.target
+            elif entry.kind == MKDIR and in_block:
+                yield name, f"{path}/{name}"
+
+    # --- Places as node numbers ---
+    def _node(self, path: str) -> int:
+        """The node number of a place: the model's for the grid, new ones after those for everything else."""
+        node = self.model.node(path)
+        if node is not None:
+            return node
+        node = self._others.get(path)
+        if node is None:
+            node = self._others[path] = self.model.size + len(self._other_paths)
+            self._other_paths.append(path)
+            for table in (self._generation, self._cost, self._came_from):
+                if table:
+                    table.append(0)
+        return node
+
+    def _path(self, node: int) -> str:
+        return self.model.path(node) if node < self.model.size else self._other_paths[node - self.model.size]
+
+    def _neighbors(self, node: int) -> Iterator[int]:
+        if node < self.model.size and self._planned is not None:
+            # The plan's grid links are known without listing anything, only the
+            # places with something else in them (buildings, links away) are listed
+            yield from self.model.neighbors(node)
+            if node not in self._planned:
+                return
+        for _, neighbor in self.neighbors(self._path(node)):
+            yield self._node(neighbor)
+
+    def _tables(self):
+        """Start a search: the per-node tables, made once and reused, with entries from earlier searches marked stale by the generation."""
+        if not self._generation:
+            size = self.model.size + len(self._other_paths)
+            self._generation = array("I", [0]) * size
+            self._cost = array("I", [0]) * size
+            self._came_from = array("i", [0]) * size
+        self._search_count += 1
+        return self._search_count, self._generation, self._cost, self._came_from
+
+    # --- Searching ---
+    def route(self, start: str, goal: str) -> Optional[List[Step]]:
+        """The shortest list of steps from start to goal, or None if there is no way."""
+        key = (start, goal)
+        if key in self.routes:
+            self.routes.move_to_end(key)
+            return self.routes[key]
+        steps = self._search(start, goal)
+        self._remember(key, steps)
+        return steps
+
+    def _remember(self, key, steps):
+        self.routes[key] = steps
+        if len(self.routes) > self.cache_size:
+            self.routes.popitem(last=False)
+
+    def _search(self, start: str, goal: str) -> Optional[List[Step]]:
+        start, goal = self._node(start), self._node(goal)
+        goal_xy = self._coordinates(goal)
+
+        def estimate(node):
+            xy = self._coordinates(node) if goal_xy else None
+            if xy is None:
+                return 0
+            return 2 * (abs(xy[0] - goal_xy[0]) + abs(xy[1] - goal_xy[1]))
+
+        # Ties go to the deeper node, so on an open grid A* walks straight at the goal
+        frontier = [(estimate(start), 0, start)]
+        best: Dict[int, int] = {start: 0}
+        came_from: Dict[int, int] = {start: -1}
+        while frontier:
+            if len(best) > SMALL_SEARCH:
+                return self._search_tables(goal, estimate, frontier, best, came_from)
+            _, negative_cost, node = heapq.heappop(frontier)
+            cost = -negative_cost
+            if node == goal:
+                return self._steps_to(goal, came_from)
+            if cost > best[node]:
+                continue
+            for neighbor in self._neighbors(node):
+                if neighbor not in best or cost + 1 < best[neighbor]:
+                    best[neighbor], came_from[neighbor] = cost + 1, node
+                    heapq.heappush(frontier, (cost + 1 + estimate(neighbor), -(cost + 1), neighbor))
+        return None
+
+    def _search_tables(self, goal: int, estimate, frontier: list, costs: Dict[int, int], reached_from: Dict[int, int]) -> Optional[List[Step]]:
+        """Go on with a search that outgrew its dicts on the flat tables."""
+        generation, seen, best, came_from = self._tables()
+        for node, cost in costs.items():
+            seen[node], best[node], came_from[node] = generation, cost, reached_from[node]
+        while frontier:
+            _, negative_cost, node = heapq.heappop(frontier)
+            cost = -negative_cost
+            if node == goal:
+                return self._steps_to(goal, came_from)
+            if cost > best[node]:
+                continue
+            for neighbor in self._neighbors(node):
+                # _neighbors can number new places, which grows the tables
+                seen, best, came_from = self._generation, self._cost, self._came_from
+                if seen[neighbor] != generation or cost + 1 < best[neighbor]:
+                    seen[neighbor], best[neighbor], came_from[neighbor] = generation, cost + 1, node
+                    heapq.heappush(frontier, (cost + 1 + estimate(neighbor), -(cost + 1), neighbor))
+        return None
+
+    def _coordinates(self, node: int) -> Optional[Tuple[float, float]]:
+        return self.model.coordinates(node) if node < self.model.size else self.coordinates(self._path(node))
+
+    def _steps_to(self, goal: int, came_from) -> List[Step]:
+        """The steps of a route, named only now by finding each link in the place before it."""
+        nodes = [goal]
+        while came_from[nodes[-1]] != -1:
+            nodes.append(came_from[nodes[-1]])
+        nodes.reverse()
+        steps = []
+        for previous, node in zip(nodes, nodes[1:]):
+            if previous < self.model.size and node < self.model.size and self._planned is not None:
+                name = next(name for name, neighbor in self.model.links(previous) if neighbor == node)
+                steps.append((name, self.model.path(node)))
+            else:
+                steps.append(next(step for step in self.neighbors(self._path(previous)) if self._node(step[1]) == node))
+        return steps
+
+    # --- All pairs between locations ---
+    def distance_table(self, places: Dict[str, str], cache_path: str = None) -> Dict[str, Dict[str, Optional[int]]]:
+        """
+        Distances in steps between every pair of named places. With cache_path the
+        table and its routes are kept on disk, keyed by the grid and the places, so
+        later runs load them instead of searching, and route() answers from them.
+        """
+        fingerprint = self._fingerprint(places)
+        table = _load_table(cache_path, fingerprint) if cache_path else None
+        if table is None:
+            table = {"fingerprint": fingerprint, "distances": {}, "routes": {}}
+            for a, start in places.items():
+                table["distances"][a] = {}
+                for b, goal in places.items():
+                    steps = self.route(start, goal) if a != b else []
+                    table["distances"][a][b] = None if steps is None else len(steps)
+                    table["routes"][f"{start}\t{goal}"] = steps
+            if cache_path:
+                _save_table(cache_path, table)
+        for key, steps in table["routes"].items():
+            start, goal = key.split("\t")
+            self._remember((start, goal), None if steps is None else [tuple(step) for step in steps])
+        return table["distances"]
+
+    def _fingerprint(self, places: Dict[str, str]) -> str:
+        grid = self.grid
+        key = [grid.width, grid.height, grid.base_street_names, grid.base_avenue_names,
+               grid.first_street_number, grid.first_avenue_number, self.map_contents, sorted(places.items())]
+        return hashlib.blake2b(json.dumps(key).encode("utf-8"), digest_size=16).hexdigest()
+
+
+def _block_index(block: str, block_of) -> Optional[int]:
+    try:
+        low = int(block.split(" ")[0].split("-")[0])
+    except ValueError:
+        return None
+    return block_of(low)[0]
+
+
+def _load_table(cache_path: str, fingerprint: str) -> Optional[dict]:
+    try:
+        with open(cache_path, encoding="utf-8") as f:
+            table = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return table if table.get("fingerprint") == fingerprint else None
+
+
+def _save_table(cache_path: str, table: dict):
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    temporary_path = cache_path + ".tmp"
+    with open(temporary_path, "w", encoding="utf-8") as f:
+        json.dump(table, f, ensure_ascii=False)
+    os.replace(temporary_path, cache_path)
+
+
+def find_place(query: str, places: Dict[str, str], map_contents: str, addresses: AddressIndex) -> Optional[str]:
+    """
+    Turn what someone typed into a place: a location's name or address ("2025 Juniper St"
+    finds the library, "2050 Juniper St" the block it would be on), an intersection
+    ("Oak St & Ocean Ave"), a block ("1600-1699 Oak St") or a path.
+    """
+    query = query.strip()
+    grid = addresses.grid
+    if query in places:
+        return places[query]
+    for path in places.values():
+        if path.rsplit("/", 1)[-1] == query:
+            return path
+    address = addresses.parse(query)
+    if address and addresses.block(query):
+        for path in places.values():
+            found = addresses.parse(path.rsplit("/", 1)[-1])
+            if found and found[:2] == address[:2]:
+                return path
+        return f"{map_contents}/{addresses.block_location(query)}"
+    street, _, avenue = query.partition(" & ")
+    if grid.street_index(street) is not None and grid.avenue_index(avenue) is not None:
+        return f"{map_contents}/intersections/{query}"
+    number_range, _, road = query.partition(" ")
+    if grid.street_index(road) is not None and _block_index(query, grid.street_block) is not None:
+        return f"{map_contents}/horizontals/{road} blocks/{query}"
+    if grid.avenue_index(road) is not None and _block_index(query, grid.avenue_block) is not None:
+        return f"{map_contents}/verticals/{road} blocks/{query}"
+    return query.strip("/") or None
@@ -0,0 +1,184 @@
+import bisect
+import hashlib
+import json
+import os
+import re
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set
+
+from address_index import AddressIndex
+from build_plan import MKDIR, FILE, Operation
+
+SEARCH_INDEX_NAME = ".search index.json"
+SEARCH_INDEX_VERSION = 1
+ROAD_SUFFIX = " blocks"
+
+WORD = re.compile(r"[^\W_]+")
+
+
+def words(name: str) -> List[str]:
+    """
+    The search terms of a name: its lowercase words and numbers, with a plural "s"
+    dropped so "forks" finds "fork" ("popsicle_stick_003" -> popsicle, stick, 003).
+    """
+    terms = []
+    for word in WORD.findall(name.lower()):
+        if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+            word = word[:-1]
+        terms.append(word)
+    return terms
+
+
+def source_paths(root: str, operations: Iterable[Operation]) -> List[str]:
+    """
+    The root, and every folder and file the operations make under it, folders in
+    between included (the plan leaves most of them to the compiler). Links aren't
+    things to find, so they are left out.
+    """
+    paths = {root}
+    for op in operations:
+        if op.kind not in (MKDIR, FILE) or not op.path.startswith(root + "/"):
+            continue
+        path = op.path
+        while path != root and path not in paths:
+            paths.add(path)
+            path = path.rpartition("/")[0]
+    return sorted(paths)
+
+
+class Match(NamedTuple):
+    path: str   # what was found, relative to the base path
+    place: str  # the location, block or welcome center it's in, where a route can go
+
+
+class SearchIndex:
+    """
+    Finds objects, markers, locations and roads by the words in their names.
+
+    Everything indexed comes in sources (the welcome center, a location, a road, a
+    building people made), each a list of paths and the place they are in. An
+    inverted index maps every term to the paths whose name has it, and the sorted
+    list of terms stands in for a prefix trie: all the terms starting with a prefix
+    are one run of it, found with two bisects. The index is kept in the map
+    contents, and a rebuild only re-indexes the sources whose paths changed.
+    Blocks aren't indexed one by one (a big grid has millions); a number in a query
+    turns a matching road into the block with that address.
+    """
+
+    def __init__(self, map_contents=None):
+        self.cache_path = os.path.join(os.fspath(map_contents), SEARCH_INDEX_NAME) if map_contents is not None else None
+        # source -> [fingerprint, place, [paths]]
+        self.sources: Dict[str, list] = {}
+        self.places: Dict[str, str] = {}  # path -> its place
+        self.terms: Dict[str, Set[str]] = {}
+        self._vocabulary: Optional[List[str]] = None  # sorted terms, made again after changes
+        self.counts = {"indexed": 0, "unchanged": 0, "removed": 0}
+
+    # --- The cache ---
+    def load(self) -> "SearchIndex":
+        """Pick up the index of an earlier build, if it is there."""
+        try:
+            with open(self.cache_path, encoding="utf-8") as f:
+                cache = json.load(f)
+        except (OSError, TypeError, ValueError):
+            return self
+        if cache.get("version") != SEARCH_INDEX_VERSION:
+            return self
+        self.sources = cache["sources"]
+        paths = []
+        for _, place, source_paths in self.sources.values():
+            for path in source_paths:
+                self.places[path] = place
+                paths.append(path)
+        self.terms = {term: {paths[i] for i in ids} for term, ids in cache["terms"].items()}
+        return self
+
+    def save(self):
+        # Paths are stored once, the terms refer to them by their position
+        ids = {}
+        for _, _, paths in self.sources.values():
+            for path in paths:
+                ids[path] = len(ids)
+        terms = {term: sorted(ids[path] for path in paths) for term, paths in self.terms.items()}
+        temporary_path = self.cache_path + ".tmp"
+        with open(temporary_path, "w", encoding="utf-8") as f:
+            json.dump({"version": SEARCH_INDEX_VERSION, "sources": self.sources, "terms": terms},
+                      f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(temporary_path, self.cache_path)
+
+    # --- Indexing ---
+    def update(self, source: str, place: str, paths: List[str]) -> bool:
+        """Index a source's paths, unless they are the same as last time. Returns whether anything changed."""
+        fingerprint = hashlib.sha1("\n".join([place] + paths).encode("utf-8")).hexdigest()
+        old = self.sources.get(source)
+        if old is not None and old[0] == fingerprint:
+            self.counts["unchanged"] += 1
+            return False
+        if old is not None:
+            self._remove(old[2])
+        for path in paths:
+            self.places[path] = place
+            for term in words(path.rpartition("/")[2]):
+                self.terms.setdefault(term, set()).add(path)
+        self.sources[source] = [fingerprint, place, paths]
+        self._vocabulary = None
+        self.counts["indexed"] += 1
+        return True
+
+    def prune(self, keep: Iterable[str]):
+        """Forget every source that isn't in keep, like locations taken out of the city."""
+        keep = set(keep)
+        for source in [source for source in self.sources if source not in keep]:
+            self._remove(self.sources.pop(source)[2])
+            self.counts["removed"] += 1
+        self._vocabulary = None
+
+    def _remove(self, paths: List[str]):
+        for path in paths:
+            self.places.pop(path, None)
+            for term in words(path.rpartition("/")[2]):
+                found = self.terms.get(term)
+                if found is not None:
+                    found.discard(path)
+                    if not found:
+                        del self.terms[term]
+
+    # --- Searching ---
+    def prefixed(self, prefix: str) -> List[str]:
+        """Every term starting with prefix."""
+        if self._vocabulary is None:
+            self._vocabulary = sorted(self.terms)
+        start = bisect.bisect_left(self._vocabulary, prefix)
+        end = bisect.bisect_left(self._vocabulary, prefix + "\U0010ffff")
+        return self._vocabulary[start:end]
+
+    def search(self, query: str, addresses: AddressIndex = None) -> List[Match]:
+        """
+        Everything whose name has a word starting with each word of the query, best
+        first: whole-word matches before prefix matches, then shallower paths. With
+        an AddressIndex, a number in the query picks the block of a matching road.
+        """
+        query_terms = words(query)
+        numbers = [term for term in query_terms if term.isdigit()]
+        found: Optional[Set[str]] = None
+        for term in query_terms:
+            paths = set().union(*(self.terms[match] for match in self.prefixed(term)))
+            if term in numbers and addresses is not None and not paths:
+                continue  # the address number of a block, looked at below
+            found = paths if found is None else found & paths
+        found = found or set()
+
+        def rank(path):
+            name = set(words(path.rpartition("/")[2]))
+            return -sum(term in name for term in query_terms), path.count("/"), path
+
+        matches = []
+        for path in sorted(found, key=rank):
+            if addresses is not None and path.endswith(ROAD_SUFFIX):
+                road = path.rpartition("/")[2][:-len(ROAD_SUFFIX)]
+                blocks = [addresses.block_location(f"{number} {road}") for number in numbers]
+                blocks = [f"{path.rpartition('/')[0].rpartition('/')[0]}/{block}" for block in blocks if block]
+                matches.extend(Match(block, block) for block in blocks)
+                if blocks:
+                    continue
+            matches.append(Match(path, self.places[path]))
+        return matches
@@ -0,0 +1,259 @@
+import asyncio
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from build_plan import KITCHEN_DISHES, DISHWASHER, WELCOME_CENTER_DIR, dish_name, object_rng
+from materializer import DEFAULT_THREADS, DEFAULT_BATCH_SIZE, O_DIRECTORY
+
+SIMULATION_STATE_NAME = ".simulation.json"
+SIMULATION_VERSION = 1
+
+DISH_USE_CHANCE = 0.05  # a clean dish is used in a tick and goes in the dishwasher
+DISHWASHER_EVERY = 12   # ticks between runs of the dishwasher, which puts every dish back
+DEFAULT_TICK_SECONDS = 1.0
+
+NOWHERE = -1  # the spot of something that isn't there at all (sold, thrown out)
+
+# renameat/openat/unlinkat aren't available everywhere, e.g. on Windows
+USE_DIR_FD = {os.open, os.rename, os.unlink} <= os.supports_dir_fd
+
+
+class Tick(NamedTuple):
+    """What one tick changed."""
+    number: int
+    moved: int    # renamed from one spot to another, like a fork into the dishwasher
+    made: int     # created, like a restocked popsicle
+    removed: int  # unlinked, like a sold sandwich
+    missed: int   # someone got there first: the file was gone or already there
+    seconds: float
+
+
+class Simulation:
+    """
+    Brings the city to life in ticks: dishes are used and washed, stock is sold
+    and restocked, trash piles up until the garbage day.
+
+    Everything that changes is an entity with two spots, a folder or NOWHERE, and a
+    state saying which one it is in: a dish is on its shelf or in the dishwasher, a
+    popsicle is nowhere (sold) or in the freezer. The entities live in flat NumPy
+    arrays (the names once, spots as indexes into a short list of folders), so a
+    tick is a few vector operations over all of them: one random draw each, a
+    chance to go to the second spot or back, and everything whose turn it is
+    (cleared_every) sent back to the first. The diff of the old and new states is
+    all that reaches the disk, as renames, creates and unlinks grouped by their two
+    folders and run in batches on a thread pool from an asyncio event loop, each
+    batch through one directory fd per folder. The tree is only read once, at the
+    start, to find where everything is; the tick number is kept in the map contents,
+    so every tick's draws come from the city's seed.
+    """
+
+    def __init__(self, base_path, map_contents, seed: Optional[int],
+                 threads: int = DEFAULT_THREADS, batch_size: int = DEFAULT_BATCH_SIZE):
+        self.base_path = os.fspath(base_path)
+        self.state_path = os.path.join(os.fspath(map_contents), SIMULATION_STATE_NAME)
+        self.seed = seed
+        self.threads = threads
+        self.batch_size = batch_size
+        self.tick = 0
+        self.folders: List[str] = []  # relative to the base path
+        self._folder_ids: Dict[str, int] = {}
+        self.names: List[str] = []
+        # Filled in by add(), turned into arrays by load()
+        self._rows: List[Tuple[int, int, float, float, int]] = []
+        self.spots = np.empty((2, 0), dtype=np.int32)
+        self.appear = self.disappear = np.empty(0)
+        self.every = np.empty(0, dtype=np.int64)
+        self.state = np.empty(0, dtype=np.uint8)
+        self.lost = np.empty(0, dtype=bool)  # taken by someone, left alone
+        self.counts = {"moved": 0, "made": 0, "removed": 0, "missed": 0, "lost": 0}
+
+    def __len__(self):
+        return len(self.names)
+
+    # --- What lives in the city ---
+    def add(self, name: str, first: Optional[str], second: Optional[str],
+            appear: float = 0.0, disappear: float = 0.0, cleared_every: int = 0):
+        """
+        An entity called name, whose first and second spots are folders (or None
+        for nowhere). Every tick it goes to its second spot with the chance appear,
+        back to the first with the chance disappear, and every cleared_every ticks
+        it is put back in the first one.
+        """
+        self.names.append(name)
+        self._rows.append((self._folder(first), self._folder(second), appear, disappear, cleared_every))
+
+    def add_dishes(self):
+        """The welcome center's dishes, each between its clean spot and the dishwasher."""
+        for name, first, last, shelf in KITCHEN_DISHES:
+            for number in range(first, last + 1):
+                self.add(dish_name(name, number), f"{WELCOME_CENTER_DIR}/{shelf}", f"{WELCOME_CENTER_DIR}/{DISHWASHER}",
+                         appear=DISH_USE_CHANCE, cleared_every=DISHWASHER_EVERY)
+
+    def add_objects(self, building: str, objects: List[Dict]):
+        """
+        Every object a building could have whose spec says how it changes (appear,
+        disappear, cleared_every), all of its numbered candidates, whether the build
+        made them or not.
+        """
+        for obj in objects:
+            if not {"appear", "disappear", "cleared_every"} & obj.keys():
+                continue
+            folder, _, name = f"{building}/{obj['path']}".rpartition("/")
+            first, last = obj.get("min", 1), obj.get("max", obj.get("count", 1))
+            names = [f"{name}_{i:03}" for i in range(first, last + 1)] if last > 1 else [name]
+            for candidate in names:
+                self.add(candidate, None, folder, obj.get("appear", 0.0), obj.get("disappear", 0.0), obj.get("cleared_every", 0))
+
+    def paths(self) -> Iterator[str]:
+        """Every path an entity can be at."""
+        self._freeze()
+        for name, first, second in zip(self.names, *self.spots.tolist()):
+            for spot in (first, second):
+                if spot != NOWHERE:
+                    yield f"{self.folders[spot]}/{name}"
+
+    def _folder(self, folder: Optional[str]) -> int:
+        if folder is None:
+            return NOWHERE
+        if folder not in self._folder_ids:
+            self._folder_ids[folder] = len(self.folders)
+            self.folders.append(folder)
+        return self._folder_ids[folder]
+
+    def _freeze(self):
+        if not self._rows:
+            return
+        rows = np.array(self._rows, dtype=np.float64)
+        self.spots = np.concatenate([self.spots, rows[:, :2].T.astype(np.int32)], axis=1)
+        self.appear = np.concatenate([self.appear, rows[:, 2]])
+        self.disappear = np.concatenate([self.disappear, rows[:, 3]])
+        self.every = np.concatenate([self.every, rows[:, 4].astype(np.int64)])
+        self._rows = []
+
+    # --- Where everything is ---
+    def load(self) -> "Simulation":
+        """
+        Find where every entity is, listing each of their folders once, and pick up
+        the tick number of the last run. Entities with two folders found in neither
+        were taken by someone, and are left alone from now on.
+        """
+        self._freeze()
+        try:
+            with open(self.state_path, encoding="utf-8") as f:
+                saved = json.load(f)
+            if saved.get("version") == SIMULATION_VERSION:
+                self.tick = saved["tick"]
+        except (OSError, ValueError):
+            pass
+        listings = []
+        for folder in self.folders:
+            try:
+                listings.append(set(os.listdir(os.path.join(self.base_path, folder))))
+            except OSError:
+                listings.append(set())
+        found = np.zeros((2, len(self.names)), dtype=bool)
+        for side in (0, 1):
+            for i, (name, spot) in enumerate(zip(self.names, self.spots[side].tolist())):
+                found[side, i] = spot != NOWHERE and name in listings[spot]
+        # In the second spot only if it's there and not also in the first (a full rebuild puts things back)
+        self.state = (found[1] & ~found[0]).astype(np.uint8)
+        self.lost = (self.spots[0] != NOWHERE) & ~found[0] & ~found[1]
+        self.counts["lost"] = int(self.lost.sum())
+        return self
+
+    def save(self):
+        temporary_path = self.state_path + ".tmp"
+        with open(temporary_path, "w", encoding="utf-8") as f:
+            json.dump({"version": SIMULATION_VERSION, "tick": self.tick}, f)
+        os.replace(temporary_path, self.state_path)
+
+    # --- Ticks ---
+    def step(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Advance the state one tick. Returns the entities that changed, and the spots they go from and to."""
+        self.tick += 1
+        draws = object_rng(self.seed, f"tick {self.tick}").random(len(self.state))
+        state = self.state
+        new = np.where(state == 1, draws >= self.disappear, draws < self.appear).astype(np.uint8)
+        new[(self.every > 0) & (self.tick % np.maximum(self.every, 1) == 0)] = 0
+        new[self.lost] = state[self.lost]
+        changed = np.flatnonzero(new != state)
+        columns = np.arange(len(changed))
+        spots = self.spots[:, changed]
+        sources, destinations = spots[state[changed], columns], spots[new[changed], columns]
+        self.state = new
+        return changed, sources, destinations
+
+    async def advance(self, pool) -> Tick:
+        """One tick: work out what changes, then do it on the disk."""
+        start = time.perf_counter()
+        changed, sources, destinations = self.step()
+        # Group by the pair of folders, so each batch needs one fd for each
+        order = np.lexsort((destinations, sources))
+        changed, sources, destinations = changed[order], sources[order], destinations[order]
+        cuts = np.flatnonzero((np.diff(sources) != 0) | (np.diff(destinations) != 0)) + 1
+        batches = []
+        for group in np.split(np.arange(len(changed)), cuts):
+            if not len(group):
+                continue
+            source, destination = int(sources[group[0]]), int(destinations[group[0]])
+            for i in range(0, len(group), self.batch_size):
+                batches.append((source, destination, changed[group[i:i + self.batch_size]].tolist()))
+        loop = asyncio.get_running_loop()
+        missed = sum(await asyncio.gather(*(loop.run_in_executor(pool, self._apply_batch, *batch) for batch in batches)))
+        made = int((sources == NOWHERE).sum())
+        removed = int((destinations == NOWHERE).sum())
+        tick = Tick(self.tick, len(changed) - made - removed, made, removed, missed, time.perf_counter() - start)
+        for key in ("moved", "made", "removed", "missed"):
+            self.counts[key] += getattr(tick, key)
+        return tick
+
+    async def run(self, ticks: int = 0, interval: float = DEFAULT_TICK_SECONDS, report: Callable[[Tick], object] = None):
+        """Run ticks (forever with 0), one every interval seconds, saving the tick number after each."""
+        loop = asyncio.get_running_loop()
+        with ThreadPoolExecutor(max_workers=max(self.threads, 1)) as pool:
+            count = 0
+            while not ticks or count < ticks:
+                started = loop.time()
+                tick = await self.advance(pool)
+                self.save()
+                if report:
+                    report(tick)
+                count += 1
+                if interval and (not ticks or count < ticks):
+                    await asyncio.sleep(max(0.0, started + interval - loop.time()))
+
+    def _apply_batch(self, source: int, destination: int, entities: List[int]) -> int:
+        """Move, make or remove some entities that share their two folders. Returns how many were missed."""
+        source_path = os.path.join(self.base_path, self.folders[source]) if source != NOWHERE else None
+        destination_path = os.path.join(self.base_path, self.folders[destination]) if destination != NOWHERE else None
+        if destination_path is not None:
+            os.makedirs(destination_path, exist_ok=True)  # the build only makes folders something was put in
+        source_fd = destination_fd = None
+        if USE_DIR_FD:
+            source_fd = os.open(source_path, os.O_RDONLY | O_DIRECTORY) if source_path else None
+            destination_fd = os.open(destination_path, os.O_RDONLY | O_DIRECTORY) if destination_path else None
+        missed = 0
+        try:
+            for entity in entities:
+                name = self.names[entity]
+                source_name = name if USE_DIR_FD else os.path.join(source_path or "", name)
+                destination_name = name if USE_DIR_FD else os.path.join(destination_path or "", name)
+                try:
+                    if source_path is None:
+                        os.close(os.open(destination_name, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666, dir_fd=destination_fd))
+                    elif destination_path is None:
+                        os.unlink(source_name, dir_fd=source_fd)
+                    else:
+                        os.rename(source_name, destination_name, src_dir_fd=source_fd, dst_dir_fd=destination_fd)
+                except (FileNotFoundError, FileExistsError):
+                    missed += 1
+        finally:
+            for fd in (source_fd, destination_fd):
+                if fd is not None:
+                    os.close(fd)
+        return missed
@@ -0,0 +1,246 @@
+import cmd
+import os
+from abc import ABC, abstractmethod
+import posixpath
+from typing import Dict, Iterable, List, NamedTuple, Optional
+
+from build_plan import Operation, PlanCompiler, MKDIR, FILE, SYMLINK, WELCOME_CENTER_DIR
+from city_model import CityModel
+from grid import Grid
+
+# Directories with more entries than this are listed fresh each time instead of cached
+MAX_CACHED_LISTING = 1000
+
+
+class Entry(NamedTuple):
+    kind: str         # MKDIR, FILE or SYMLINK
+    target: str = ""  # where a symlink leads, relative to the base path
+
+
+class CityView(ABC):
+    """Lookups shared by every view of a city; subclasses provide listdir()."""
+
+    @abstractmethod
+    def listdir(self, path: str) -> Optional[Dict[str, Entry]]:
+        """The entries of a directory by name, or None if it isn't one."""
+
+    def entry(self, path: str) -> Optional[Entry]:
+        if path == "":
+            return Entry(MKDIR)
+        parent, name = posixpath.split(path)
+        entries = self.listdir(parent)
+        return entries.get(name) if entries else None
+
+    def resolve(self, path: str) -> Optional[str]:
+        """Follow symlinks along a path to the directory or file it ends at."""
+        resolved = ""
+        for part in path.split("/"):
+            if part in ("", "."):
+                continue
+            if part == "..":
+                resolved = posixpath.dirname(resolved)
+                continue
+            current = posixpath.join(resolved, part) if resolved else part
+            entry = self.entry(current)
+            if entry is None:
+                return None
+            resolved = entry.target if entry.kind == SYMLINK else current
+        return resolved
+
+
+class VirtualCity(CityView):
+    """
+    The city as an object model instead of folders on disk.
+
+    The grid's directories are worked out from their path when someone visits them,
+    through the city's CityModel, so the size of the city doesn't matter, only what has been looked at. The
+    welcome center and the locations are small, so their operations are kept as is,
+    once the first listing needs them (drawing their objects loads NumPy).
+    Symlinks are edges to other paths.
+    """
+
+    def __init__(self, map_contents: str, grid: Grid, extra_operations: Iterable[Operation]):
+        self.map_contents = map_contents
+        self.grid = grid
+        self.model = CityModel(map_contents, grid)
+        self.visited: Dict[str, Dict[str, Entry]] = {}
+        self._extra_operations = extra_operations
+        self._extras: Optional[Dict[str, Dict[str, Entry]]] = None
+
+    @property
+    def extras(self) -> Dict[str, Dict[str, Entry]]:
+        """The entries of the welcome center and the locations, by directory."""
+        if self._extras is None:
+            self._extras = {}
+            for op in PlanCompiler().compile(self._extra_operations):
+                parent, name = posixpath.split(op.path)
+                self._extras.setdefault(parent, {})[name] = Entry(op.kind, op.target)
+            self._extra_operations = None
+        return self._extras
+
+    # --- Lookups ---
+    def listdir(self, path: str) -> Optional[Dict[str, Entry]]:
+        """The entries of a directory, or None if there is no such directory."""
+        if path in self.visited:
+            return self.visited[path]
+        entries = self._grid_entries(path)
+        extras = self.extras.get(path)
+        if entries is None and extras is None and path != "":
+            return None
+        entries = dict(entries or {})
+        entries.update(extras or {})
+        if len(entries) <= MAX_CACHED_LISTING:
+            self.visited[path] = entries
+        return entries
+
+    # --- The grid, worked out from paths ---
+    def _grid_entries(self, path: str) -> Optional[Dict[str, Entry]]:
+        if path == self.map_contents:
+            return {name: Entry(MKDIR) for name in ("horizontals", "verticals", "intersections")}
+        prefix = self.map_contents + "/"
+        if not path.startswith(prefix):
+            return None
+        parts = path[len(prefix):].split("/")
+        model = self.model
+        if parts == ["horizontals"]:
+            return {f"{name} blocks": Entry(MKDIR) for name in model.streets}
+        if parts == ["verticals"]:
+            return {f"{name} blocks": Entry(MKDIR) for name in model.avenues}
+        if parts == ["intersections"]:
+            return {f"{street} & {avenue}": Entry(MKDIR) for street in model.streets for avenue in model.avenues}
+        if len(parts) == 2 and parts[1].endswith(" blocks"):
+            road = parts[1][:-len(" blocks")]
+            if parts[0] == "horizontals" and model.street_index(road) is not None:
+                return {f"{number} {road}": Entry(MKDIR) for number in model.street_numbers}
+            if parts[0] == "verticals" and model.avenue_index(road) is not None:
+                return {f"{number} {road}": Entry(MKDIR) for number in model.avenue_numbers}
+        node = model.node(path)
+        if node is None:
+            return None
+        entries = {f"[ {model.name(node)} ]": Entry(FILE)}
+        entries.update((name, Entry(SYMLINK, model.path(neighbor))) for name, neighbor in model.links(node))
+        return entries
+
+
+class DiskCity(CityView):
+    """The same lookups as VirtualCity, answered by scanning a city that was built on disk."""
+
+    def __init__(self, base_path):
+        self.base_path = os.path.realpath(base_path)
+        self.visited: Dict[str, Dict[str, Entry]] = {}
+
+    def listdir(self, path: str) -> Optional[Dict[str, Entry]]:
+        if path in self.visited:
+            return self.visited[path]
+        directory = os.path.join(self.base_path, path)
+        entries = {}
+        try:
+            with os.scandir(directory) as scan:
+                for item in scan:
+                    if item.is_symlink():
+                        entries[item.name] = Entry(SYMLINK, self._link_target(directory, item.path))
+                    elif item.is_dir():
+                        entries[item.name] = Entry(MKDIR)
+                    else:
+                        entries[item.name] = Entry(FILE)
+        except (FileNotFoundError, NotADirectoryError):
+            return None
+        if len(entries) <= MAX_CACHED_LISTING:
+            self.visited[path] = entries
+        return entries
+
+    def _link_target(self, directory: str, link: str) -> str:
+        """Where a link leads, relative to the base path, whether it was made absolute or relative."""
+        target = os.path.normpath(os.path.join(directory, os.readlink(link)))
+        relative = os.path.relpath(target, self.base_path)
+        return "" if relative == "." else relative.replace(os.sep, "/")
+
+
+class CityShell(cmd.Cmd):
+    """Walk around a virtual city with cd, ls and look."""
+
+    intro = "welcome to folder city. type help for commands, look to look around."
+
+    def __init__(self, city: VirtualCity, start: str = WELCOME_CENTER_DIR):
+        super().__init__()
+        self.city = city
+        self.cwd = start
+        self.history: List[str] = []
+
+    @property
+    def prompt(self):
+        return f"({posixpath.basename(self.cwd) or '/'}) "
+
+    def _match(self, name: str) -> Optional[str]:
+        """Find an entry by exact name, or by a unique part of it ("east", "front door")."""
+        entries = self.city.listdir(self.cwd) or {}
+        if name in entries:
+            return name
+        matches = [entry for entry in entries if name.lower() in entry.lower()]
+        return matches[0] if len(matches) == 1 else None
+
+    def do_cd(self, arg):
+        """cd NAME: go into a folder or follow a link. cd .. goes back out, cd - goes back to where you were."""
+        arg = arg.strip()
+        if arg == "-":
+            if self.history:
+                self.cwd = self.history.pop()
+            return
+        if arg in ("", "/"):
+            target = ""
+        elif arg == "..":
+            target = posixpath.dirname(self.cwd)
+        else:
+            name = self._match(arg)
+            if name is None:
+                print(f"no way to {arg!r} from here")
+                return
+            target = self.city.resolve(posixpath.join(self.cwd, name) if self.cwd else name)
+        entry = self.city.entry(target) if target is not None else None
+        if entry is None or entry.kind != MKDIR:
+            print(f"{arg!r} is not somewhere you can go")
+            return
+        self.history.append(self.cwd)
+        self.cwd = target
+
+    def complete_cd(self, text, line, begidx, endidx):
+        entries = self.city.listdir(self.cwd) or {}
+        typed = line.partition(" ")[2]
+        return [name[len(typed) - len(text):] for name, entry in entries.items()
+                if name.startswith(typed) and entry.kind != FILE]
+
+    def do_ls(self, arg):
+        """ls: list what is here."""
+        entries = self.city.listdir(self.cwd) or {}
+        shown = sorted(entries)[:MAX_CACHED_LISTING]
+        for name in shown:
+            suffix = "/" if entries[name].kind == MKDIR else " →" if entries[name].kind == SYMLINK else ""
+            print(f"{name}{suffix}")
+        if len(entries) > len(shown):
+            print(f"... and {len(entries) - len(shown)} more")
+
+    def do_look(self, arg):
+        """look: describe where you are, the ways out and what you can see."""
+        entries = self.city.listdir(self.cwd) or {}
+        markers = [name for name in entries if name.startswith("[ ")]
+        print(markers[0] if markers else posixpath.basename(self.cwd) or "folder city")
+        exits = sorted(name for name, entry in entries.items() if entry.kind == SYMLINK)
+        places = sorted(name for name, entry in entries.items() if entry.kind == MKDIR)
+        things = sorted(name for name, entry in entries.items() if entry.kind == FILE and name not in markers)
+        if exits:
+            print("ways out: " + ", ".join(exits))
+        if places:
+            print("you could go into: " + ", ".join(places[:20]) + (" ..." if len(places) > 20 else ""))
+        if things:
+            print("you see: " + ", ".join(things[:20]) + (" ..." if len(things) > 20 else ""))
+
+    def do_pwd(self, arg):
+        """pwd: show where you are."""
+        print("/" + self.cwd)
+
+    def do_quit(self, arg):
+        """quit: leave the city."""
+        return True
+
+    do_exit = do_quit
+    do_EOF = do_quit
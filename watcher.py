@@ -0,0 +1,184 @@
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+import sys
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Set
+
+# From <sys/inotify.h>
+IN_ATTRIB = 0x00000004
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_CLOEXEC = 0o2000000
+IN_NONBLOCK = 0o4000
+WATCH_MASK = IN_CREATE | IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO | IN_ATTRIB | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR
+EVENT_HEADER = struct.Struct("iIII")  # wd, mask, cookie, length of the name that follows
+
+DEBOUNCE = 0.05     # seconds of quiet before a burst of changes is handled
+MAX_DELAY = 0.3     # never hold a burst back longer than this, so the map keeps up with a long copy
+POLL_INTERVAL = 1.0
+
+
+class Inotify:
+    """
+    Directory watches through Linux inotify, called with ctypes so there is nothing
+    to install. Waiting for events blocks in select(), so an idle watch uses no CPU.
+    """
+
+    def __init__(self):
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self._add_watch = libc.inotify_add_watch
+        self._add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), os.strerror(ctypes.get_errno()))
+        self.paths: Dict[int, str] = {}
+
+    def add(self, path: str):
+        """Watch a directory for entries being added, removed or renamed. Raises OSError (ENOSPC when out of watches)."""
+        wd = self._add_watch(self.fd, os.fsencode(path), WATCH_MASK)
+        if wd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error), path)
+        self.paths[wd] = path
+
+    def wait(self, timeout: Optional[float]) -> Optional[Set[str]]:
+        """
+        The directories that changed, waiting up to timeout seconds for the first change
+        (an empty set if none came), or None if the kernel dropped events and
+        everything has to be looked at again.
+        """
+        if not select.select([self.fd], [], [], timeout)[0]:
+            return set()
+        changed: Set[str] = set()
+        try:
+            data = os.read(self.fd, 1 << 16)
+        except BlockingIOError:
+            return changed
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            name = data[offset + EVENT_HEADER.size:offset + EVENT_HEADER.size + length].rstrip(b"\0")
+            offset += EVENT_HEADER.size + length
+            if mask & IN_Q_OVERFLOW:
+                return None
+            path = self.paths.get(wd)
+            if mask & IN_IGNORED:
+                self.paths.pop(wd, None)
+            elif path is not None:
+                # A new folder shows up as a change of its parent; the caller watches it from there
+                changed.add(path)
+                if mask & IN_ISDIR and mask & (IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE) and name:
+                    changed.add(os.path.join(path, os.fsdecode(name)))
+        return changed
+
+    def close(self):
+        os.close(self.fd)
+
+
+class Poller:
+    """The same interface as Inotify for systems without it: stats every watched directory each interval."""
+
+    def __init__(self, interval: float = POLL_INTERVAL):
+        self.interval = interval
+        self.keys: Dict[str, Optional[tuple]] = {}
+
+    @staticmethod
+    def _key(path: str) -> Optional[tuple]:
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return st.st_ino, st.st_mtime_ns
+
+    def add(self, path: str):
+        self.keys[path] = self._key(path)
+
+    def wait(self, timeout: Optional[float]) -> Optional[Set[str]]:
+        time.sleep(self.interval if timeout is None else min(timeout, self.interval))
+        changed = set()
+        for path, key in list(self.keys.items()):
+            new_key = self._key(path)
+            if new_key != key:
+                changed.add(path)
+                if new_key is None:
+                    del self.keys[path]
+                else:
+                    self.keys[path] = new_key
+        return changed
+
+    def close(self):
+        pass
+
+
+def open_watcher(paths: Iterable[str], polling: bool = False):
+    """
+    An Inotify watching every path, or a Poller when inotify isn't there (not Linux)
+    or runs out of watches (fs.inotify.max_user_watches).
+    """
+    paths = list(paths)
+    if not polling and sys.platform.startswith("linux"):
+        try:
+            watcher = Inotify()
+        except (OSError, AttributeError):
+            watcher = None
+        if watcher is not None:
+            try:
+                for path in paths:
+                    try:
+                        watcher.add(path)
+                    except FileNotFoundError:
+                        pass
+                return watcher
+            except OSError as error:
+                watcher.close()
+                if error.errno not in (errno.ENOSPC, errno.EMFILE):
+                    raise
+                print(f"not enough inotify watches for {len(paths)} folders, polling instead "
+                      f"(raise fs.inotify.max_user_watches to fix)", file=sys.stderr)
+    watcher = Poller()
+    for path in paths:
+        watcher.add(path)
+    return watcher
+
+
+def watch(watcher, on_change: Callable[[Optional[Set[str]]], None],
+          debounce: float = DEBOUNCE, max_delay: float = MAX_DELAY):
+    """
+    Call on_change with the set of directories that changed, or None after events
+    were lost, once each burst of changes has settled: after debounce seconds without
+    new events, or max_delay seconds after the first one. Runs until interrupted.
+    """
+    while True:
+        changed = watcher.wait(None)
+        if changed is not None and not changed:
+            continue
+        first = time.monotonic()
+        while True:
+            left = max_delay - (time.monotonic() - first)
+            if left <= 0:
+                break
+            more = watcher.wait(min(debounce, left))
+            if more is not None and not more:
+                break
+            changed = None if changed is None or more is None else changed | more
+        on_change(changed)
+
+
+def subdirectories(path: str) -> List[str]:
+    try:
+        with os.scandir(path) as entries:
+            return [entry.path for entry in entries if entry.is_dir(follow_symlinks=False)]
+    except OSError:
+        return []